@@ -0,0 +1,82 @@
+"""Costo per campione della correzione drift al crescere del numero di tracker.
+
+Confronta il percorso scalare storico (liste Python, un messaggio alla volta)
+con DriftEngine.correct_many() che corregge un intero tick in un colpo solo.
+
+Uso: python benchmarks/bench_drift_engine.py --trackers 6 30 60
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drift_engine import DriftEngine
+
+
+def scalar_correction(state, tracker_id, current_data, threshold=5.0, coefficient=0.85):
+    """Implementazione originale di AntiDriftBridge.apply_drift_correction"""
+    if tracker_id not in state:
+        state[tracker_id] = current_data
+        return current_data
+    drift = [abs(c - l) for c, l in zip(current_data, state[tracker_id])]
+    if max(drift) > threshold:
+        corrected = []
+        for i in range(len(current_data)):
+            corrected.append(coefficient * current_data[i] + (1 - coefficient) * state[tracker_id][i])
+        current_data = corrected
+    state[tracker_id] = current_data
+    return current_data
+
+
+def run(trackers, ticks, width):
+    rng = np.random.default_rng(0)
+    data = rng.normal(scale=4.0, size=(ticks, trackers, width)).cumsum(axis=0)
+    ids = [str(i) for i in range(trackers)]
+    rows = data.tolist()
+
+    state = {}
+    expected = []
+    start = time.perf_counter()
+    for tick in rows:
+        for tracker_id, sample in zip(ids, tick):
+            expected.append(scalar_correction(state, tracker_id, sample))
+    scalar = time.perf_counter() - start
+
+    engine = DriftEngine()
+    start = time.perf_counter()
+    for tick in data:
+        for tracker_id, sample in zip(ids, tick):
+            engine.correct(tracker_id, sample)
+    single = time.perf_counter() - start
+
+    engine = DriftEngine()
+    got = []
+    start = time.perf_counter()
+    for tick in data:
+        got.append(engine.correct_many(ids, tick))
+    batch = time.perf_counter() - start
+
+    assert np.allclose(np.concatenate(got), np.array(expected)), "risultati diversi dal percorso scalare"
+    samples = trackers * ticks
+    return scalar / samples * 1e6, single / samples * 1e6, batch / samples * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trackers", type=int, nargs="+", default=[6, 30, 60])
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'tracker':>8} {'scalare':>12} {'correct()':>12} {'correct_many()':>15}   (us/campione)")
+    for trackers in args.trackers:
+        scalar, single, batch = run(trackers, args.ticks, args.width)
+        print(f"{trackers:>8} {scalar:>12.2f} {single:>12.2f} {batch:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Costo per pacchetto del rilevamento drift a finestra al crescere della finestra.
+
+Per ogni lunghezza (0 = salto tra campioni consecutivi) misura
+DriftEngine.correct() un messaggio alla volta e correct_many() su un tick
+con tutti i tracker: con le statistiche mobili il costo non deve crescere
+con la finestra. Poi conta le correzioni su due flussi sintetici, una
+deriva lenta e un segnale fermo con picchi isolati, per mostrare cosa
+rileva ciascuna modalità.
+
+Uso: python benchmarks/bench_drift_window.py --windows 0 8 64 512 4096
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drift_engine import DriftEngine  # noqa: E402
+
+
+def bench(window, trackers, messages):
+    engine = DriftEngine(window=window)
+    ids = [str(i) for i in range(trackers)]
+    rng = np.random.default_rng(0)
+    samples = rng.normal(scale=0.5, size=(messages, 3)).cumsum(axis=0).tolist()
+
+    start = time.perf_counter()
+    for i, sample in enumerate(samples):
+        engine.correct(ids[i % trackers], sample)
+    single = (time.perf_counter() - start) / messages
+
+    ticks = [samples[i:i + trackers] for i in range(0, messages - trackers + 1, trackers)]
+    start = time.perf_counter()
+    for tick in ticks:
+        engine.correct_many(ids, tick)
+    batched = (time.perf_counter() - start) / (len(ticks) * trackers)
+    return single * 1e6, batched * 1e6
+
+
+def detections(window, threshold, length=2000):
+    """Correzioni su una deriva lenta e su un segnale fermo con picchi"""
+    rng = np.random.default_rng(1)
+    noise = rng.normal(scale=0.3, size=(length, 3))
+    slow = noise + np.arange(length)[:, None] * 0.05
+    spikes = noise.copy()
+    spikes[::100] += 8.0
+    counts = []
+    for stream in (slow, spikes):
+        engine = DriftEngine(drift_threshold=threshold, window=window)
+        for sample in stream.tolist():
+            engine.correct("1", sample)
+        counts.append(sum(engine.trigger_counts().values()))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 8, 64, 512, 4096])
+    parser.add_argument("--trackers", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--threshold", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'finestra':>8}  {'correct() µs':>12}  {'correct_many() µs':>17}  "
+          f"{'deriva lenta':>12}  {'picchi':>6}")
+    for window in args.windows:
+        single, batched = bench(window, args.trackers, args.messages)
+        slow, spikes = detections(window, args.threshold)
+        print(f"{window:>8}  {single:>12.1f}  {batched:>17.2f}  {slow:>12}  {spikes:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Benchmark end-to-end del bridge e del tracking da webcam, con risultati in JSON.
+
+Percorso OSC: il bridge gira in un processo figlio cablato come in main.py
+(dispatcher su /tracker/*, server di ingresso, uscita OSC) e invia a un sink
+UDP locale al posto del router di SlimeVR. Il processo principale simula
+owoTracker: N tracker x frequenza x numero di valori per messaggio. Il primo
+valore di ogni messaggio è un numero di sequenza, così il sink misura la
+latenza ingresso-uscita di ogni messaggio e quelli persi.
+
+Percorso webcam: CameraTracker legge un file video al ritmo del file, in
+loop, e invia al sink in bundle; la latenza è misurata dal timetag del
+bundle (momento di acquisizione del frame) alla ricezione.
+
+Uso:
+  python benchmarks/bench_e2e.py --trackers 6 12 --rate 120 --duration 10 --json risultati.json
+  python benchmarks/bench_e2e.py --video registrazione.mp4 --duration 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pythonosc import dispatcher, osc_packet
+from osc_bridge import AntiDriftBridge
+from osc_ingest import INGEST_MODES, create_ingest_server
+from osc_output import OUTPUT_MODES, OSCEncoder, OSCOutput
+
+
+def _run_bridge(ingest, output, output_rate, sink_port, ready, stop, result):
+    """Processo del bridge, cablato come in main.py"""
+    bridge = AntiDriftBridge(output=OSCOutput("127.0.0.1", sink_port, bundles=output == "bundle"),
+                             output_rate=output_rate)
+    # Soglia altissima: i valori passano invariati e il primo resta il numero di sequenza
+    bridge.set_parameters(drift_threshold=1e12)
+    bridge.calibrate()
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data)
+    server = create_ingest_server(ingest, ("127.0.0.1", 0), disp,
+                                  on_batch_start=bridge.begin_tick, on_batch_end=bridge.end_tick)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    if hasattr(server, "wait_ready"):
+        server.wait_ready()
+    ready.send(server.server_address[1])
+    cpu_start = time.process_time()
+    stop.wait()
+    result.send(time.process_time() - cpu_start)
+    server.shutdown()
+
+
+class Sink:
+    """Sink UDP al posto del router di SlimeVR: salva i datagrammi e li decodifica alla fine"""
+
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(0.5)
+        self.port = self.socket.getsockname()[1]
+        self.datagrams = []
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while self.running:
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            self.datagrams.append((time.perf_counter(), time.time(), data))
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.socket.close()
+
+    def messages(self):
+        """(perf_counter, time, timetag, messaggio) per ogni messaggio ricevuto"""
+        for perf, wall, data in self.datagrams:
+            for timed_msg in osc_packet.OscPacket(data).messages:
+                yield perf, wall, timed_msg.time, timed_msg.message
+
+
+def _percentiles(values):
+    values = sorted(values)
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+    return {"p50_ms": percentile(0.50), "p99_ms": percentile(0.99), "p999_ms": percentile(0.999)}
+
+
+def run_bridge(ingest, output, output_rate, trackers, rate, payload, duration):
+    """Un'esecuzione del percorso OSC; restituisce un dizionario di risultati"""
+    sink = Sink()
+    ready_recv, ready_send = multiprocessing.Pipe(False)
+    result_recv, result_send = multiprocessing.Pipe(False)
+    stop = multiprocessing.Event()
+    proc = multiprocessing.Process(target=_run_bridge,
+                                   args=(ingest, output, output_rate, sink.port, ready_send, stop, result_send))
+    proc.start()
+    target = ("127.0.0.1", ready_recv.recv())
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    encoder = OSCEncoder()
+    entries = [encoder.tracker_message(str(tracker), payload) for tracker in range(trackers)]
+    values = [0.0] * payload
+    sent = []
+    interval = 1.0 / rate
+    seq = 0
+    start = time.perf_counter()
+    next_send = start
+    while next_send - start < duration:
+        # Un messaggio per tracker a ogni periodo, come owoTracker
+        for entry in entries:
+            values[0] = float(seq)
+            length = encoder.pack_message(entry, values)
+            sent.append(time.perf_counter())
+            sender.sendto(encoder.buffer[:length], target)
+            seq += 1
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - start
+
+    time.sleep(0.5)
+    stop.set()
+    cpu = result_recv.recv()
+    proc.join()
+    sink.stop()
+    sender.close()
+
+    received = {}
+    for perf, _, _, message in sink.messages():
+        received.setdefault(int(message.params[0]), perf)
+    latencies = [(perf - sent[s]) * 1000.0 for s, perf in received.items() if s < len(sent)]
+    result = {
+        "path": "osc",
+        "ingest": ingest,
+        "output": output,
+        "output_rate": output_rate,
+        "trackers": trackers,
+        "rate_hz": rate,
+        "payload": payload,
+        "duration_s": elapsed,
+        "sent": len(sent),
+        "received": len(received),
+        "datagrams": len(sink.datagrams),
+        "offered_msg_s": len(sent) / elapsed,
+        "sustained_msg_s": len(received) / elapsed,
+        "drop_rate": 1.0 - len(received) / len(sent) if sent else 0.0,
+        "bridge_cpu_pct": 100.0 * cpu / elapsed,
+    }
+    result.update(_percentiles(latencies))
+    return result
+
+
+def run_camera(video, duration, pipelined, model_complexity, adaptive):
+    """Percorso webcam da file video; restituisce un dizionario di risultati"""
+    from camera_tracking import CameraTracker
+
+    tracker = CameraTracker(output_bundles=True, capture_settings={"pace": True, "loop": True},
+                            pipelined=pipelined, model_complexity=model_complexity, adaptive=adaptive)
+    sink = Sink()
+    tracker.client = OSCOutput("127.0.0.1", sink.port, bundles=True)
+    if not tracker.start_camera(video):
+        sink.stop()
+        raise SystemExit(f"Impossibile aprire il video {video}")
+    time.sleep(duration)
+    stats = tracker.get_stats()
+    tracker.stop_camera()
+    time.sleep(0.2)
+    sink.stop()
+
+    # Latenza dall'acquisizione del frame (timetag del bundle) alla ricezione
+    latencies = {}
+    for _, wall, timetag, _ in sink.messages():
+        if timetag:
+            latencies.setdefault(timetag, (wall - timetag) * 1000.0)
+    result = {
+        "path": "camera",
+        "video": video,
+        "pipelined": pipelined,
+        "adaptive": adaptive,
+        "model_complexity": model_complexity,
+        "duration_s": duration,
+        "frames_captured": stats["frames_captured"],
+        "frames_processed": stats["frames_processed"],
+        "frames_dropped": stats["frames_dropped"],
+        "processed_fps": stats["frames_processed"] / duration,
+        "frames_sent": len(latencies),
+        "drop_rate": (stats["frames_dropped"] / stats["frames_captured"]
+                      if stats["frames_captured"] else 0.0),
+        "inference_ms_p50": stats["inference_ms_p50"],
+    }
+    result.update(_percentiles(list(latencies.values())))
+    return result
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit or None, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _format(value):
+    return "-" if value is None else f"{value:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trackers", type=int, nargs="+", default=[6])
+    parser.add_argument("--rate", type=float, nargs="+", default=[120.0], help="Hz per tracker")
+    parser.add_argument("--payload", type=int, nargs="+", default=[3], help="valori float per messaggio")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--ingest", nargs="+", choices=INGEST_MODES, default=["threading"])
+    parser.add_argument("--output", nargs="+", choices=OUTPUT_MODES, default=["messages"])
+    parser.add_argument("--output-rate", type=float, default=0, help="Hz, 0 = invio a ogni pacchetto")
+    parser.add_argument("--video", help="file video per il percorso webcam (salta il percorso OSC)")
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--model-complexity", type=int, default=1, choices=(0, 1, 2))
+    parser.add_argument("--json", help="scrive i risultati in questo file")
+    args = parser.parse_args()
+
+    results = []
+    if args.video:
+        r = run_camera(args.video, args.duration, args.pipelined, args.model_complexity, args.adaptive)
+        results.append(r)
+        print(f"camera: {r['frames_processed']} frame elaborati ({r['processed_fps']:.1f} fps), "
+              f"scartati {r['drop_rate']:.1%}, inviati {r['frames_sent']}, "
+              f"p50 {_format(r['p50_ms'])} ms, p99 {_format(r['p99_ms'])} ms, p999 {_format(r['p999_ms'])} ms")
+    else:
+        for ingest in args.ingest:
+            for output in args.output:
+                for trackers in args.trackers:
+                    for rate in args.rate:
+                        for payload in args.payload:
+                            r = run_bridge(ingest, output, args.output_rate, trackers, rate, payload,
+                                           args.duration)
+                            results.append(r)
+                            print(f"{ingest}/{output} {trackers} x {rate:g} Hz x {payload} valori: "
+                                  f"{r['sustained_msg_s']:.0f}/{r['offered_msg_s']:.0f} msg/s, "
+                                  f"persi {r['drop_rate']:.2%}, CPU {r['bridge_cpu_pct']:.1f}%, "
+                                  f"p50 {_format(r['p50_ms'])} ms, p99 {_format(r['p99_ms'])} ms, "
+                                  f"p999 {_format(r['p999_ms'])} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+        print(f"Risultati scritti in {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Messaggi al secondo per core: SimpleUDPClient di python-osc contro OSCOutput.
+
+Entrambi inviano /tracker/<id> con tre float a un socket UDP locale che non
+viene letto (il kernel scarta i datagrammi in eccesso). Il tempo misurato è
+il tempo CPU del processo, quindi il risultato è per singolo core.
+
+Uso: python benchmarks/bench_encoder.py --messages 200000
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pythonosc import osc_message_builder, udp_client
+from osc_output import OSCEncoder, OSCOutput
+
+TRACKERS = [str(i) for i in range(6)]
+
+
+def measure(label, count, fn):
+    start = time.process_time()
+    fn(count)
+    elapsed = time.process_time() - start
+    print(f"{label:<38} {count / elapsed:>12,.0f} msg/s per core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    port = sink.getsockname()[1]
+    sample = [0.25, -1.5, 3.0]
+
+    def builder_only(count):
+        for i in range(count):
+            msg = osc_message_builder.OscMessageBuilder(address=f"/tracker/{TRACKERS[i % 6]}")
+            for value in sample:
+                msg.add_arg(value)
+            msg.build().dgram
+
+    encoder = OSCEncoder()
+
+    def encoder_only(count):
+        for i in range(count):
+            encoder.pack_message(encoder.tracker_message(TRACKERS[i % 6], 3), sample)
+
+    client = udp_client.SimpleUDPClient("127.0.0.1", port)
+
+    def simple_client(count):
+        for i in range(count):
+            client.send_message(f"/tracker/{TRACKERS[i % 6]}", sample)
+
+    output = OSCOutput("127.0.0.1", port)
+
+    def osc_output(count):
+        for i in range(count):
+            output.send_tracker(TRACKERS[i % 6], sample)
+
+    bundle_output = OSCOutput("127.0.0.1", port, bundles=True)
+
+    def osc_output_bundle(count):
+        for i in range(count):
+            bundle_output.queue_tracker(TRACKERS[i % 6], sample)
+            if i % 6 == 5:
+                bundle_output.flush()
+
+    measure("codifica OscMessageBuilder", args.messages, builder_only)
+    measure("codifica OSCEncoder", args.messages, encoder_only)
+    measure("invio SimpleUDPClient.send_message", args.messages, simple_client)
+    measure("invio OSCOutput.send_tracker", args.messages, osc_output)
+    measure("invio OSCOutput bundle da 6", args.messages, osc_output_bundle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Confronto CPU e latenza p99 tra ingresso OSC a thread e ingresso asyncio.
+
+Il bridge gira in un processo figlio (così il tempo CPU misurato è solo il suo),
+il processo principale invia il carico sintetico e riceve l'uscita su un sink UDP
+locale al posto del router OSC di SlimeVR.
+
+Uso: python benchmarks/bench_ingest.py --trackers 6 --rate 120 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pythonosc import dispatcher, osc_packet, udp_client
+from osc_bridge import AntiDriftBridge
+from osc_ingest import INGEST_MODES, create_ingest_server
+from osc_output import OUTPUT_MODES, OSCOutput
+
+
+def _run_bridge(mode, output, output_rate, sink_port, ready, stop, result):
+    bridge = AntiDriftBridge(output=OSCOutput("127.0.0.1", sink_port, bundles=output == "bundle"),
+                             output_rate=output_rate)
+    # Soglia altissima: i valori passano invariati e il primo argomento resta il numero di sequenza
+    bridge.set_parameters(drift_threshold=1e12)
+    bridge.calibrate()
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data)
+    server = create_ingest_server(mode, ("127.0.0.1", 0), disp,
+                                  on_batch_start=bridge.begin_tick, on_batch_end=bridge.end_tick)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    if hasattr(server, "wait_ready"):
+        server.wait_ready()
+    ready.send(server.server_address[1])
+    cpu_start = time.process_time()
+    stop.wait()
+    result.send(time.process_time() - cpu_start)
+    server.shutdown()
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, output, output_rate, trackers, rate, duration, burst):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sink.bind(("127.0.0.1", 0))
+    sink.settimeout(0.5)
+    received = {}
+    datagrams = [0]
+
+    def sink_loop():
+        while True:
+            try:
+                data = sink.recv(1024)
+            except socket.timeout:
+                return
+            now = time.perf_counter()
+            datagrams[0] += 1
+            for timed_msg in osc_packet.OscPacket(data).messages:
+                received.setdefault(int(timed_msg.message.params[0]), now)
+
+    ready_recv, ready_send = multiprocessing.Pipe(False)
+    result_recv, result_send = multiprocessing.Pipe(False)
+    stop = multiprocessing.Event()
+    proc = multiprocessing.Process(target=_run_bridge,
+                                   args=(mode, output, output_rate, sink.getsockname()[1], ready_send, stop, result_send))
+    proc.start()
+    port = ready_recv.recv()
+    sink_thread = threading.Thread(target=sink_loop)
+    sink_thread.start()
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sent = {}
+    interval = burst / (trackers * rate)
+    seq = 0
+    start = time.perf_counter()
+    next_send = start
+    while time.perf_counter() - start < duration:
+        # Invia un burst di pacchetti, come fa il Wi-Fi dei telefoni
+        for _ in range(burst):
+            tracker = seq % trackers
+            msg = udp_client.OscMessageBuilder(f"/tracker/{tracker}")
+            for value in (float(seq), 0.0, 0.0):
+                msg.add_arg(value)
+            dgram = msg.build().dgram
+            sent[seq] = time.perf_counter()
+            sender.sendto(dgram, ("127.0.0.1", port))
+            seq += 1
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    time.sleep(0.5)
+    stop.set()
+    cpu = result_recv.recv()
+    proc.join()
+    sink_thread.join()
+
+    latencies = [(received[s] - sent[s]) * 1000.0 for s in received if s in sent]
+    return {
+        "mode": f"{mode}/{output}",
+        "sent": len(sent),
+        "received": len(received),
+        "datagrams": datagrams[0],
+        "cpu_s": cpu,
+        "cpu_pct": 100.0 * cpu / duration,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trackers", type=int, default=6)
+    parser.add_argument("--rate", type=float, default=120.0, help="Hz per tracker")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--burst", type=int, default=1, help="pacchetti inviati back-to-back")
+    parser.add_argument("--modes", nargs="+", choices=INGEST_MODES, default=list(INGEST_MODES))
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="messages")
+    parser.add_argument("--output-rate", type=float, default=0, help="Hz, 0 = invio a ogni pacchetto")
+    args = parser.parse_args()
+
+    print(f"{args.trackers} tracker x {args.rate:g} Hz, burst {args.burst}, {args.duration:g} s")
+    for mode in args.modes:
+        r = run(mode, args.output, args.output_rate, args.trackers, args.rate, args.duration, args.burst)
+        print(f"{r['mode']:>18}: inviati {r['sent']}, ricevuti {r['received']} "
+              f"in {r['datagrams']} datagrammi, "
+              f"CPU {r['cpu_s']:.2f} s ({r['cpu_pct']:.1f}%), "
+              f"p50 {r['p50_ms']:.3f} ms, p99 {r['p99_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
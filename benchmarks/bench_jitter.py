@@ -0,0 +1,130 @@
+"""Errore del segnale inviato a SlimeVR con e senza buffer anti-jitter, su una rete Wi-Fi simulata.
+
+Un tracker invia a --rate Hz una rotazione sinusoidale con il timetag del
+bundle; la rete aggiunge un ritardo base, jitter esponenziale, blocchi
+occasionali (tutti i pacchetti di quell'intervallo arrivano insieme alla
+fine) e perdite. Il tempo è simulato, quindi il risultato non dipende dal
+carico della macchina. Per ogni configurazione l'uscita a frequenza fissa
+viene confrontata con il valore vero del segnale nello stesso istante:
+l'errore comprende sia il jitter sia il ritardo aggiunto.
+
+Uso: python benchmarks/bench_jitter.py --seconds 60 --delays 0 10 20 40
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from jitter_buffer import JitterBuffer  # noqa: E402
+from output_scheduler import OutputScheduler  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Probe:
+    """Uscita che confronta ogni valore con il segnale vero all'istante dell'invio"""
+
+    def __init__(self, clock, signal):
+        self.clock = clock
+        self.signal = signal
+        self.squared = 0.0
+        self.worst = 0.0
+        self.count = 0
+
+    def queue_tracker(self, tracker_id, values, field=None):
+        error = abs(values[0] - self.signal(self.clock()))
+        self.squared += error * error
+        self.worst = max(self.worst, error)
+        self.count += 1
+
+    def flush(self, timestamp=None):
+        pass
+
+
+def network(seconds, rate, base, jitter, stall_every, stall_length, loss, seed):
+    """Eventi (arrivo, invio) dei pacchetti, in ordine di arrivo"""
+    rng = random.Random(seed)
+    arrivals = []
+    stall_end = -1.0
+    for i in range(int(seconds * rate)):
+        sent = i / rate
+        if rng.random() < loss:
+            continue
+        if sent > stall_end and rng.random() < 1.0 / (stall_every * rate):
+            stall_end = sent + stall_length
+        arrival = sent + base + rng.expovariate(1.0 / jitter)
+        if sent < stall_end:
+            arrival = max(arrival, stall_end + base)
+        heapq.heappush(arrivals, (arrival, sent))
+    return [heapq.heappop(arrivals) for _ in range(len(arrivals))]
+
+
+def simulate(packets, scheduler, clock, output_rate, seconds, timetags):
+    period = 1.0 / output_rate
+    tick = 0.5
+    index = 0
+    while tick < seconds:
+        while index < len(packets) and packets[index][0] <= tick:
+            arrival, sent = packets[index]
+            clock.now = arrival
+            scheduler.submit("1", [signal(sent)], sent + 1000.0 if timetags else None)
+            index += 1
+        clock.now = tick
+        scheduler.tick()
+        tick += period
+
+
+def signal(t):
+    return 60.0 * math.sin(2 * math.pi * 0.7 * t)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=100.0, help="Frequenza del tracker in Hz")
+    parser.add_argument("--output-rate", type=float, default=120.0)
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 10, 20, 40], help="Ritardi in ms")
+    parser.add_argument("--jitter", type=float, default=4.0, help="Jitter medio in ms")
+    parser.add_argument("--stall-every", type=float, default=2.0, help="Secondi medi tra due blocchi del Wi-Fi")
+    parser.add_argument("--stall-length", type=float, default=60.0, help="Durata di un blocco in ms")
+    parser.add_argument("--loss", type=float, default=0.01)
+    args = parser.parse_args()
+
+    packets = network(args.seconds, args.rate, 0.003, args.jitter / 1000.0, args.stall_every,
+                      args.stall_length / 1000.0, args.loss, seed=0)
+    reordered = sum(1 for a, b in zip(packets, packets[1:]) if b[1] < a[1])
+    print(f"{len(packets)} pacchetti, {reordered} fuori ordine; errore in gradi su un'ampiezza di 60")
+    print(f"{'configurazione':>26}  {'RMS':>6}  {'max':>6}  {'tardi':>6}  {'interp.':>7}  {'estrap.':>7}")
+
+    clock = Clock()
+    probe = Probe(clock, signal)
+    scheduler = OutputScheduler(probe, args.output_rate, stale_after=10.0)
+    simulate(packets, scheduler, clock, args.output_rate, args.seconds, timetags=False)
+    print(f"{'ultimo valore (senza buffer)':>26}  {math.sqrt(probe.squared / probe.count):>6.2f}  "
+          f"{probe.worst:>6.2f}  {'-':>6}  {'-':>7}  {'-':>7}")
+
+    for timetags in (True, False):
+        for delay in args.delays:
+            clock = Clock()
+            probe = Probe(clock, signal)
+            buffer = JitterBuffer(probe, args.output_rate, delay / 1000.0, stale_after=10.0, clock=clock)
+            simulate(packets, buffer, clock, args.output_rate, args.seconds, timetags)
+            stats = buffer.stats()
+            name = f"{delay:g} ms, {'timetag' if timetags else 'arrivo'}"
+            print(f"{name:>26}  {math.sqrt(probe.squared / probe.count):>6.2f}  {probe.worst:>6.2f}  "
+                  f"{stats['late_rate']:>6.1%}  {stats['interpolated_rate']:>7.1%}  "
+                  f"{stats['extrapolated_rate']:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Tempo dell'estrazione offline delle pose e dello sweep dei parametri al crescere dei processi.
+
+Per ogni numero di processi esegue pose_batch.extract() sui video indicati
+(divisi in pezzi da --chunk-frames frame) e poi pose_batch.sweep() sulle
+pose estratte, riportando frame al secondo e coppie di parametri al
+secondo. Con più core liberi entrambi dovrebbero crescere quasi
+linearmente, finché i pezzi sono almeno quanti i processi.
+
+Uso: python benchmarks/bench_pose_batch.py registrazione.mp4 --workers 1 2 4 --chunk-frames 300
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_e2e import _environment  # noqa: E402
+from pose_batch import extract, save_columns, sweep  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--chunk-frames", type=int, default=300)
+    parser.add_argument("--model-complexity", type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 2.0, 5.0, 10.0])
+    parser.add_argument("--coefficients", type=float, nargs="+", default=[0.5, 0.7, 0.85, 0.95])
+    parser.add_argument("--json", help="scrive i risultati in questo file")
+    args = parser.parse_args()
+
+    combos = len(args.thresholds) * len(args.coefficients)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "poses.npz")
+        for workers in args.workers:
+            columns, stats = extract(args.videos, workers, args.chunk_frames, model_complexity=args.model_complexity)
+            save_columns(path, columns)
+            start = time.perf_counter()
+            sweep(path, args.thresholds, args.coefficients, workers)
+            sweep_seconds = time.perf_counter() - start
+            result = {"workers": workers, "chunks": stats["chunks"], "frames": stats["frames"],
+                      "extract_s": stats["seconds"], "extract_fps": stats["fps"],
+                      "sweep_combos": combos, "sweep_s": sweep_seconds,
+                      "sweep_combos_s": combos / sweep_seconds if sweep_seconds > 0 else 0.0}
+            results.append(result)
+            print(f"{workers} processi: estrazione {result['extract_fps']:.1f} frame/s "
+                  f"({stats['frames']} frame, {stats['chunks']} pezzi), sweep {combos} coppie in "
+                  f"{sweep_seconds:.2f} s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Costo per posa della webcam: PoseRing in memoria condivisa contro OSC su UDP locale.
+
+Per ogni trasporto misura il tempo di invio dal lato webcam (publish() o
+coda + flush di OSCOutput) e quello di ricezione dal lato bridge
+(wait() + read_latest() o recv + decodifica del bundle), con tutti i
+tracker di pose_solver.TRACKERS visibili.
+
+Uso: python benchmarks/bench_pose_ring.py --poses 20000
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pythonosc import osc_packet  # noqa: E402
+from osc_output import OSCOutput  # noqa: E402
+from pose_ring import PoseRing  # noqa: E402
+from pose_solver import TRACKERS  # noqa: E402
+
+
+def _pose():
+    return {name: {'position': [0.1 * i, 0.2, 0.3], 'rotation': [10.0, 20.0 * i, 30.0], 'visible': True}
+            for i, name in enumerate(TRACKERS)}
+
+
+def bench_ring(poses):
+    ring = PoseRing.create("antidrift_poses_bench")
+    writer = PoseRing.attach("antidrift_poses_bench")
+    data = _pose()
+    send = receive = 0.0
+    for _ in range(poses):
+        start = time.perf_counter()
+        writer.publish(None, data)
+        middle = time.perf_counter()
+        ring.wait(1.0)
+        ring.read_latest()
+        send += middle - start
+        receive += time.perf_counter() - middle
+    writer.close()
+    ring.close()
+    return send / poses * 1e6, receive / poses * 1e6
+
+
+def bench_udp(poses):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    output = OSCOutput("127.0.0.1", sink.getsockname()[1], bundles=True)
+    data = _pose()
+    send = receive = 0.0
+    for _ in range(poses):
+        start = time.perf_counter()
+        for tracker_id, tracker in data.items():
+            output.queue_tracker(tracker_id, tracker['position'], 'position')
+            output.queue_tracker(tracker_id, tracker['rotation'], 'rotation')
+        output.flush()
+        middle = time.perf_counter()
+        packet = osc_packet.OscPacket(sink.recv(65536))
+        for timed_msg in packet.messages:
+            timed_msg.message.params
+        send += middle - start
+        receive += time.perf_counter() - middle
+    output.close()
+    sink.close()
+    return send / poses * 1e6, receive / poses * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--poses", type=int, default=20000)
+    args = parser.parse_args()
+    for name, bench in (("ring", bench_ring), ("udp", bench_udp)):
+        send, receive = bench(args.poses)
+        print(f"{name:>4}: invio {send:.1f} µs, ricezione {receive:.1f} µs per posa ({len(TRACKERS)} tracker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Costo per frame del calcolo dei tracker dai landmark MediaPipe.
+
+Confronta i vecchi metodi scalari _calculate_*_position (4 tracker, rotazione
+sempre [0, 0, 0]) con PoseSolver.solve_landmarks() (con rotazioni) per 4 e 8
+tracker, partendo dagli stessi oggetti landmark con attributi x, y, z,
+visibility.
+
+Uso: python benchmarks/bench_pose_solver.py --frames 20000
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pose_solver import (DEFAULT_TRACKERS, TRACKERS, LEFT_ANKLE, LEFT_HEEL, LEFT_HIP, LEFT_SHOULDER, PoseSolver,
+                         RIGHT_ANKLE, RIGHT_HEEL, RIGHT_HIP, RIGHT_SHOULDER, landmarks_to_array)
+
+Landmark = collections.namedtuple("Landmark", "x y z visibility")
+
+
+def _pair(a, b):
+    return {
+        'position': [(a.x + b.x) / 2, (a.y + b.y) / 2, (a.z + b.z) / 2],
+        'rotation': [0, 0, 0],
+        'visible': a.visibility > 0.5 and b.visibility > 0.5
+    }
+
+
+def scalar_trackers(landmarks):
+    """Vecchio calcolo di CameraTracker: anca, torace e piedi"""
+    return {
+        'hip': _pair(landmarks[LEFT_HIP], landmarks[RIGHT_HIP]),
+        'chest': _pair(landmarks[LEFT_SHOULDER], landmarks[RIGHT_SHOULDER]),
+        'left_foot': _pair(landmarks[LEFT_ANKLE], landmarks[LEFT_HEEL]),
+        'right_foot': _pair(landmarks[RIGHT_ANKLE], landmarks[RIGHT_HEEL]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    frames = [[Landmark(rng.random(), rng.random(), rng.random() - 0.5, rng.random()) for _ in range(33)]
+              for _ in range(200)]
+
+    start = time.perf_counter()
+    for i in range(args.frames):
+        scalar_trackers(frames[i % len(frames)])
+    scalar_us = (time.perf_counter() - start) / args.frames * 1e6
+
+    timings = []
+    for names in (DEFAULT_TRACKERS, list(TRACKERS)):
+        solver = PoseSolver(trackers=names)
+        start = time.perf_counter()
+        for i in range(args.frames):
+            solver.solve_landmarks(frames[i % len(frames)])
+        timings.append((len(names), (time.perf_counter() - start) / args.frames * 1e6))
+
+        for i in range(len(frames)):
+            old = scalar_trackers(frames[i])
+            new = solver.solve_landmarks(frames[i])
+            for name in old:
+                assert np.allclose(old[name]['position'], new[name]['position'])
+                assert old[name]['visible'] == new[name]['visible']
+
+    # Da un array (33, 4), come in pose_batch.py, il risultato è lo stesso
+    solver = PoseSolver(list(TRACKERS))
+    for frame in frames:
+        dictionary = solver.solve_landmarks(frame)
+        assert np.allclose(solver.solve(landmarks_to_array(frame))[1],
+                           [dictionary[name]['rotation'] for name in solver.names])
+
+    print(f"scalare    (4 tracker, senza rotazioni): {scalar_us:8.1f} us/frame ({scalar_us / 4:.1f} us/tracker)")
+    for count, elapsed in timings:
+        print(f"PoseSolver ({count} tracker, con rotazioni):   {elapsed:8.1f} us/frame "
+              f"({elapsed / count:.1f} us/tracker)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Una stanza di utenti su un solo processo con SessionBridge.
+
+Prima verifica l'isolamento: più telefoni inviano gli stessi indirizzi
+(/tracker/0../tracker/N) con valori diversi e l'uscita di ogni sessione
+deve coincidere con quella di un DriftEngine dedicato a quel telefono.
+Poi misura il throughput: il bridge gira in un processo figlio con
+ingresso asyncio e sessioni calibrate all'apertura, i mittenti sono
+processi con un socket per utente (come bench_sharded.py) e il sink UDP
+conta i messaggi arrivati.
+
+Uso: python benchmarks/bench_sessions.py --users 10 --trackers 6 --rate 100 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pythonosc import dispatcher  # noqa: E402
+from bench_e2e import Sink, _environment  # noqa: E402
+from bench_sharded import _free_port, _sender  # noqa: E402
+from drift_engine import DriftEngine  # noqa: E402
+from osc_ingest import AsyncIOIngestServer  # noqa: E402
+from osc_recorder import MemoryOutput  # noqa: E402
+from session_bridge import SessionBridge  # noqa: E402
+
+
+def check_isolation(users, trackers, ticks=500):
+    """Confronta l'uscita di ogni sessione con un motore dedicato; restituisce i valori diversi"""
+    outputs = {}
+
+    def factory(host, port, bundles=False):
+        return outputs.setdefault(port, MemoryOutput())
+
+    routes = {f"10.0.0.{user}": ("127.0.0.1", 9100 + user) for user in range(users)}
+    bridge = SessionBridge(routes=routes, calibrate_new=True, output_factory=factory)
+    engines = [DriftEngine() for _ in range(users)]
+    expected = {9100 + user: [] for user in range(users)}
+    rng = random.Random(0)
+    for tick in range(ticks):
+        bridge.begin_tick()
+        for user in range(users):
+            for tracker in range(trackers):
+                sample = [rng.uniform(-1, 1) * rng.choice((1, 1, 20)) for _ in range(3)]
+                bridge.handle_tracker_data((f"10.0.0.{user}", 5000), f"/tracker/{tracker}", *sample)
+                corrected = engines[user].correct(str(tracker), sample)
+                expected[9100 + user].append((f"/tracker/{tracker}", tuple(corrected)))
+        bridge.end_tick()
+    return sum(a != b for port, messages in expected.items()
+               for a, b in zip(messages, outputs[port].messages))
+
+
+def _run_bridge(port, sink_port, ready, stop, result):
+    bridge = SessionBridge(default_route=("127.0.0.1", sink_port), calibrate_new=True)
+    bridge.set_parameters(drift_threshold=1e12)
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data, needs_reply_address=True)
+    server = AsyncIOIngestServer(("127.0.0.1", port), disp, on_batch_start=bridge.begin_tick,
+                                 on_batch_end=bridge.end_tick)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.wait_ready()
+    ready.put(True)
+    cpu_start = time.process_time()
+    stop.wait()
+    result.put((time.process_time() - cpu_start, len(bridge.sessions)))
+    server.shutdown()
+
+
+def run(users, trackers, rate, duration, senders):
+    sink = Sink()
+    port = _free_port()
+    context = multiprocessing.get_context()
+    ready, result, sent = context.Queue(), context.Queue(), context.Queue()
+    stop = context.Event()
+    bridge = context.Process(target=_run_bridge, args=(port, sink.port, ready, stop, result))
+    bridge.start()
+    ready.get(timeout=30)
+
+    start = time.time() + 0.5
+    shares = [users // senders + (1 if i < users % senders else 0) for i in range(senders)]
+    processes = [context.Process(target=_sender, args=(("127.0.0.1", port), share, trackers, rate,
+                                                       duration, start, sent))
+                 for share in shares if share]
+    for process in processes:
+        process.start()
+    total_sent = sum(sent.get() for _ in processes)
+    for process in processes:
+        process.join()
+    time.sleep(0.5)
+    stop.set()
+    cpu, sessions = result.get(timeout=30)
+    bridge.join()
+    sink.stop()
+
+    received = sum(1 for _ in sink.messages())
+    return {
+        "users": users,
+        "trackers": trackers,
+        "rate_hz": rate,
+        "duration_s": duration,
+        "sessions": sessions,
+        "sent": total_sent,
+        "received": received,
+        "offered_msg_s": total_sent / duration,
+        "sustained_msg_s": received / duration,
+        "drop_rate": 1.0 - received / total_sent if total_sent else 0.0,
+        "bridge_cpu_pct": 100.0 * cpu / (duration + 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="telefoni simulati (un socket ciascuno)")
+    parser.add_argument("--trackers", type=int, default=6, help="tracker per utente")
+    parser.add_argument("--rate", type=float, nargs="+", default=[100.0], help="Hz per tracker")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--senders", type=int, default=2, help="processi mittenti")
+    parser.add_argument("--json", help="scrive i risultati in questo file")
+    args = parser.parse_args()
+
+    mismatched = check_isolation(args.users, args.trackers)
+    print(f"Isolamento: {mismatched} valori diversi da un motore per telefono")
+    results = []
+    for rate in args.rate:
+        r = run(args.users, args.trackers, rate, args.duration, args.senders)
+        results.append(r)
+        print(f"{args.users} x {args.trackers} x {rate:g} Hz: {r['sessions']} sessioni, "
+              f"{r['sustained_msg_s']:.0f}/{r['offered_msg_s']:.0f} msg/s, persi {r['drop_rate']:.2%}, "
+              f"CPU del bridge {r['bridge_cpu_pct']:.0f}%")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": _environment(), "isolation_mismatched": mismatched,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Throughput del bridge su più processi (ShardedBridge) al crescere dei worker.
+
+Simula una stanza di utenti: ogni utente è un socket diverso (come un
+telefono con owoTracker) che invia un messaggio per tracker a ogni
+periodo. I mittenti girano in processi separati e il bridge invia a un
+sink UDP locale. Per ogni numero di worker e ogni carico offerto riporta
+i messaggi al secondo arrivati al sink e la percentuale persa: il carico
+massimo sostenuto senza perdite dovrebbe crescere con i worker finché ci
+sono core liberi (i mittenti e il sink ne occupano uno).
+
+Uso: python benchmarks/bench_sharded.py --workers 1 2 4 --users 10 --trackers 6 --rate 100 200 400
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_e2e import Sink, _environment  # noqa: E402
+from osc_output import OSCEncoder  # noqa: E402
+from sharded_bridge import SHARD_MODES, ShardedBridge  # noqa: E402
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _sender(target, users, trackers, rate, duration, start, sent):
+    """Processo mittente: `users` socket, un messaggio per tracker a ogni periodo"""
+    encoder = OSCEncoder()
+    datagrams = []
+    for tracker in range(trackers):
+        length = encoder.pack_message(encoder.tracker_message(str(tracker), 3), [0.1, 0.2, 0.3])
+        datagrams.append(bytes(encoder.buffer[:length]))
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(users)]
+    while time.time() < start:
+        time.sleep(0.001)
+    count = 0
+    interval = 1.0 / rate
+    next_send = time.perf_counter()
+    end = next_send + duration
+    while next_send < end:
+        for sock in sockets:
+            for data in datagrams:
+                sock.sendto(data, target)
+        count += len(sockets) * len(datagrams)
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    sent.put(count)
+
+
+def run(workers, mode, users, trackers, rate, duration, senders):
+    sink = Sink()
+    port = _free_port()
+    bridge = ShardedBridge(workers=workers, mode=mode, listen=("127.0.0.1", port),
+                           output=("127.0.0.1", sink.port), drift_threshold=1e12)
+    bridge.start()
+    bridge.calibrate()
+
+    context = multiprocessing.get_context()
+    sent = context.Queue()
+    start = time.time() + 0.5
+    shares = [users // senders + (1 if i < users % senders else 0) for i in range(senders)]
+    processes = [context.Process(target=_sender, args=(("127.0.0.1", port), share, trackers, rate,
+                                                       duration, start, sent))
+                 for share in shares if share]
+    for process in processes:
+        process.start()
+    total_sent = sum(sent.get() for _ in processes)
+    for process in processes:
+        process.join()
+    time.sleep(0.5)
+    stats = bridge.shard_stats()
+    bridge.stop()
+    sink.stop()
+
+    received = sum(1 for _ in sink.messages())
+    return {
+        "workers": workers,
+        "mode": mode,
+        "users": users,
+        "trackers": trackers,
+        "rate_hz": rate,
+        "duration_s": duration,
+        "sent": total_sent,
+        "received": received,
+        "offered_msg_s": total_sent / duration,
+        "sustained_msg_s": received / duration,
+        "drop_rate": 1.0 - received / total_sent if total_sent else 0.0,
+        "messages_per_shard": [shard["messages"] for shard in stats],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--mode", choices=SHARD_MODES, default=None)
+    parser.add_argument("--users", type=int, default=10, help="telefoni simulati (un socket ciascuno)")
+    parser.add_argument("--trackers", type=int, default=6, help="tracker per utente")
+    parser.add_argument("--rate", type=float, nargs="+", default=[100.0], help="Hz per tracker")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--senders", type=int, default=2, help="processi mittenti")
+    parser.add_argument("--json", help="scrive i risultati in questo file")
+    args = parser.parse_args()
+
+    results = []
+    for rate in args.rate:
+        for workers in args.workers:
+            r = run(workers, args.mode, args.users, args.trackers, rate, args.duration, args.senders)
+            results.append(r)
+            print(f"{workers} worker, {args.users} x {args.trackers} x {rate:g} Hz: "
+                  f"{r['sustained_msg_s']:.0f}/{r['offered_msg_s']:.0f} msg/s, persi {r['drop_rate']:.2%}, "
+                  f"per shard {r['messages_per_shard']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Tempo di avvio di main.py fino al primo pacchetto inoltrato e memoria di base.
+
+Avvia main.py in un processo figlio, invia un messaggio /tracker ogni 5 ms
+sulla porta 12345 e misura quando il primo messaggio arriva sulla porta 9002
+(al posto del router di SlimeVR). Il bridge inoltra solo dopo la
+calibrazione: se main.py non è avviato con --calibrate, il benchmark la
+richiede all'interfaccia web appena risponde. Dopo qualche secondo legge la
+RSS del processo. Serve Linux (/proc) e le porte 12345, 9002 e 9003 libere.
+
+Uso: python benchmarks/bench_startup.py --runs 5 --args=--calibrate
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from pythonosc import udp_client
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "main.py")
+
+
+def _rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def run(settle, extra_args):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 9002))
+    sink.settimeout(0.005)
+    client = udp_client.SimpleUDPClient("127.0.0.1", 12345)
+
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, MAIN] + extra_args, stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_packet = None
+    try:
+        while time.perf_counter() - start < 30:
+            client.send_message("/tracker/0", [1.0, 2.0, 3.0])
+            try:
+                sink.recv(1024)
+                first_packet = time.perf_counter() - start
+                break
+            except socket.timeout:
+                pass
+            if proc.poll() is not None:
+                break
+            _calibrate_if_ready()
+        time.sleep(settle)
+        rss = _rss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+        sink.close()
+    return first_packet, rss
+
+
+def _calibrate_if_ready():
+    try:
+        urllib.request.urlopen(urllib.request.Request("http://127.0.0.1:9003/calibrate", method="POST"),
+                               timeout=0.05)
+    except Exception:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--settle", type=float, default=3.0, help="secondi prima di leggere la RSS")
+    parser.add_argument("--args", default="", help="argomenti aggiuntivi per main.py")
+    args = parser.parse_args()
+
+    results = [run(args.settle, args.args.split()) for _ in range(args.runs)]
+    for first_packet, rss in results:
+        first = f"{first_packet * 1000:.0f} ms" if first_packet is not None else "nessun pacchetto"
+        print(f"primo pacchetto inoltrato: {first}, RSS: {rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
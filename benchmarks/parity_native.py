@@ -0,0 +1,111 @@
+"""Confronta il backend nativo di DriftEngine con quello Python e ne misura la velocità.
+
+Genera flussi casuali di tick con campioni di lunghezza variabile, tracker
+ripetuti nello stesso tick, NaN, salti oltre la soglia e cambi di parametri,
+li applica a due motori (python e native) e verifica che uscite, ultimi
+valori e contatori delle correzioni coincidano bit per bit. Poi misura il
+tempo per tick dei due backend.
+
+Uso (dopo python setup_native.py build_ext --inplace in src):
+    python benchmarks/parity_native.py --ticks 5000 --trackers 16
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from drift_engine import DriftEngine, antidrift_native  # noqa: E402
+
+
+def _sample(rng, width):
+    length = rng.choice((3, 3, 3, 4, width)) if rng.random() < 0.2 else 3
+    sample = [rng.uniform(-1, 1) * rng.choice((1, 1, 1, 20)) for _ in range(length)]
+    if rng.random() < 0.01:
+        sample[rng.randrange(length)] = rng.choice((float("nan"), float("inf")))
+    return sample
+
+
+def make_stream(seed, ticks, trackers, width):
+    """Lista di tick; un tick è (ids, campioni) oppure ("params", soglia, coefficiente)"""
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(ticks):
+        if rng.random() < 0.005:
+            stream.append(("params", rng.uniform(0.5, 10), rng.uniform(0, 1)))
+            continue
+        size = rng.randint(1, trackers * 2)
+        ids = [str(rng.randrange(trackers)) for _ in range(size)]
+        stream.append((ids, [_sample(rng, width) for _ in ids]))
+    return stream
+
+
+def run(engine, stream):
+    outputs = []
+    for tick in stream:
+        if tick[0] == "params":
+            engine.set_parameters(tick[1], tick[2])
+            continue
+        ids, samples = tick
+        outputs.append(engine.correct_many(ids, samples))
+    return outputs
+
+
+def _same(a, b):
+    return a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+def check(seed, ticks, trackers, width):
+    stream = make_stream(seed, ticks, trackers, width)
+    python, native = DriftEngine(backend="python"), DriftEngine(backend="native")
+    for row, (a, b) in enumerate(zip(run(python, stream), run(native, stream))):
+        if not _same(a, b):
+            raise AssertionError(f"seed {seed}: uscita diversa al tick {row}\n{a}\n{b}")
+    if not (_same(python.last, native.last) and np.array_equal(python.last_len, native.last_len)):
+        raise AssertionError(f"seed {seed}: stato finale diverso")
+    if python.trigger_counts() != native.trigger_counts():
+        raise AssertionError(f"seed {seed}: contatori diversi "
+                             f"{python.trigger_counts()} {native.trigger_counts()}")
+    return sum(python.triggers)
+
+
+def bench(backend, stream, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        engine = DriftEngine(backend=backend)
+        start = time.perf_counter()
+        run(engine, stream)
+        best = min(best, time.perf_counter() - start)
+    return best / len(stream) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--trackers", type=int, default=16)
+    parser.add_argument("--width", type=int, default=6, help="lunghezza massima dei campioni")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if antidrift_native is None:
+        sys.exit("modulo antidrift_native non trovato: python setup_native.py build_ext --inplace in src")
+
+    np.seterr(invalid="ignore")  # i NaN e gli inf nei flussi sono voluti
+    triggers = sum(check(seed, args.ticks, args.trackers, args.width) for seed in range(args.seeds))
+    print(f"parità: {args.seeds} flussi da {args.ticks} tick identici ({triggers} correzioni)")
+
+    # Tick realistici: ogni tracker una volta, campioni di 3 valori
+    rng = random.Random(0)
+    ids = [str(i) for i in range(args.trackers)]
+    stream = [(ids, [[rng.uniform(-1, 1) * 10 for _ in range(3)] for _ in ids]) for _ in range(args.ticks)]
+    for backend in ("python", "native"):
+        print(f"{backend:>7}: {bench(backend, stream, args.repeat):.1f} µs/tick ({args.trackers} tracker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,7 @@ if errorlevel 1 (
 
 :: Installa le dipendenze necessarie
 echo Installazione delle dipendenze...
-pip install python-osc flask
+pip install python-osc flask numpy
 if errorlevel 1 (
     echo Errore durante l'installazione delle dipendenze!
     pause
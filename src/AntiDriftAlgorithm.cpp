@@ -123,3 +123,43 @@ void AntiDriftAlgorithm::logDriftStatus() {
         std::cout << "Warning: Significant drift detected!" << std::endl;
     }
 }
+
+void correctDriftBatch(const DriftBatch& batch) {
+    const int64_t k = batch.columns;
+
+    for (int64_t row = 0; row < batch.count; row++) {
+        const int64_t slot = batch.slots[row];
+        const double* values = batch.values + row * k;
+        double* last = batch.last + slot * batch.width;
+        double* out = batch.out + row * k;
+        const int64_t length = batch.lengths[row];
+        const int64_t lastLength = batch.lastLength[slot];
+
+        // Drift is measured only on the components present in both samples.
+        // Masking by multiplication and NaN propagation match the NumPy engine.
+        const int64_t common = length < lastLength ? length : lastLength;
+        double drift = 0.0;
+        for (int64_t i = 0; i < k; i++) {
+            double delta = std::abs(values[i] - last[i]) * (i < common ? 1.0 : 0.0);
+            if (std::isnan(delta)) {
+                drift = delta;
+                break;
+            }
+            if (delta > drift) {
+                drift = delta;
+            }
+        }
+
+        // Simplified Kalman filter where the drift exceeds the threshold
+        const bool trigger = drift > batch.threshold[slot];
+        const double alpha = batch.coefficient[slot];
+        for (int64_t i = 0; i < k; i++) {
+            out[i] = (trigger && i < lastLength) ? alpha * values[i] + (1 - alpha) * last[i] : values[i];
+        }
+        for (int64_t i = 0; i < k; i++) {
+            last[i] = out[i];
+        }
+        batch.lastLength[slot] = length;
+        batch.triggered[row] = trigger ? 1 : 0;
+    }
+}
@@ -3,6 +3,7 @@
 
 #include <vector>
 #include <string>
+#include <cstdint>
 
 struct SensorData {
     float accelerometer[3];
@@ -45,4 +46,26 @@ private:
     void logDriftStatus();
 };
 
+// Batch drift correction used by the Python bridge (antidrift_native module).
+// Tracker state lives in caller-owned row-major arrays, one row per slot:
+// last values [capacity x width], last lengths, per-slot threshold and filter
+// coefficient. Rows are applied in order, so repeated slots behave as if the
+// samples arrived one after the other.
+struct DriftBatch {
+    int64_t count;              // samples in the batch (n)
+    int64_t columns;            // padded sample width (k <= width)
+    const int64_t* slots;       // [n]
+    const double* values;       // [n x k]
+    const int64_t* lengths;     // [n]
+    double* last;               // [capacity x width]
+    int64_t* lastLength;        // [capacity]
+    int64_t width;
+    const double* threshold;    // [capacity]
+    const double* coefficient;  // [capacity]
+    double* out;                // [n x k]
+    uint8_t* triggered;         // [n]
+};
+
+void correctDriftBatch(const DriftBatch& batch);
+
 #endif // ANTI_DRIFT_ALGORITHM_H
@@ -0,0 +1,110 @@
+// Python binding for the batch drift correction in AntiDriftAlgorithm.cpp.
+// Build with: python setup_native.py build_ext --inplace (from src/)
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include "AntiDriftAlgorithm.h"
+
+namespace {
+
+struct Buffer {
+    Py_buffer view;
+    bool held = false;
+
+    ~Buffer() {
+        if (held) {
+            PyBuffer_Release(&view);
+        }
+    }
+
+    bool acquire(PyObject* object, const char* name, Py_ssize_t itemsize, int ndim, bool writable) {
+        int flags = PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (writable ? PyBUF_WRITABLE : 0);
+        if (PyObject_GetBuffer(object, &view, flags) != 0) {
+            return false;
+        }
+        held = true;
+        if (view.itemsize != itemsize || view.ndim != ndim) {
+            PyErr_Format(PyExc_ValueError, "%s: expected %d-d array of %zd-byte items", name, ndim, itemsize);
+            return false;
+        }
+        return true;
+    }
+
+    Py_ssize_t dim(int i) const { return view.shape[i]; }
+};
+
+PyObject* correct_batch(PyObject*, PyObject* args) {
+    PyObject *slotsObj, *valuesObj, *lengthsObj, *lastObj, *lastLengthObj;
+    PyObject *thresholdObj, *coefficientObj, *outObj, *triggeredObj;
+    if (!PyArg_ParseTuple(args, "OOOOOOOOO", &slotsObj, &valuesObj, &lengthsObj, &lastObj, &lastLengthObj,
+                          &thresholdObj, &coefficientObj, &outObj, &triggeredObj)) {
+        return nullptr;
+    }
+
+    Buffer slots, values, lengths, last, lastLength, threshold, coefficient, out, triggered;
+    if (!slots.acquire(slotsObj, "slots", 8, 1, false) ||
+        !values.acquire(valuesObj, "values", 8, 2, false) ||
+        !lengths.acquire(lengthsObj, "lengths", 8, 1, false) ||
+        !last.acquire(lastObj, "last", 8, 2, true) ||
+        !lastLength.acquire(lastLengthObj, "last_len", 8, 1, true) ||
+        !threshold.acquire(thresholdObj, "threshold", 8, 1, false) ||
+        !coefficient.acquire(coefficientObj, "coefficient", 8, 1, false) ||
+        !out.acquire(outObj, "out", 8, 2, true) ||
+        !triggered.acquire(triggeredObj, "triggered", 1, 1, true)) {
+        return nullptr;
+    }
+
+    const Py_ssize_t n = slots.dim(0);
+    const Py_ssize_t k = values.dim(1);
+    const Py_ssize_t capacity = last.dim(0);
+    if (values.dim(0) != n || lengths.dim(0) != n || out.dim(0) != n || out.dim(1) != k ||
+        triggered.dim(0) != n || k > last.dim(1) || lastLength.dim(0) < capacity ||
+        threshold.dim(0) < capacity || coefficient.dim(0) < capacity) {
+        PyErr_SetString(PyExc_ValueError, "array shapes do not match");
+        return nullptr;
+    }
+    const int64_t* slotData = static_cast<const int64_t*>(slots.view.buf);
+    for (Py_ssize_t row = 0; row < n; row++) {
+        if (slotData[row] < 0 || slotData[row] >= capacity) {
+            PyErr_SetString(PyExc_IndexError, "slot out of range");
+            return nullptr;
+        }
+    }
+
+    DriftBatch batch;
+    batch.count = n;
+    batch.columns = k;
+    batch.slots = slotData;
+    batch.values = static_cast<const double*>(values.view.buf);
+    batch.lengths = static_cast<const int64_t*>(lengths.view.buf);
+    batch.last = static_cast<double*>(last.view.buf);
+    batch.lastLength = static_cast<int64_t*>(lastLength.view.buf);
+    batch.width = last.dim(1);
+    batch.threshold = static_cast<const double*>(threshold.view.buf);
+    batch.coefficient = static_cast<const double*>(coefficient.view.buf);
+    batch.out = static_cast<double*>(out.view.buf);
+    batch.triggered = static_cast<uint8_t*>(triggered.view.buf);
+
+    Py_BEGIN_ALLOW_THREADS
+    correctDriftBatch(batch);
+    Py_END_ALLOW_THREADS
+
+    Py_RETURN_NONE;
+}
+
+PyMethodDef methods[] = {
+    {"correct_batch", correct_batch, METH_VARARGS,
+     "correct_batch(slots, values, lengths, last, last_len, threshold, coefficient, out, triggered)\n"
+     "Corrects a batch of samples in order, updating last/last_len in place."},
+    {nullptr, nullptr, 0, nullptr},
+};
+
+PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "antidrift_native", "Native batch backend for DriftEngine", -1, methods,
+};
+
+}  // namespace
+
+PyMODINIT_FUNC PyInit_antidrift_native() {
+    return PyModule_Create(&module);
+}
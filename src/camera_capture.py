@@ -0,0 +1,156 @@
+import cv2
+import threading
+import time
+import logging
+
+
+class LatestSlot:
+    """Ultimo valore pubblicato, con numero di sequenza.
+
+    Chi pubblica non aspetta mai chi legge: un valore non ancora letto viene
+    semplicemente sostituito dal successivo, così ogni stadio lavora sempre
+    sul dato più fresco.
+    """
+
+    def __init__(self):
+        self._latest = (0, None)
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def publish(self, value):
+        with self._condition:
+            seq = self._latest[0] + 1
+            self._latest = (seq, value)
+            self._condition.notify_all()
+        return seq
+
+    def latest(self):
+        """Restituisce (sequenza, valore) senza attendere"""
+        return self._latest
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Attende un valore con sequenza maggiore di seq; None se scade o è chiuso"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._latest[0] > seq or self.closed, timeout)
+            if self._latest[0] <= seq:
+                return None
+            return self._latest
+
+    def close(self):
+        """Sveglia chi è in attesa, ad esempio quando lo stadio si ferma"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class FrameCapture:
+    """Stadio di acquisizione: unico proprietario del VideoCapture.
+
+    Un thread dedicato legge i frame e pubblica l'ultimo come tupla
+    immutabile (sequenza, timestamp, frame). Tracking e anteprima leggono
+    da qui senza mai chiamare read() sul dispositivo, quindi non si rubano
+    i frame a vicenda e non bloccano l'acquisizione. Un frame pubblicato
+    non viene più modificato: ogni read() ne alloca uno nuovo.
+    Con un file video al posto della webcam, pace legge i frame alla
+    velocità del file e loop lo riavvolge alla fine (utile per i benchmark).
+    """
+
+    def __init__(self, source=0, width=None, height=None, fps=None, mjpg=True, buffer_size=1,
+                 pace=False, loop=False):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.mjpg = mjpg
+        self.buffer_size = buffer_size
+        self.pace = pace
+        self.loop = loop
+        self.camera = None
+        self.running = False
+        self.capture_thread = None
+        self._slot = LatestSlot()
+        self.frames_captured = 0
+        self.read_failures = 0
+
+    def open(self):
+        """Apre il dispositivo e applica le impostazioni a bassa latenza"""
+        self.camera = cv2.VideoCapture(self.source)
+        if not self.camera.isOpened():
+            logging.error(f"Impossibile aprire la webcam {self.source}")
+            self.camera = None
+            return False
+
+        # Un solo frame nel buffer del driver: si legge sempre il più recente
+        if self.buffer_size is not None:
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        if self.mjpg:
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        if self.width:
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.camera.set(cv2.CAP_PROP_FPS, self.fps)
+        return True
+
+    def start(self):
+        """Apre il dispositivo e avvia il thread di acquisizione"""
+        if not self.open():
+            return False
+        self.running = True
+        self.capture_thread = threading.Thread(target=self._capture_loop)
+        self.capture_thread.daemon = True
+        self.capture_thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.capture_thread:
+            self.capture_thread.join()
+        self.capture_thread = None
+        if self.camera:
+            self.camera.release()
+        self.camera = None
+        self._slot.close()
+
+    def _capture_loop(self):
+        """Loop di acquisizione: legge e pubblica l'ultimo frame"""
+        interval = 1.0 / (self.camera.get(cv2.CAP_PROP_FPS) or 30.0) if self.pace else 0.0
+        next_frame = time.monotonic()
+        while self.running:
+            ret, frame = self.camera.read()
+            if not ret:
+                if self.loop:
+                    self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                self.read_failures += 1
+                time.sleep(0.005)
+                continue
+            if interval:
+                next_frame += interval
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self._publish(frame, time.time())
+
+    def _publish(self, frame, timestamp):
+        self.frames_captured += 1
+        self._slot.publish((timestamp, frame))
+
+    def latest(self):
+        """Restituisce (sequenza, timestamp, frame) senza attendere"""
+        seq, value = self._slot.latest()
+        if value is None:
+            return (0, 0.0, None)
+        return (seq,) + value
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Attende un frame con sequenza maggiore di seq.
+
+        Restituisce None se entro il timeout non arriva nulla o se
+        l'acquisizione è stata fermata.
+        """
+        latest = self._slot.wait_newer(seq, timeout)
+        if latest is None:
+            return None
+        return (latest[0],) + latest[1]
@@ -0,0 +1,121 @@
+import glob
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def probe_camera(cam_id):
+    """Apre la webcam, legge un frame e restituisce {id, name} o None"""
+    import cv2
+    cap = cv2.VideoCapture(cam_id)
+    try:
+        if not cap.isOpened():
+            return None
+        ret, _ = cap.read()
+        if not ret:
+            return None
+        # Ottieni il nome della webcam se possibile
+        name = f"Camera {cam_id}"
+        try:
+            name = cap.getBackendName() + f" ({cam_id})"
+        except Exception:
+            pass
+        return {"id": cam_id, "name": name}
+    finally:
+        cap.release()
+
+
+class CameraDiscovery:
+    """Ricerca delle webcam parallela, con cache e aggiornamento incrementale.
+
+    I dispositivi vengono provati in parallelo e il risultato resta in cache
+    per `ttl` secondi. Dopo la prima ricerca get_cameras() risponde subito
+    dalla cache e, se serve, aggiorna in background solo i dispositivi
+    scaduti o comparsi da poco. Su Linux l'elenco viene da /dev/video*,
+    così i nodi aggiunti o rimossi si vedono senza riprovare tutto; altrove
+    si provano gli indici da 0 a max_index - 1. I dispositivi indicati come
+    occupati (ad esempio quello del CameraTracker attivo) non vengono mai
+    aperti.
+    """
+
+    def __init__(self, ttl=30.0, max_index=5, probe_timeout=5.0, workers=4):
+        self.ttl = ttl
+        self.max_index = max_index
+        self.probe_timeout = probe_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._cache = {}
+        self._probing = {}
+        self._lock = threading.Lock()
+        self.probes = 0
+
+    def _device_ids(self):
+        """Indici dei dispositivi video presenti"""
+        if sys.platform.startswith("linux"):
+            nodes = glob.glob("/dev/video*")
+            if nodes:
+                return sorted(int(m.group(1)) for m in
+                              (re.match(r"/dev/video(\d+)$", node) for node in nodes) if m)
+        return list(range(self.max_index))
+
+    def _probe(self, cam_id):
+        try:
+            info = probe_camera(cam_id)
+        except Exception:
+            info = None
+        with self._lock:
+            self._cache[cam_id] = (info, time.monotonic())
+            self._probing.pop(cam_id, None)
+            self.probes += 1
+        return info
+
+    def _schedule(self, cam_ids):
+        """Avvia le prove dei dispositivi non già in corso e restituisce i future"""
+        futures = []
+        with self._lock:
+            for cam_id in cam_ids:
+                future = self._probing.get(cam_id)
+                if future is None:
+                    future = self._executor.submit(self._probe, cam_id)
+                    self._probing[cam_id] = future
+                futures.append(future)
+        return futures
+
+    def get_cameras(self, busy=(), force=False):
+        """Elenco delle webcam; attende solo i dispositivi mai provati"""
+        busy = set(busy)
+        device_ids = self._device_ids()
+        now = time.monotonic()
+        with self._lock:
+            # Dispositivi scomparsi: via dalla cache
+            for cam_id in list(self._cache):
+                if cam_id not in device_ids and cam_id not in busy:
+                    del self._cache[cam_id]
+            unknown = [i for i in device_ids if i not in busy and i not in self._cache]
+            expired = [i for i in device_ids if i not in busy and i in self._cache
+                       and (force or now - self._cache[i][1] > self.ttl)]
+
+        # I nuovi dispositivi si attendono, quelli scaduti si aggiornano in background
+        if unknown:
+            wait(self._schedule(unknown), timeout=self.probe_timeout)
+        if expired:
+            futures = self._schedule(expired)
+            if force:
+                wait(futures, timeout=self.probe_timeout)
+
+        cameras = []
+        with self._lock:
+            for cam_id in sorted(set(device_ids) | busy):
+                if cam_id in busy:
+                    info = (self._cache.get(cam_id) or (None,))[0] or {"id": cam_id, "name": f"Camera {cam_id}"}
+                    cameras.append(dict(info, in_use=True))
+                    continue
+                info = (self._cache.get(cam_id) or (None,))[0]
+                if info is not None:
+                    cameras.append(info)
+        return cameras
+
+
+# Istanza condivisa da interfaccia web e camera_tracking: una sola cache e un solo pool
+DISCOVERY = CameraDiscovery()
@@ -0,0 +1,80 @@
+import time
+
+FIELDS = ("rotation", "position")
+
+
+def parse_mapping(text):
+    """Converte "1=hip,2=left_foot:position" in {tracker IMU: (tracker webcam, campo)}"""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        tracker_id, _, target = item.partition("=")
+        name, _, field = target.partition(":")
+        field = field or "rotation"
+        if not tracker_id or not name or field not in FIELDS:
+            raise ValueError(f"Associazione non valida: {item} (formato: id=tracker[:rotation|position])")
+        mapping[tracker_id] = (name, field)
+    return mapping
+
+
+class CameraReference:
+    """Usa le pose della webcam come riferimento senza drift per i tracker IMU.
+
+    La webcam è lenta e rumorosa ma non deriva; l'IMU è fluido ma deriva.
+    Per ogni tracker IMU associato a un tracker della webcam si stima
+    l'offset (webcam - IMU) con un filtro passa-basso, aggiornato solo
+    quando arriva una nuova posa visibile, e lo si somma a ogni campione
+    IMU. Per le rotazioni (gradi) le differenze sono riportate in
+    [-180, 180). Le pose più vecchie di max_age non aggiornano l'offset.
+    """
+
+    def __init__(self, mapping, gain=0.05, max_age=0.5):
+        self.mapping = dict(mapping)
+        self.gain = gain
+        self.max_age = max_age
+        # (tracker webcam, campo) -> (tempo del frame, valori)
+        self.latest = {}
+        self.offsets = {}
+        self._applied = {}
+        self.updates = 0
+
+    def update(self, frame_time, name, field, values):
+        """Registra l'ultimo valore visibile di un tracker della webcam"""
+        self.latest[(name, field)] = (frame_time, values)
+
+    def update_pose(self, frame_time, names, positions, rotations, visible):
+        """Registra una posa completa letta da PoseRing"""
+        latest = self.latest
+        for name, position, rotation, is_visible in zip(names, positions.tolist(), rotations.tolist(),
+                                                        visible.tolist()):
+            if is_visible:
+                latest[(name, "position")] = (frame_time, position)
+                latest[(name, "rotation")] = (frame_time, rotation)
+
+    def apply(self, tracker_id, values):
+        """Restituisce il campione IMU corretto con l'offset stimato dalla webcam"""
+        target = self.mapping.get(tracker_id)
+        if target is None:
+            return values
+        offset = self.offsets.get(tracker_id)
+        sample = self.latest.get(target)
+        if sample is not None and sample[0] != self._applied.get(tracker_id) \
+                and time.time() - sample[0] <= self.max_age:
+            self._applied[tracker_id] = sample[0]
+            offset = self._update_offset(offset, values, sample[1], target[1] == "rotation")
+            self.offsets[tracker_id] = offset
+            self.updates += 1
+        if offset is None:
+            return values
+        return [value + delta for value, delta in zip(values, offset)] + list(values[len(offset):])
+
+    def _update_offset(self, offset, values, camera, wrap):
+        count = min(len(values), len(camera))
+        if offset is None:
+            offset = [0.0] * count
+        updated = []
+        for i in range(count):
+            error = camera[i] - values[i] - offset[i]
+            if wrap:
+                error = (error + 180.0) % 360.0 - 180.0
+            updated.append(offset[i] + self.gain * error)
+        return updated
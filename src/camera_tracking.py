@@ -1,35 +1,85 @@
 import cv2 
 import numpy as np
 import mediapipe as mp
-from pythonosc import udp_client
 import threading
-import logging
+import time
+from collections import deque
+from osc_output import OSCOutput
+from camera_capture import FrameCapture, LatestSlot
+from camera_discovery import DISCOVERY
+from motion_gate import MotionGate
+from pose_solver import TRACKERS, PoseSolver
+from pose_ring import PoseSender
+from metrics import REGISTRY
 
-class CameraTracker:
-    def __init__(self):
+FRAMES = REGISTRY.counter("antidrift_camera_frames_total", "Frame elaborati dal tracking", ("camera",))
+FRAMES_DROPPED = REGISTRY.counter("antidrift_camera_frames_dropped_total",
+                                  "Frame saltati perché ne era già arrivato uno più recente", ("camera",))
+INFERENCES = REGISTRY.counter("antidrift_camera_inferences_total", "Inferenze MediaPipe eseguite", ("camera",))
+INFERENCE = REGISTRY.histogram("antidrift_camera_inference_seconds", "Durata di pose.process()", ("camera",))
+FRAME_LATENCY = REGISTRY.histogram("antidrift_camera_latency_seconds",
+                                   "Latenza dall'acquisizione del frame all'invio OSC", ("camera",))
+FPS = REGISTRY.gauge("antidrift_camera_fps", "Frame elaborati al secondo nell'ultimo secondo", ("camera",))
+
+class CameraTracker(PoseSender):
+    def __init__(self, output_bundles=False, capture_settings=None, pipelined=False,
+                 model_complexity=1, input_scale=1.0, adaptive=False, motion_settings=None,
+                 extrapolate=True, max_extrapolation=0.2, trackers=tuple(TRACKERS)):
         self.running = False
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            model_complexity=1,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.8
-        )
-        self.client = udp_client.SimpleUDPClient("127.0.0.1", 9002)
-        self.camera = None
+        self.model_complexity = model_complexity
+        self.pose = self._create_pose(model_complexity)
+        # Fattore di riduzione dell'immagine data a MediaPipe (1.0 = risoluzione piena)
+        self.input_scale = input_scale
+        self._requested_complexity = model_complexity
+        # In modalità pipeline preprocessing e inferenza girano in thread separati
+        self.pipelined = pipelined
+        self._preprocessed = None
+        self.preprocess_thread = None
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.latencies = deque(maxlen=300)
+        self.inference_times = deque(maxlen=300)
+        # In modalità adattiva l'inferenza viene saltata quando l'immagine è ferma
+        # Tracker virtuali calcolati dai landmark in un unico passaggio
+        self.solver = PoseSolver(trackers)
+        self.motion_gate = MotionGate(**(motion_settings or {})) if adaptive else None
+        self.extrapolate = extrapolate
+        self.max_extrapolation = max_extrapolation
+        self._last_trackers = None
+        self._previous_trackers = None
+        self.client = OSCOutput("127.0.0.1", 9002, bundles=output_bundles)
+        # Con un PoseRing le pose vanno al bridge in memoria condivisa invece che via OSC
+        self.pose_ring = None
+        # Impostazioni di acquisizione: width, height, fps, mjpg, buffer_size
+        self.capture_settings = capture_settings or {}
+        self.capture = None
         self.tracking_thread = None
+        # Ultimi landmark rilevati, usati per disegnare la preview
+        self.last_landmarks = None
+        self._metric_labels = ("",)
+        self._fps_window = (0.0, 0)
 
     def start_camera(self, camera_id=0):
         """Avvia il tracking della webcam"""
-        if self.camera is not None:
+        if self.capture is not None:
             self.stop_camera()
             
-        self.camera = cv2.VideoCapture(camera_id)
-        if not self.camera.isOpened():
-            logging.error(f"Impossibile aprire la webcam {camera_id}")
+        self.capture = FrameCapture(camera_id, **self.capture_settings)
+        if not self.capture.start():
+            self.capture = None
             return False
             
+        self._metric_labels = (str(camera_id),)
         self.running = True
-        self.tracking_thread = threading.Thread(target=self._tracking_loop)
+        if self.pipelined:
+            self._preprocessed = LatestSlot()
+            self.preprocess_thread = threading.Thread(target=self._preprocess_loop)
+            self.preprocess_thread.daemon = True
+            self.preprocess_thread.start()
+            self.tracking_thread = threading.Thread(target=self._inference_loop)
+        else:
+            self.tracking_thread = threading.Thread(target=self._tracking_loop)
         self.tracking_thread.daemon = True
         self.tracking_thread.start()
         return True
@@ -37,133 +87,199 @@ class CameraTracker:
     def stop_camera(self):
         """Ferma il tracking della webcam"""
         self.running = False
+        if self._preprocessed:
+            self._preprocessed.close()
+        if self.preprocess_thread:
+            self.preprocess_thread.join()
+        self.preprocess_thread = None
         if self.tracking_thread:
             self.tracking_thread.join()
-        if self.camera:
-            self.camera.release()
-        self.camera = None
+        if self.capture:
+            self.capture.stop()
+        self.capture = None
+
+    def _create_pose(self, model_complexity):
+        return self.mp_pose.Pose(
+            model_complexity=model_complexity,
+            min_detection_confidence=0.7,
+            min_tracking_confidence=0.8
+        )
+
+    def set_model_complexity(self, model_complexity):
+        """Cambia il modello MediaPipe (0, 1, 2); applicato al frame successivo"""
+        if model_complexity not in (0, 1, 2):
+            raise ValueError("model_complexity deve essere 0, 1 o 2")
+        self._requested_complexity = model_complexity
+
+    def set_input_scale(self, input_scale):
+        """Cambia la riduzione dell'immagine data all'inferenza (0 < scala <= 1)"""
+        if not 0 < input_scale <= 1:
+            raise ValueError("input_scale deve essere compreso tra 0 e 1")
+        self.input_scale = input_scale
+
+    def _next_frame(self, last_seq):
+        """Attende il frame più recente, contando quelli saltati"""
+        latest = self.capture.wait_newer(last_seq)
+        if latest is None:
+            return None
+        if last_seq and latest[0] - last_seq > 1:
+            self.frames_dropped += latest[0] - last_seq - 1
+            FRAMES_DROPPED.inc(self._metric_labels, latest[0] - last_seq - 1)
+        return latest
+
+    def _preprocess(self, frame):
+        """Riduce il frame e lo converte in RGB per MediaPipe"""
+        scale = self.input_scale
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
     def _tracking_loop(self):
-        """Loop principale per il tracking"""
+        """Loop principale per il tracking (acquisizione, preprocessing e inferenza in sequenza)"""
+        last_seq = 0
         while self.running:
-            ret, frame = self.camera.read()
-            if not ret:
+            # Elabora sempre il frame più recente pubblicato dall'acquisizione
+            latest = self._next_frame(last_seq)
+            if latest is None:
                 continue
+            last_seq, frame_time, frame = latest
+            self._process_frame(self._preprocess(frame), frame_time)
 
-            # Converti l'immagine in RGB per MediaPipe
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    def _preprocess_loop(self):
+        """Stadio di preprocessing della pipeline"""
+        last_seq = 0
+        while self.running:
+            latest = self._next_frame(last_seq)
+            if latest is None:
+                continue
+            last_seq, frame_time, frame = latest
+            self._preprocessed.publish((frame_time, self._preprocess(frame)))
+
+    def _inference_loop(self):
+        """Stadio di inferenza della pipeline: usa solo l'ultimo frame preprocessato"""
+        last_seq = 0
+        while self.running:
+            latest = self._preprocessed.wait_newer(last_seq)
+            if latest is None:
+                continue
+            if last_seq and latest[0] - last_seq > 1:
+                self.frames_dropped += latest[0] - last_seq - 1
+                FRAMES_DROPPED.inc(self._metric_labels, latest[0] - last_seq - 1)
+            last_seq, (frame_time, rgb_frame) = latest
+            self._process_frame(rgb_frame, frame_time)
+
+    def _process_frame(self, rgb_frame, frame_time):
+        """Inferenza, calcolo dei tracker e invio per un frame"""
+        if self._requested_complexity != self.model_complexity:
+            self.pose.close()
+            self.pose = self._create_pose(self._requested_complexity)
+            self.model_complexity = self._requested_complexity
+
+        if self.motion_gate is not None and not self.motion_gate.should_infer(rgb_frame, frame_time):
+            # Immagine ferma: niente inferenza, si inviano gli ultimi tracker (o la loro estrapolazione)
+            predicted = self._predict_trackers(frame_time)
+            if predicted:
+                self._send_tracking_data(predicted, frame_time)
+        else:
+            inference_start = time.perf_counter()
             results = self.pose.process(rgb_frame)
+            inference_time = time.perf_counter() - inference_start
+            self.inference_times.append(inference_time)
+            INFERENCES.inc(self._metric_labels)
+            INFERENCE.observe(inference_time, self._metric_labels)
+            self.last_landmarks = results.pose_landmarks
 
             if results.pose_landmarks:
-                # Estrai i dati rilevanti
-                landmarks = results.pose_landmarks.landmark
-                
-                # Calcola posizione dell'anca
-                hip_position = self._calculate_hip_position(landmarks)
-                
-                # Calcola posizione del torace
-                chest_position = self._calculate_chest_position(landmarks)
-                
-                # Calcola posizione dei piedi
-                left_foot = self._calculate_foot_position(landmarks, 'left')
-                right_foot = self._calculate_foot_position(landmarks, 'right')
+                # Tutti i tracker in un solo passaggio dai landmark
+                trackers = self.solver.solve_landmarks(results.pose_landmarks.landmark)
+                self._previous_trackers = self._last_trackers
+                self._last_trackers = (frame_time, trackers)
 
                 # Invia i dati tramite OSC
-                self._send_tracking_data({
-                    'hip': hip_position,
-                    'chest': chest_position,
-                    'left_foot': left_foot,
-                    'right_foot': right_foot
-                })
-
-    def _calculate_hip_position(self, landmarks):
-        """Calcola la posizione dell'anca"""
-        left_hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        right_hip = landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP.value]
-        
-        return {
-            'position': [
-                (left_hip.x + right_hip.x) / 2,
-                (left_hip.y + right_hip.y) / 2,
-                (left_hip.z + right_hip.z) / 2
-            ],
-            'rotation': [0, 0, 0],  # Rotazione base
-            'visible': left_hip.visibility > 0.5 and right_hip.visibility > 0.5
-        }
+                self._send_tracking_data(trackers, frame_time)
+            else:
+                self._previous_trackers = self._last_trackers = None
 
-    def _calculate_chest_position(self, landmarks):
-        """Calcola la posizione del torace"""
-        left_shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        right_shoulder = landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-        
-        return {
-            'position': [
-                (left_shoulder.x + right_shoulder.x) / 2,
-                (left_shoulder.y + right_shoulder.y) / 2,
-                (left_shoulder.z + right_shoulder.z) / 2
-            ],
-            'rotation': [0, 0, 0],  # Rotazione base
-            'visible': left_shoulder.visibility > 0.5 and right_shoulder.visibility > 0.5
-        }
+        # Latenza dall'acquisizione del frame all'invio
+        latency = time.time() - frame_time
+        self.latencies.append(latency)
+        self.frames_processed += 1
+        FRAME_LATENCY.observe(latency, self._metric_labels)
+        FRAMES.inc(self._metric_labels)
+        self._update_fps()
 
-    def _calculate_foot_position(self, landmarks, side):
-        """Calcola la posizione del piede (sinistro o destro)"""
-        if side == 'left':
-            ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-            heel = landmarks[self.mp_pose.PoseLandmark.LEFT_HEEL.value]
-        else:
-            ankle = landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE.value]
-            heel = landmarks[self.mp_pose.PoseLandmark.RIGHT_HEEL.value]
-        
-        return {
-            'position': [
-                (ankle.x + heel.x) / 2,
-                (ankle.y + heel.y) / 2,
-                (ankle.z + heel.z) / 2
-            ],
-            'rotation': [0, 0, 0],  # Rotazione base
-            'visible': ankle.visibility > 0.5 and heel.visibility > 0.5
-        }
+    def _update_fps(self):
+        """Aggiorna il gauge degli FPS una volta al secondo"""
+        window_start, frames = self._fps_window
+        now = time.monotonic()
+        frames += 1
+        if now - window_start >= 1.0:
+            if window_start:
+                FPS.set(frames / (now - window_start), self._metric_labels)
+            window_start, frames = now, 0
+        self._fps_window = (window_start, frames)
 
-    def _send_tracking_data(self, data):
-        """Invia i dati di tracking tramite OSC"""
-        for tracker_id, tracker_data in data.items():
-            if tracker_data['visible']:
-                # Invia posizione
-                self.client.send_message(
-                    f"/tracker/{tracker_id}/position",
-                    tracker_data['position']
-                )
-                # Invia rotazione
-                self.client.send_message(
-                    f"/tracker/{tracker_id}/rotation",
-                    tracker_data['rotation']
-                )
+    def _predict_trackers(self, frame_time):
+        """Ultimi tracker calcolati, estrapolati con la velocità delle ultime due inferenze"""
+        if self._last_trackers is None:
+            return None
+        last_time, last = self._last_trackers
+        if not self.extrapolate or self._previous_trackers is None:
+            return last
+        previous_time, previous = self._previous_trackers
+        span = last_time - previous_time
+        if span <= 0:
+            return last
+
+        # L'estrapolazione è limitata nel tempo per non far scappare i tracker
+        dt = min(frame_time - last_time, self.max_extrapolation)
+        predicted = {}
+        for tracker_id, tracker in last.items():
+            before = previous.get(tracker_id)
+            if before is None:
+                predicted[tracker_id] = tracker
+                continue
+            predicted[tracker_id] = dict(tracker, position=[
+                p + (p - q) / span * dt for p, q in zip(tracker['position'], before['position'])
+            ])
+        return predicted
+
+    def get_stats(self):
+        """Statistiche di latenza e frame elaborati/scartati"""
+        latencies = sorted(self.latencies)
+        inference = sorted(self.inference_times)
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000.0 if values else None
+
+        stats = {
+            'pipelined': self.pipelined,
+            'adaptive': self.motion_gate is not None,
+            'model_complexity': self.model_complexity,
+            'input_scale': self.input_scale,
+            'frames_captured': self.capture.frames_captured if self.capture else 0,
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.frames_dropped,
+            'latency_ms_p50': percentile(latencies, 0.5),
+            'latency_ms_p95': percentile(latencies, 0.95),
+            'inference_ms_p50': percentile(inference, 0.5)
+        }
+        if self.motion_gate is not None:
+            gate = self.motion_gate
+            mean_inference = sum(self.inference_times) / len(self.inference_times) if self.inference_times else 0.0
+            stats.update({
+                'inferences': gate.inferences,
+                'inferences_skipped': gate.skipped,
+                'inference_rate': gate.inferences / max(1, gate.inferences + gate.skipped),
+                # Stima: inferenze saltate per il tempo medio di un'inferenza
+                'cpu_saved_s': gate.skipped * mean_inference,
+                'motion': gate.last_motion
+            })
+        return stats
 
 def get_available_cameras():
-    """Trova tutte le webcam disponibili"""
-    available_cameras = []
-    
-    def test_camera(cam_id):
-        cap = cv2.VideoCapture(cam_id)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                # Ottieni il nome della webcam se possibile
-                name = f"Camera {cam_id}"
-                try:
-                    name = cap.getBackendName() + f" ({cam_id})"
-                except:
-                    pass
-                available_cameras.append({"id": cam_id, "name": name})
-            cap.release()
-        return False
-    
-    # Testa le prime 5 webcam
-    for i in range(5):
-        test_camera(i)
-    
-    return available_cameras
+    """Trova tutte le webcam disponibili, provandole in parallelo; i risultati restano in cache"""
+    return DISCOVERY.get_cameras()
 
 def select_camera():
     """Trova la prima webcam disponibile"""
@@ -171,8 +287,21 @@ def select_camera():
     return cameras[0]["id"] if cameras else 0
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Tracking da webcam")
+    parser.add_argument("--bridge", metavar="IP",
+                        help="Bridge su un'altra macchina: invia le pose via OSC alla sua porta 12345")
+    args = parser.parse_args()
+
     camera_id = select_camera()
     tracker = CameraTracker()
+    if args.bridge:
+        tracker.client = OSCOutput(args.bridge, 12345)
+        print(f"Pose inviate via OSC al bridge su {args.bridge}:12345")
+    elif tracker.connect_pose_ring():
+        print("Pose inviate al bridge in memoria condivisa")
+    else:
+        print("Bridge non trovato: pose inviate direttamente a SlimeVR (porta 9002)")
     tracker.start_camera(camera_id)
     
     try:
@@ -0,0 +1,344 @@
+import threading
+import numpy as np
+
+from drift_window import DriftWindow
+
+try:
+    # Backend nativo opzionale, compilato con setup_native.py
+    import antidrift_native
+except ImportError:
+    antidrift_native = None
+
+BACKENDS = ("python", "native")
+
+
+def is_numeric(sample):
+    """True se tutti i valori del campione sono numeri (OSC può portare anche stringhe e blob)"""
+    return all(isinstance(value, (int, float)) for value in sample)
+
+
+class DriftEngine:
+    """Correzione del drift vettorizzata per molti tracker.
+
+    Ogni tracker occupa uno slot fisso in array NumPy contigui (ultimo valore,
+    riferimento e parametri), così tutti i campioni ricevuti in un tick si
+    correggono con un'unica operazione vettoriale in correct_many().
+    Soglie e coefficienti stanno in una tupla immutabile (params) che viene
+    sostituita per intero: ogni correzione legge una coppia coerente senza
+    prendere lock.
+    Con backend="native" la correzione gira nel modulo C++ antidrift_native
+    sugli stessi array, senza GIL e con lo stesso risultato.
+    Con window > 0 il drift non è più il salto rispetto al campione
+    precedente ma l'andamento lineare sugli ultimi `window` campioni
+    (DriftWindow), calcolato in tempo costante; questo rilevamento gira
+    sempre in NumPy.
+    """
+
+    def __init__(self, drift_threshold=5.0, filter_coefficient=0.85, capacity=8, width=4, backend="python",
+                 window=0):
+        self.drift_threshold = drift_threshold
+        self.filter_coefficient = filter_coefficient
+        self.slots = {}
+        self.ids = []
+        # Slot liberati da release(), riassegnati prima di far crescere gli array
+        self._free = []
+        self._lock = threading.Lock()
+        self.last = np.zeros((capacity, width))
+        self.last_len = np.zeros(capacity, dtype=np.intp)
+        self.reference = np.zeros((capacity, width))
+        self.reference_len = np.zeros(capacity, dtype=np.intp)
+        self.params = (np.full(capacity, float(drift_threshold)),
+                       np.full(capacity, float(filter_coefficient)))
+        # Quante volte la correzione è scattata per ogni slot (lista: incremento più economico)
+        self.triggers = []
+        self._cols = np.arange(width)
+        self.backend = "python"
+        self.set_backend(backend)
+        self.window = None
+        self.set_window(window)
+
+    def set_backend(self, backend):
+        """Sceglie il backend di correzione; vale dal tick successivo"""
+        if backend not in BACKENDS:
+            raise ValueError(f"backend sconosciuto: {backend}")
+        if backend == "native" and antidrift_native is None:
+            raise RuntimeError("backend nativo non disponibile: compilalo con python setup_native.py build_ext --inplace")
+        self.backend = backend
+
+    def set_window(self, window):
+        """Imposta la lunghezza della finestra di rilevamento (0 = salto tra campioni consecutivi)"""
+        window = int(window)
+        if window < 0 or window == 1:
+            raise ValueError("window deve essere 0 oppure almeno 2")
+        with self._lock:
+            if window == 0:
+                self.window = None
+            elif self.window is None or self.window.length != window:
+                self.window = DriftWindow(window, self.capacity, self.width)
+
+    @property
+    def window_length(self):
+        return 0 if self.window is None else self.window.length
+
+    @property
+    def threshold(self):
+        return self.params[0]
+
+    @property
+    def coefficient(self):
+        return self.params[1]
+
+    @property
+    def capacity(self):
+        return self.last.shape[0]
+
+    @property
+    def width(self):
+        return self.last.shape[1]
+
+    def slot(self, tracker_id):
+        """Restituisce lo slot del tracker, allocandolo al primo utilizzo"""
+        slot = self.slots.get(tracker_id)
+        if slot is None:
+            with self._lock:
+                slot = self.slots.get(tracker_id)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                        self.ids[slot] = tracker_id
+                        self.triggers[slot] = 0
+                    else:
+                        slot = len(self.ids)
+                        if slot >= self.capacity:
+                            self._resize(rows=self.capacity * 2)
+                        self.ids.append(tracker_id)
+                        self.triggers.append(0)
+                    self.threshold[slot] = self.drift_threshold
+                    self.coefficient[slot] = self.filter_coefficient
+                    self.slots[tracker_id] = slot
+        return slot
+
+    def _resize(self, rows=None, cols=None):
+        rows = rows or self.capacity
+        cols = cols or self.width
+        for name in ("last", "reference"):
+            old = getattr(self, name)
+            new = np.zeros((rows, cols))
+            new[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, new)
+        self._cols = np.arange(cols)
+        for name in ("last_len", "reference_len"):
+            old = getattr(self, name)
+            new = np.zeros(rows, dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+        params = []
+        for old in self.params:
+            new = np.zeros(rows)
+            new[:old.shape[0]] = old
+            params.append(new)
+        self.params = tuple(params)
+        if self.window is not None:
+            self.window.resize(rows, cols)
+
+    def _pack(self, samples):
+        """Converte i campioni in una matrice (n, k) più le lunghezze di ogni riga"""
+        try:
+            values = np.array(samples, dtype=float)
+        except ValueError:
+            values = None
+        if values is not None and values.ndim == 2:
+            lengths = np.full(len(values), values.shape[1], dtype=np.intp)
+        else:
+            # Campioni di lunghezza diversa: righe completate con zeri
+            lengths = np.fromiter((len(s) for s in samples), dtype=np.intp, count=len(samples))
+            values = np.zeros((len(samples), int(lengths.max()) if len(samples) else 0))
+            for row, sample in enumerate(samples):
+                values[row, :len(sample)] = sample
+        if values.shape[1] > self.width:
+            with self._lock:
+                if values.shape[1] > self.width:
+                    self._resize(cols=values.shape[1])
+        return values, lengths
+
+    def correct_many(self, ids, samples):
+        """Corregge tutti i campioni di un tick.
+
+        Restituisce una matrice (n, lunghezza massima); le righe più corte
+        sono completate con zeri. Campioni ripetuti dello stesso tracker
+        vengono applicati in ordine, come se arrivassero uno dopo l'altro.
+        """
+        slots = [self.slots.get(i) for i in ids]
+        if None in slots:
+            slots = [self.slot(i) for i in ids]
+        values, lengths = self._pack(samples)
+        if self.backend == "native" and self.window is None:
+            return self._correct_native(slots, values, lengths)
+        if len(set(slots)) == len(slots):
+            return self._correct_unique(slots, values, lengths)
+
+        # Slot duplicati nello stesso tick: un passaggio per ogni occorrenza
+        out = np.empty_like(values)
+        rounds = np.empty(len(slots), dtype=np.intp)
+        seen = {}
+        for row, slot in enumerate(slots):
+            rounds[row] = seen[slot] = seen.get(slot, -1) + 1
+        slots = np.array(slots, dtype=np.intp)
+        for r in range(int(rounds.max()) + 1):
+            rows = np.flatnonzero(rounds == r)
+            out[rows] = self._correct_unique(slots[rows], values[rows], lengths[rows])
+        return out
+
+    def _correct_unique(self, slot_list, values, lengths):
+        slots = np.asarray(slot_list, dtype=np.intp)
+        threshold, coefficient = self.params
+        k = values.shape[1]
+        last = self.last[slots, :k]
+        last_len = self.last_len[slots]
+        cols = self._cols[:k]
+
+        window = self.window
+        if window is None:
+            # Il drift si misura solo sulle componenti presenti in entrambi i campioni
+            common = cols < np.minimum(lengths, last_len)[:, None]
+            drift = (np.abs(values - last) * common).max(axis=1, initial=0.0)
+        else:
+            trend = window.update(slots, values)
+            drift = (trend * (cols < lengths[:, None])).max(axis=1, initial=0.0)
+        trigger = drift > threshold[slots]
+
+        # Filtro di Kalman semplificato dove il drift supera la soglia
+        corrected = values
+        if trigger.any():
+            for slot, hit in zip(slot_list, trigger.tolist()):
+                if hit:
+                    self.triggers[slot] += 1
+            coefficient = coefficient[slots][:, None]
+            blended = coefficient * values + (1 - coefficient) * last
+            corrected = np.where(trigger[:, None] & (cols < last_len[:, None]), blended, values)
+
+        self.last[slots, :k] = corrected
+        self.last_len[slots] = lengths
+        return corrected
+
+    def _correct_native(self, slot_list, values, lengths):
+        # Il modulo nativo gestisce da solo gli slot ripetuti, riga per riga
+        threshold, coefficient = self.params
+        out = np.empty_like(values)
+        triggered = np.zeros(len(slot_list), dtype=np.uint8)
+        antidrift_native.correct_batch(np.array(slot_list, dtype=np.int64), values,
+                                       lengths.astype(np.int64, copy=False), self.last, self.last_len,
+                                       threshold, coefficient, out, triggered)
+        if triggered.any():
+            for slot, hit in zip(slot_list, triggered.tolist()):
+                if hit:
+                    self.triggers[slot] += 1
+        return out
+
+    def correct(self, tracker_id, sample):
+        """Corregge un singolo campione e lo restituisce come lista.
+
+        È il percorso di ogni messaggio con l'ingresso threading: senza
+        finestra lavora in Python sulla riga dello slot, senza passare
+        dalle matrici di correct_many(), con lo stesso risultato.
+        """
+        if self.window is not None:
+            return self.correct_many((tracker_id,), (sample,))[0, :len(sample)].tolist()
+        slot = self.slots.get(tracker_id)
+        if slot is None:
+            slot = self.slot(tracker_id)
+        n = len(sample)
+        if n > self.width:
+            with self._lock:
+                if n > self.width:
+                    self._resize(cols=n)
+        threshold, coefficient = self.params
+        row = self.last[slot]
+        last = row[:self.last_len[slot]].tolist()
+        corrected = [float(value) for value in sample]
+        # Il drift si misura solo sulle componenti presenti in entrambi i campioni
+        if last and max([abs(c - l) for c, l in zip(corrected, last)], default=0.0) > threshold[slot]:
+            self.triggers[slot] += 1
+            k = float(coefficient[slot])
+            blended = [k * c + (1 - k) * l for c, l in zip(corrected, last)]
+            corrected = blended + corrected[len(blended):]
+        row[:n] = corrected
+        self.last_len[slot] = n
+        return corrected
+
+    def trigger_counts(self):
+        """Numero di correzioni scattate per tracker"""
+        return {tracker_id: count for tracker_id, count in zip(self.ids, self.triggers)
+                if tracker_id is not None}
+
+    def clear(self, tracker_ids):
+        """Dimentica ultimi valori, riferimenti e finestra dei tracker indicati"""
+        slots = [self.slots[i] for i in tracker_ids if i in self.slots]
+        self.last_len[slots] = 0
+        self.reference_len[slots] = 0
+        if self.window is not None:
+            self.window.clear(slots)
+        return slots
+
+    def release(self, tracker_ids):
+        """Libera gli slot dei tracker indicati, che verranno riassegnati ad altri"""
+        with self._lock:
+            for slot in self.clear(tracker_ids):
+                del self.slots[self.ids[slot]]
+                self.ids[slot] = None
+                self.triggers[slot] = 0
+                self._free.append(slot)
+
+    def set_reference(self, tracker_id, sample):
+        """Memorizza la posizione di riferimento del tracker"""
+        slot = self.slot(tracker_id)
+        values, lengths = self._pack((sample,))
+        self.reference[slot] = 0.0
+        self.reference[slot, :lengths[0]] = values[0, :lengths[0]]
+        self.reference_len[slot] = lengths[0]
+
+    def window_stats(self, tracker_id):
+        """Media, varianza e pendenza per campione sulla finestra del tracker, o None"""
+        slot = self.slots.get(tracker_id)
+        window = self.window
+        if slot is None or window is None or window.count[slot] == 0:
+            return None
+        mean, variance, slope = window.stats(slot)
+        return {'mean': mean.tolist(), 'variance': variance.tolist(), 'slope': slope.tolist()}
+
+    def get_reference(self, tracker_id):
+        slot = self.slots.get(tracker_id)
+        if slot is None or self.reference_len[slot] == 0:
+            return None
+        return self.reference[slot, :self.reference_len[slot]].tolist()
+
+    def set_parameters(self, drift_threshold=None, filter_coefficient=None):
+        """Aggiorna i parametri di tutti gli slot e quelli dei nuovi tracker"""
+        with self._lock:
+            threshold, coefficient = self.params
+            if drift_threshold is not None:
+                self.drift_threshold = drift_threshold
+                threshold = np.full_like(threshold, drift_threshold)
+            if filter_coefficient is not None:
+                self.filter_coefficient = filter_coefficient
+                coefficient = np.full_like(coefficient, filter_coefficient)
+            self.params = (threshold, coefficient)
+
+    def fresh(self):
+        """Nuovo motore con stessi slot, parametri e contatori, senza ultimi valori né riferimenti"""
+        with self._lock:
+            engine = DriftEngine(self.drift_threshold, self.filter_coefficient, self.capacity, self.width,
+                                 self.backend, self.window_length)
+            engine.slots = dict(self.slots)
+            engine.ids = list(self.ids)
+            engine._free = list(self._free)
+            engine.triggers = list(self.triggers)
+            engine.params = (self.params[0].copy(), self.params[1].copy())
+        return engine
+
+    def reset(self):
+        """Dimentica ultimi valori e riferimenti, mantenendo gli slot assegnati"""
+        self.last_len[:] = 0
+        self.reference_len[:] = 0
+        if self.window is not None:
+            self.window = DriftWindow(self.window.length, self.capacity, self.width)
@@ -0,0 +1,121 @@
+import numpy as np
+
+# Quota minima della varianza spiegata dalla retta (R²) perché un andamento
+# conti come drift: le oscillazioni e i pacchetti rumorosi non la raggiungono
+MIN_TREND_FIT = 0.5
+
+# Righe di DriftWindow.state
+MEAN, M2, SXY = range(3)
+
+
+class DriftWindow:
+    """Statistiche mobili degli ultimi `length` campioni di ogni slot.
+
+    Ogni slot ha un ring buffer preallocato (length x width) e tre somme
+    aggiornate a ogni campione in tempo costante: media e M2 (varianza)
+    con l'aggiornamento di Welford per finestra scorrevole, più la somma
+    di j * x (j = posizione nella finestra) per la pendenza ai minimi
+    quadrati. Quando il ring di uno slot ricomincia da capo le somme
+    vengono ricalcolate dal buffer, così gli errori di arrotondamento non
+    si accumulano (costo ammortizzato costante).
+    """
+
+    def __init__(self, length, capacity=8, width=4):
+        if length < 2:
+            raise ValueError("la finestra deve contenere almeno 2 campioni")
+        self.length = length
+        self.buffer = np.zeros((capacity, length, width))
+        self.count = np.zeros(capacity, dtype=np.intp)
+        self.head = np.zeros(capacity, dtype=np.intp)
+        self.state = np.zeros((capacity, 3, width))
+        self._positions = np.arange(length, dtype=float)[:, None]
+        # Con la finestra piena n è costante e lo sono anche i termini della retta
+        self._sum_j = length * (length - 1) / 2.0
+        self._sjj = length * (length * length - 1) / 12.0
+
+    def resize(self, rows, cols):
+        """Adatta gli array a nuovi slot o campioni più lunghi, mantenendo le statistiche"""
+        for name in ("buffer", "state"):
+            old = getattr(self, name)
+            new = np.zeros((rows,) + old.shape[1:-1] + (cols,))
+            new[:old.shape[0], ..., :old.shape[-1]] = old
+            setattr(self, name, new)
+        for name in ("count", "head"):
+            old = getattr(self, name)
+            new = np.zeros(rows, dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+
+    def clear(self, slots):
+        """Svuota la finestra degli slot indicati"""
+        self.count[slots] = 0
+        self.head[slots] = 0
+        self.state[slots] = 0.0
+
+    def update(self, slots, values):
+        """Aggiunge un campione per slot (slot tutti diversi) e restituisce il drift per componente.
+
+        Il drift è lo spostamento attribuito all'andamento lineare sulla
+        finestra (pendenza x campioni), 0 dove la retta spiega meno di
+        MIN_TREND_FIT della varianza o ci sono meno di 2 campioni.
+        """
+        k = values.shape[1]
+        length = self.length
+        head = self.head[slots]
+        n_old = self.count[slots]
+        state = self.state[slots, :, :k]
+        x_old = self.buffer[slots, head, :k]
+        self.buffer[slots, head, :k] = values
+        mean_old = state[:, MEAN].copy()
+
+        if n_old.min() == length:
+            # Caso a regime: esce il campione più vecchio ed entra il nuovo
+            delta = values - x_old
+            mean = mean_old + delta / length
+            state[:, M2] += delta * (values - mean + x_old - mean_old)
+            state[:, SXY] += (length - 1) * values + x_old - mean_old * length
+            n = length
+        else:
+            full = (n_old == length)[:, None]
+            n = np.minimum(n_old + 1, length)
+            self.count[slots] = n
+            n = n[:, None]
+            n_old = n_old[:, None]
+            mean = np.where(full, mean_old + (values - x_old) / length, mean_old + (values - mean_old) / n)
+            state[:, M2] += np.where(full, (values - x_old) * (values - mean + x_old - mean_old),
+                                     (values - mean_old) * (values - mean))
+            state[:, SXY] += np.where(full, (length - 1) * values + x_old - mean_old * length, n_old * values)
+        state[:, MEAN] = mean
+
+        head += 1
+        head[head == length] = 0
+        self.head[slots] = head
+        if not head.all():
+            # Ring appena completato: il buffer è in ordine, somme esatte da capo
+            wrapped = np.flatnonzero(head == 0)
+            window = self.buffer[slots[wrapped], :, :k]
+            mean_w = window.mean(axis=1)
+            state[wrapped, MEAN] = mean_w
+            state[wrapped, M2] = ((window - mean_w[:, None, :]) ** 2).sum(axis=1)
+            state[wrapped, SXY] = (window * self._positions).sum(axis=1)
+        self.state[slots, :, :k] = state
+        return self._drift(state, n)
+
+    def _drift(self, state, n):
+        if isinstance(n, int):
+            sum_j, sjj = self._sum_j, self._sjj
+        else:
+            sum_j, sjj = n * (n - 1) / 2.0, n * (n * n - 1) / 12.0
+        # Pendenza ai minimi quadrati su j = 0..n-1 e varianza spiegata dalla retta
+        slope = (state[:, SXY] - state[:, MEAN] * sum_j) / np.where(sjj > 0, sjj, 1.0)
+        explained = slope * slope * sjj
+        fit = explained >= MIN_TREND_FIT * state[:, M2]
+        return np.where(fit & (sjj > 0), np.abs(slope) * (n - 1), 0.0)
+
+    def stats(self, slot):
+        """Media, varianza e pendenza per campione correnti di uno slot"""
+        n = int(self.count[slot])
+        mean, m2, sxy = self.state[slot]
+        sjj = n * (n * n - 1) / 12.0
+        slope = (sxy - mean * n * (n - 1) / 2.0) / sjj if n >= 2 else np.zeros_like(mean)
+        return mean, np.maximum(m2, 0.0) / max(n - 1, 1), slope
@@ -0,0 +1,156 @@
+import bisect
+import time
+
+from output_scheduler import OutputScheduler
+
+# Oltre questo intervallo senza campioni il tracker resta fermo sull'ultimo valore
+MAX_EXTRAPOLATION = 0.1
+# Campioni più vicini di così non danno una velocità affidabile
+MIN_VELOCITY_SPAN = 0.001
+# Di quanto al secondo può crescere la stima dell'offset tra gli orologi
+OFFSET_RELAX = 0.002
+# Peso di ogni nuovo intervallo nella media degli intervalli di arrivo
+INTERVAL_SMOOTHING = 0.05
+
+
+class _Track:
+    """Campioni in attesa di un tracker, ordinati per tempo sull'orologio locale"""
+
+    __slots__ = ("times", "values", "offset", "played", "received", "interval")
+
+    def __init__(self, now):
+        self.times = []
+        self.values = []
+        self.offset = None
+        self.played = float("-inf")
+        self.received = now
+        self.interval = 0.0
+
+
+class JitterBuffer(OutputScheduler):
+    """Invio a frequenza fissa con un buffer anti-jitter per tracker.
+
+    I campioni vengono ordinati per tempo del mittente (timetag del bundle
+    OSC) o, se manca, per tempo di arrivo. Il tempo del mittente è
+    riportato sull'orologio locale con l'offset minimo osservato
+    (arrivo - invio), cioè quello del pacchetto più veloce, lasciato
+    crescere di OFFSET_RELAX al secondo per seguire la deriva degli orologi.
+    A ogni tick si riproduce l'istante now - target_delay: tra due campioni
+    si interpola, dopo l'ultimo si estrapola con la velocità degli ultimi
+    due per al massimo max_extrapolation secondi, poi si tiene l'ultimo
+    valore. Con target_delay 0 non si aggiunge ritardo e i buchi vengono
+    coperti solo dall'estrapolazione. Un campione più vecchio del punto già
+    riprodotto e dell'ultimo ricevuto arriva tardi e viene scartato.
+    clock permette di simulare il tempo (benchmarks/bench_jitter.py).
+    """
+
+    def __init__(self, output, rate=120.0, target_delay=0.02, max_extrapolation=MAX_EXTRAPOLATION,
+                 stale_after=1.0, capacity=64, clock=time.monotonic):
+        super().__init__(output, rate, stale_after)
+        self.clock = clock
+        self.target_delay = target_delay
+        self.max_extrapolation = max_extrapolation
+        self.capacity = capacity
+        self._tracks = {}
+        self.late_dropped = 0
+        self.interpolated = 0
+        self.extrapolated = 0
+        self.held = 0
+
+    def submit(self, tracker_id, values, sender_time=None):
+        """Inserisce un campione al suo posto nel buffer del tracker"""
+        now = self.clock()
+        with self._lock:
+            track = self._tracks.get(tracker_id)
+            if track is None:
+                track = self._tracks[tracker_id] = _Track(now)
+            if sender_time is None:
+                sample_time = now
+                track.interval += INTERVAL_SMOOTHING * (now - track.received - track.interval)
+            else:
+                offset = now - sender_time
+                if track.offset is not None:
+                    offset = min(offset, track.offset + OFFSET_RELAX * (now - track.received))
+                track.offset = offset
+                sample_time = sender_time + offset
+            track.received = now
+            self.samples_in += 1
+            times = track.times
+            if sample_time <= track.played and (not times or sample_time <= times[-1]):
+                self.late_dropped += 1
+                return
+            if not times or sample_time >= times[-1]:
+                times.append(sample_time)
+                track.values.append(values)
+            else:
+                index = bisect.bisect_right(times, sample_time)
+                times.insert(index, sample_time)
+                track.values.insert(index, values)
+            if len(times) > self.capacity:
+                del times[0]
+                del track.values[0]
+                self.samples_dropped += 1
+
+    def tick(self):
+        """Invia per ogni tracker il valore all'istante now - target_delay"""
+        now = self.clock()
+        play = now - self.target_delay
+        with self._lock:
+            tracks = self._tracks
+            for tracker_id, track in list(tracks.items()):
+                if now - track.received > self.stale_after:
+                    del tracks[tracker_id]
+                    continue
+                values = self._value_at(track, play)
+                if values is None:
+                    continue
+                self.output.queue_tracker(tracker_id, values)
+                self.updates_sent += 1
+        self.output.flush()
+        self.ticks += 1
+
+    def _value_at(self, track, play):
+        times, samples = track.times, track.values
+        index = bisect.bisect_right(times, play)
+        if index == 0:
+            return None  # solo campioni futuri: si aspetta che diventino riproducibili
+        if index > 2:
+            # Servono solo i due campioni precedenti (per la velocità) e i successivi
+            del times[:index - 2]
+            del samples[:index - 2]
+            index = 2
+        track.played = play
+        t0, v0 = times[index - 1], samples[index - 1]
+        if index < len(times):
+            t1, v1 = times[index], samples[index]
+            a = (play - t0) / (t1 - t0)
+            self.interpolated += 1
+            return [x0 + (x1 - x0) * a for x0, x1 in zip(v0, v1)] + list(v0[len(v1):])
+        if index >= 2 and play - t0 <= self.max_extrapolation:
+            tp, vp = times[index - 2], samples[index - 2]
+            span = t0 - tp
+            if track.offset is None:
+                # Senza timetag i campioni ravvicinati dal jitter darebbero velocità gonfiate:
+                # si usa almeno l'intervallo medio di arrivo, che in media è quello di invio
+                span = max(span, track.interval)
+            if span >= MIN_VELOCITY_SPAN:
+                a = (play - t0) / span
+                self.extrapolated += 1
+                return [x0 + (x0 - xp) * a for xp, x0 in zip(vp, v0)] + list(v0[len(vp):])
+        self.held += 1
+        return list(v0)
+
+    def stats(self):
+        """Contatori e frazioni degli aggiornamenti inviati per tipo"""
+        sent = max(self.updates_sent, 1)
+        received = max(self.samples_in, 1)
+        return {
+            'target_delay': self.target_delay,
+            'samples_in': self.samples_in,
+            'updates_sent': self.updates_sent,
+            'late_dropped': self.late_dropped,
+            'late_rate': self.late_dropped / received,
+            'interpolated_rate': self.interpolated / sent,
+            'extrapolated_rate': self.extrapolated / sent,
+            'held_rate': self.held / sent,
+        }
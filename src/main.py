@@ -1,10 +1,14 @@
+import argparse
 import threading
 import sys
 import os
 import socket
 from osc_bridge import AntiDriftBridge
-from web_interface import run_web_interface
-from pythonosc import osc_server
+from drift_engine import BACKENDS
+from camera_reference import parse_mapping
+from osc_ingest import INGEST_MODES, create_ingest_server
+from osc_output import OUTPUT_MODES, OSCOutput
+from osc_recorder import OSCRecorder
 from pythonosc import dispatcher
 
 def get_local_ip():
@@ -21,7 +25,160 @@ def get_local_ip():
     except Exception:
         return "Non trovato"
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="SlimeVR Anti-Drift System")
+    parser.add_argument("--ingest", choices=INGEST_MODES, default=None,
+                        help="Server OSC di ingresso: un thread per pacchetto (default) o loop asyncio singolo")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="messages",
+                        help="Uscita verso SlimeVR: un messaggio per tracker o un bundle per tick/frame")
+    parser.add_argument("--output-rate", type=float, default=0,
+                        help="Frequenza fissa di invio in Hz (es. 90, 120, 144); 0 = invia a ogni pacchetto")
+    parser.add_argument("--record", metavar="FILE",
+                        help="Registra i messaggi in ingresso e in uscita per riprodurli con osc_recorder.py")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Calibra subito all'avvio invece di aspettare il pulsante Calibra")
+    parser.add_argument("--preload-camera", action="store_true",
+                        help="Carica OpenCV e MediaPipe in background dopo l'avvio del bridge")
+    parser.add_argument("--backend", choices=BACKENDS, default="python",
+                        help="Correzione del drift in NumPy o nel modulo C++ antidrift_native")
+    parser.add_argument("--no-pose-ring", action="store_true",
+                        help="La webcam invia direttamente a SlimeVR via OSC invece che al bridge in memoria condivisa")
+    parser.add_argument("--camera-reference", metavar="ID=TRACKER,...",
+                        help="Usa i tracker della webcam come riferimento per i tracker IMU, es. 1=hip,2=chest")
+    parser.add_argument("--drift-window", type=int, default=0,
+                        help="Campioni su cui misurare l'andamento del drift; 0 = confronto con il campione precedente")
+    parser.add_argument("--jitter-delay", type=float, default=None, metavar="MS",
+                        help="Buffer anti-jitter con questo ritardo in ms (0 = solo estrapolazione); "
+                             "ordina per timetag dei bundle con --ingest asyncio")
+    parser.add_argument("--sessions", action="store_true",
+                        help="Più utenti sullo stesso bridge: ogni telefono (ip, porta) ha calibrazione e uscita proprie")
+    parser.add_argument("--route", metavar="IP=HOST:PORTA,...",
+                        help="Con --sessions o --workers, invia i tracker di un telefono a un altro router SlimeVR")
+    parser.add_argument("--session-timeout", type=float, default=None,
+                        help="Con --sessions o --workers, secondi di inattività dopo cui una sessione viene chiusa "
+                             "(default 30)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processi del bridge; con più di 1 ogni telefono viene servito da un processo")
+    parser.add_argument("--shard-mode", choices=("reuseport", "dispatcher"), default=None,
+                        help="Come distribuire i telefoni tra i processi (default: reuseport su Linux)")
+    return parser.parse_args()
+
+def start_web_interface(bundles, bridge):
+    """Importa Flask e l'interfaccia web solo dopo l'avvio del bridge"""
+    from web_interface import run_web_interface
+    run_web_interface(bundles=bundles, anti_drift_bridge=bridge)
+
+def preload_camera():
+    """Carica OpenCV e MediaPipe in background, così il primo avvio della webcam è immediato"""
+    import camera_tracking
+
+def jitter_delay(args):
+    """--jitter-delay in secondi, o None se il buffer anti-jitter è spento"""
+    return None if args.jitter_delay is None else args.jitter_delay / 1000.0
+
+def session_timeout(args):
+    """--session-timeout, o il default di SessionBridge se non è stato dato"""
+    from session_bridge import IDLE_TIMEOUT
+    return IDLE_TIMEOUT if args.session_timeout is None else args.session_timeout
+
+def start_bridge(args, port, bundles):
+    """Bridge in un solo processo, con il server OSC in un thread"""
+    if args.route or args.session_timeout is not None:
+        # Senza sessioni c'è una sola uscita e nessuna sessione da chiudere
+        sys.exit("--route e --session-timeout richiedono --sessions o --workers maggiore di 1")
+    bridge = AntiDriftBridge(output=OSCOutput("127.0.0.1", 9002, bundles=bundles),
+                             output_rate=args.output_rate, backend=args.backend, drift_window=args.drift_window,
+                             jitter_delay=jitter_delay(args))
+    if args.record:
+        bridge.record_to(OSCRecorder(args.record))
+    if not args.no_pose_ring:
+        bridge.open_pose_ring()
+    if args.camera_reference:
+        bridge.set_camera_reference(parse_mapping(args.camera_reference))
+    
+    # Configurazione server OSC
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data)
+    
+    # Avvia il server OSC in un thread separato
+    server = create_ingest_server(args.ingest, ("0.0.0.0", port), disp,
+                                  on_batch_start=bridge.begin_tick, on_batch_end=bridge.end_tick,
+                                  on_message_time=bridge.set_sender_time)
+    osc_thread = threading.Thread(target=server.serve_forever)
+    osc_thread.daemon = True
+    osc_thread.start()
+    if args.calibrate:
+        bridge.calibrate()
+    
+    print(f"\n✓ Bridge OSC avviato")
+    print(f"  - In ascolto sulla porta {port} (ingresso: {args.ingest})")
+    print(f"  - Invio a SlimeVR sulla porta 9002 (uscita: {args.output})")
+    if args.jitter_delay is not None:
+        print(f"  - Buffer anti-jitter: ritardo {args.jitter_delay:g} ms a {bridge.scheduler.rate:g} Hz")
+    elif args.output_rate:
+        print(f"  - Frequenza di invio fissa: {args.output_rate:g} Hz")
+    print(f"  - Backend di correzione: {bridge.engine.backend}")
+    if bridge.pose_ring is not None:
+        print(f"  - Pose della webcam in memoria condivisa ({bridge.pose_ring.shm.name})")
+    return bridge, server
+
+def start_session_bridge(args, port, bundles):
+    """Bridge multi-utente in un solo processo, una sessione per telefono"""
+    from session_bridge import SessionBridge, parse_routes
+    if args.record or args.workers > 1:
+        sys.exit("--sessions non è compatibile con --record né con --workers")
+    if args.camera_reference:
+        # Le pose della webcam non appartengono a nessuna sessione: vanno a SlimeVR via OSC
+        sys.exit("--sessions non gestisce le pose della webcam: --camera-reference non è supportato")
+    bridge = SessionBridge(routes=parse_routes(args.route) if args.route else None, bundles=bundles,
+                           backend=args.backend, drift_window=args.drift_window,
+                           idle_timeout=session_timeout(args), calibrate_new=args.calibrate,
+                           output_rate=args.output_rate, jitter_delay=jitter_delay(args))
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data, needs_reply_address=True)
+    server = create_ingest_server(args.ingest, ("0.0.0.0", port), disp,
+                                  on_batch_start=bridge.begin_tick, on_batch_end=bridge.end_tick,
+                                  on_message_time=bridge.set_sender_time)
+    osc_thread = threading.Thread(target=server.serve_forever)
+    osc_thread.daemon = True
+    osc_thread.start()
+
+    print(f"\n✓ Bridge OSC multi-sessione avviato")
+    print(f"  - In ascolto sulla porta {port} (ingresso: {args.ingest})")
+    print(f"  - Invio a SlimeVR sulla porta 9002 e sugli instradamenti di --route (uscita: {args.output})")
+    if args.jitter_delay is not None:
+        print(f"  - Buffer anti-jitter: ritardo {args.jitter_delay:g} ms per ogni uscita")
+    elif args.output_rate:
+        print(f"  - Frequenza di invio fissa: {args.output_rate:g} Hz")
+    print(f"  - Sessioni chiuse dopo {bridge.idle_timeout:g} s di inattività")
+    return bridge, server
+
+def start_sharded_bridge(args, port, bundles):
+    """Bridge su più processi (--workers), per più utenti sulla stessa macchina"""
+    from session_bridge import parse_routes
+    from sharded_bridge import ShardedBridge
+    if args.record:
+        sys.exit("--record non è supportato con --workers maggiore di 1")
+    if args.ingest or args.camera_reference or args.no_pose_ring:
+        # Ogni worker riceve con il proprio loop asyncio e nessuno legge le pose della webcam
+        sys.exit("--ingest, --camera-reference e --no-pose-ring non sono supportati con --workers maggiore di 1")
+    bridge = ShardedBridge(workers=args.workers, mode=args.shard_mode, listen=("0.0.0.0", port),
+                           bundles=bundles, output_rate=args.output_rate, backend=args.backend,
+                           drift_window=args.drift_window, jitter_delay=jitter_delay(args),
+                           routes=parse_routes(args.route) if args.route else None,
+                           idle_timeout=session_timeout(args))
+    bridge.start()
+    if args.calibrate:
+        bridge.calibrate()
+
+    print(f"\n✓ Bridge OSC avviato su {bridge.workers} processi (modalità {bridge.mode})")
+    print(f"  - In ascolto sulla porta {port} (ingresso: asyncio in ogni processo)")
+    print(f"  - Invio a SlimeVR sulla porta 9002 e sugli instradamenti di --route (uscita: {args.output})")
+    print(f"  - Sessioni chiuse dopo {bridge.idle_timeout:g} s di inattività")
+    return bridge
+
 def main():
+    args = parse_args()
     local_ip = get_local_ip()
     OSC_PORT = 12345  # Porta più alta per evitare problemi di permessi
     
@@ -35,27 +192,24 @@ def main():
     print(f"- Porta: {OSC_PORT}")
     print("\nAvvio del sistema...")
 
-    # Crea e avvia il bridge OSC in un thread separato
-    bridge = AntiDriftBridge()
-    
-    # Configurazione server OSC
-    disp = dispatcher.Dispatcher()
-    disp.map("/tracker/*", bridge.handle_tracker_data)
-    
-    # Avvia il server OSC in un thread separato
-    server = osc_server.ThreadingOSCUDPServer(("0.0.0.0", OSC_PORT), disp)
-    osc_thread = threading.Thread(target=server.serve_forever)
-    osc_thread.daemon = True
-    osc_thread.start()
-    
-    print(f"\n✓ Bridge OSC avviato")
-    print(f"  - In ascolto sulla porta {OSC_PORT}")
-    print("  - Invio a SlimeVR sulla porta 9002")
+    # Crea e avvia il bridge OSC in un thread separato (o in più processi)
+    output_bundles = args.output == "bundle"
+    if args.workers > 1 and not args.sessions:
+        bridge, server = start_sharded_bridge(args, OSC_PORT, output_bundles), None
+    else:
+        args.ingest = args.ingest or "threading"
+        if args.sessions:
+            bridge, server = start_session_bridge(args, OSC_PORT, output_bundles)
+        else:
+            bridge, server = start_bridge(args, OSC_PORT, output_bundles)
 
-    # Avvia l'interfaccia web in un thread separato
-    web_thread = threading.Thread(target=run_web_interface)
+    # Avvia l'interfaccia web in un thread separato, dopo il bridge: Flask e
+    # OpenCV/MediaPipe non ritardano l'inoltro dei pacchetti
+    web_thread = threading.Thread(target=start_web_interface, args=(output_bundles, bridge))
     web_thread.daemon = True
     web_thread.start()
+    if args.preload_camera:
+        threading.Thread(target=preload_camera, daemon=True).start()
     
     print("\n✓ Interfaccia web avviata")
     print("  - Disponibile su: http://localhost:9003")
@@ -75,7 +229,16 @@ def main():
             input()
     except KeyboardInterrupt:
         print("\nChiusura del sistema...")
-        server.shutdown()
+        if server is None:
+            bridge.stop()
+        elif args.sessions:
+            server.shutdown()
+            bridge.stop()
+        else:
+            server.shutdown()
+            bridge.close_pose_ring()
+            if bridge.recorder is not None:
+                bridge.recorder.close()
         sys.exit(0)
 
 if __name__ == "__main__":
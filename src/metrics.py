@@ -0,0 +1,152 @@
+import bisect
+import threading
+
+# Bucket di default in secondi, da 10 us a 1 s: coprono sia l'elaborazione di
+# un pacchetto OSC sia l'inferenza di un frame
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contatore monotono, con etichette opzionali.
+
+    Niente lock nel percorso caldo: sotto il GIL, con più thread in
+    contesa, al massimo si perde qualche incremento.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self.values.items()):
+            yield self.name + _labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    """Valore che può salire e scendere"""
+
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+
+class Histogram:
+    """Istogramma a bucket fissi: observe() costa una ricerca binaria e due somme"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, labels=()):
+        data = self.values.get(labels)
+        if data is None:
+            # [conteggi per bucket + overflow, somma]
+            data = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (self.name + "_bucket"
+                       + _labels(self.labelnames, labels, f'le="{_number(float(bound))}"'), cumulative)
+            yield self.name + "_sum" + _labels(self.labelnames, labels), total
+            yield self.name + "_count" + _labels(self.labelnames, labels), cumulative
+
+
+class FunctionMetric:
+    """Metrica letta al momento dello scrape da una funzione.
+
+    La funzione restituisce un numero oppure un dizionario
+    {tupla di etichette: valore}.
+    """
+
+    def __init__(self, kind, name, help, function, labelnames=()):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield self.name + _labels(self.labelnames, labels), value
+
+
+class Registry:
+    """Insieme delle metriche esposte su /metrics in formato testo Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric, replace=False):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not replace:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def function(self, kind, name, help, function, labelnames=()):
+        """Registra (o sostituisce) una metrica calcolata al momento dello scrape"""
+        return self._register(FunctionMetric(kind, name, help, function, labelnames), replace=True)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,51 @@
+import cv2
+
+
+class MotionGate:
+    """Decide se eseguire l'inferenza MediaPipe in base al movimento.
+
+    Il frame viene ridotto a una miniatura in scala di grigi e confrontato
+    con quella dell'ultima inferenza: se la differenza media supera la
+    soglia l'inferenza torna a piena frequenza e ci resta per active_frames
+    frame. Da fermi l'inferenza viene saltata, ma mai per più di
+    max_skip_time secondi o max_skip_frames frame di fila.
+    """
+
+    def __init__(self, threshold=3.0, size=(64, 48), active_frames=15,
+                 max_skip_time=0.5, max_skip_frames=30):
+        self.threshold = threshold
+        self.size = size
+        self.active_frames = active_frames
+        self.max_skip_time = max_skip_time
+        self.max_skip_frames = max_skip_frames
+        self._reference = None
+        self._last_inference = 0.0
+        self._active_left = 0
+        self._skipped_in_row = 0
+        self.last_motion = 0.0
+        self.inferences = 0
+        self.skipped = 0
+
+    def should_infer(self, rgb_frame, now):
+        """True se il frame va dato a pose.process()"""
+        small = cv2.resize(cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY), self.size,
+                           interpolation=cv2.INTER_AREA)
+        if self._reference is not None:
+            self.last_motion = float(cv2.absdiff(small, self._reference).mean())
+            if self.last_motion > self.threshold:
+                self._active_left = self.active_frames
+
+        infer = (self._reference is None
+                 or self._active_left > 0
+                 or now - self._last_inference >= self.max_skip_time
+                 or self._skipped_in_row >= self.max_skip_frames)
+        if infer:
+            self._reference = small
+            self._last_inference = now
+            self._active_left = max(0, self._active_left - 1)
+            self._skipped_in_row = 0
+            self.inferences += 1
+        else:
+            self._skipped_in_row += 1
+            self.skipped += 1
+        return infer
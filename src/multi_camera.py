@@ -0,0 +1,291 @@
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from osc_output import OSCOutput
+from pose_solver import TRACKERS, PoseSolver
+from pose_ring import PoseSender
+
+# Secondi concessi a ogni processo per importare OpenCV e aprire la webcam
+START_TIMEOUT = 30.0
+
+
+def _camera_worker(camera_id, capture_settings, model_complexity, input_scale, results, running, started):
+    """Processo di una webcam: acquisizione e inferenza MediaPipe.
+
+    Mette in started (camera_id, True/False) appena sa se la webcam si è
+    aperta. Per ogni frame elaborato mette in coda (camera_id, timestamp,
+    landmark (33, 4) o None, tempo di inferenza, frame catturati, frame
+    scartati).
+    Modello e riduzione dell'input si leggono dai valori condivisi a ogni
+    frame, così si possono cambiare a runtime.
+    """
+    import cv2
+    import mediapipe as mp
+    from camera_capture import FrameCapture
+    from pose_solver import landmarks_to_array
+
+    capture = FrameCapture(camera_id, **capture_settings)
+    if not capture.start():
+        started.put((camera_id, False))
+        return
+    started.put((camera_id, True))
+
+    complexity = model_complexity.value
+    pose = mp.solutions.pose.Pose(model_complexity=complexity,
+                                  min_detection_confidence=0.7, min_tracking_confidence=0.8)
+    landmarks = np.empty((33, 4))
+    last_seq = 0
+    dropped = 0
+    try:
+        while running.is_set():
+            latest = capture.wait_newer(last_seq, timeout=0.5)
+            if latest is None:
+                continue
+            if last_seq:
+                dropped += latest[0] - last_seq - 1
+            last_seq, frame_time, frame = latest
+
+            if model_complexity.value != complexity:
+                pose.close()
+                complexity = model_complexity.value
+                pose = mp.solutions.pose.Pose(model_complexity=complexity,
+                                              min_detection_confidence=0.7, min_tracking_confidence=0.8)
+            scale = input_scale.value
+            if scale < 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            inference_start = time.perf_counter()
+            result = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            inference_time = time.perf_counter() - inference_start
+            sample = None
+            if result.pose_landmarks:
+                sample = landmarks_to_array(result.pose_landmarks.landmark, landmarks).copy()
+            try:
+                results.put_nowait((camera_id, frame_time, sample, inference_time,
+                                    capture.frames_captured, dropped))
+            except queue.Full:
+                dropped += 1
+    finally:
+        pose.close()
+        capture.stop()
+
+
+class PoseFusion:
+    """Fonde i landmark di più webcam pesandoli con la loro visibilità.
+
+    Per ogni webcam si tiene l'ultimo campione. Alla fusione si usano i
+    campioni entro max_skew secondi dal più recente; ogni landmark è la
+    media delle posizioni pesata con la visibilità, quindi un punto coperto
+    in una webcam viene preso dalle altre. La visibilità fusa è la massima.
+    Le webcam devono condividere lo stesso sistema di riferimento: per
+    ognuna si può dare una trasformazione (rotazione 3x3, traslazione) da
+    applicare prima della fusione; senza, si usa l'identità.
+    """
+
+    def __init__(self, max_skew=0.1, transforms=None):
+        self.max_skew = max_skew
+        self.transforms = transforms or {}
+        self._samples = {}
+
+    def update(self, camera_id, frame_time, landmarks):
+        """Registra l'ultimo campione di una webcam (None se nessuna persona)"""
+        if landmarks is None:
+            self._samples.pop(camera_id, None)
+            return
+        transform = self.transforms.get(camera_id)
+        if transform is not None:
+            rotation, offset = transform
+            landmarks = landmarks.copy()
+            landmarks[:, :3] = landmarks[:, :3] @ np.asarray(rotation).T + offset
+        self._samples[camera_id] = (frame_time, landmarks)
+
+    def fuse(self):
+        """Restituisce (timestamp più recente, landmark (33, 4), webcam usate) o None"""
+        if not self._samples:
+            return None
+        newest = max(frame_time for frame_time, _ in self._samples.values())
+        used = [(camera_id, landmarks) for camera_id, (frame_time, landmarks) in self._samples.items()
+                if newest - frame_time <= self.max_skew]
+        if len(used) == 1:
+            return newest, used[0][1], [used[0][0]]
+
+        stacked = np.stack([landmarks for _, landmarks in used])
+        weights = np.clip(stacked[:, :, 3:], 1e-6, None)
+        fused = np.empty((stacked.shape[1], 4))
+        fused[:, :3] = (stacked[:, :, :3] * weights).sum(axis=0) / weights.sum(axis=0)
+        fused[:, 3] = stacked[:, :, 3].max(axis=0)
+        return newest, fused, [camera_id for camera_id, _ in used]
+
+
+class MultiCameraTracker(PoseSender):
+    """Tracking con più webcam, una per processo, e uscita OSC fusa.
+
+    Ogni webcam ha un processo con la propria acquisizione e il proprio
+    MediaPipe Pose, così le inferenze girano su core diversi. Un thread
+    raccoglie i landmark, li fonde con PoseFusion e invia i tracker come
+    CameraTracker.
+    """
+
+    def __init__(self, output_bundles=False, capture_settings=None, model_complexity=1,
+                 input_scale=1.0, max_skew=0.1, transforms=None, trackers=tuple(TRACKERS)):
+        self.running = False
+        self.capture_settings = capture_settings or {}
+        self.camera_ids = []
+        # Nessun frame nel processo principale: la preview non è disponibile
+        self.capture = None
+        self.last_landmarks = None
+        self.fusion = PoseFusion(max_skew, transforms)
+        self.solver = PoseSolver(trackers)
+        self.client = OSCOutput("127.0.0.1", 9002, bundles=output_bundles)
+        # Con un PoseRing le pose vanno al bridge in memoria condivisa invece che via OSC
+        self.pose_ring = None
+        self._context = multiprocessing.get_context()
+        self._model_complexity = self._context.Value('i', model_complexity)
+        self._input_scale = self._context.Value('d', input_scale)
+        self._running = self._context.Event()
+        self._results = None
+        self.workers = []
+        self.fusion_thread = None
+        self.frames_fused = 0
+        self.fusion_latencies = deque(maxlen=300)
+        self.fusion_times = deque(maxlen=300)
+        self.camera_stats = {}
+        self.failed_cameras = []
+
+    def start_camera(self, camera_ids=(0,), timeout=START_TIMEOUT):
+        """Avvia un processo per ogni webcam e il thread di fusione.
+
+        Aspetta che ogni processo abbia aperto la sua webcam: se una non si
+        apre (o non risponde entro timeout secondi) ferma tutto e
+        restituisce False; le webcam fallite sono in failed_cameras.
+        """
+        if self.workers:
+            self.stop_camera()
+
+        self.camera_ids = list(dict.fromkeys(camera_ids))
+        self._results = self._context.Queue(maxsize=4 * len(self.camera_ids))
+        self._running.set()
+        self.camera_stats = {
+            camera_id: {'arrivals': deque(maxlen=60), 'inference': deque(maxlen=60),
+                        'frames_captured': 0, 'frames_dropped': 0, 'failed': False}
+            for camera_id in self.camera_ids
+        }
+        started = self._context.Queue()
+        for camera_id in self.camera_ids:
+            worker = self._context.Process(
+                target=_camera_worker,
+                args=(camera_id, self.capture_settings, self._model_complexity,
+                      self._input_scale, self._results, self._running, started))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        pending = set(self.camera_ids)
+        deadline = time.monotonic() + timeout
+        try:
+            while pending:
+                camera_id, ok = started.get(timeout=max(0.0, deadline - time.monotonic()))
+                pending.discard(camera_id)
+                self.camera_stats[camera_id]['failed'] = not ok
+        except queue.Empty:
+            for camera_id in pending:
+                self.camera_stats[camera_id]['failed'] = True
+        started.close()
+        self.failed_cameras = [camera_id for camera_id in self.camera_ids if self.camera_stats[camera_id]['failed']]
+        if self.failed_cameras:
+            self.stop_camera()
+            return False
+
+        self.running = True
+        self.fusion_thread = threading.Thread(target=self._fusion_loop)
+        self.fusion_thread.daemon = True
+        self.fusion_thread.start()
+        return True
+
+    def stop_camera(self):
+        """Ferma i processi delle webcam e il thread di fusione"""
+        self.running = False
+        self._running.clear()
+        if self.fusion_thread:
+            self.fusion_thread.join()
+        self.fusion_thread = None
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        if self._results is not None:
+            self._results.close()
+            self._results = None
+
+    def set_model_complexity(self, model_complexity):
+        """Cambia il modello MediaPipe (0, 1, 2) in tutti i processi"""
+        if model_complexity not in (0, 1, 2):
+            raise ValueError("model_complexity deve essere 0, 1 o 2")
+        self._model_complexity.value = model_complexity
+
+    def set_input_scale(self, input_scale):
+        """Cambia la riduzione dell'immagine data all'inferenza (0 < scala <= 1)"""
+        if not 0 < input_scale <= 1:
+            raise ValueError("input_scale deve essere compreso tra 0 e 1")
+        self._input_scale.value = input_scale
+
+    def _fusion_loop(self):
+        """Raccoglie i landmark dei processi e invia il risultato fuso"""
+        while self.running:
+            try:
+                camera_id, frame_time, landmarks, inference_time, captured, dropped = \
+                    self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            stats = self.camera_stats[camera_id]
+            stats['arrivals'].append(time.time())
+            stats['inference'].append(inference_time)
+            stats['frames_captured'] = captured
+            stats['frames_dropped'] = dropped
+            self.process_sample(camera_id, frame_time, landmarks)
+
+    def process_sample(self, camera_id, frame_time, landmarks):
+        """Fonde un nuovo campione con gli ultimi delle altre webcam e invia i tracker"""
+        fusion_start = time.perf_counter()
+        self.fusion.update(camera_id, frame_time, landmarks)
+        fused = self.fusion.fuse()
+        if fused is None:
+            return
+        newest, fused_landmarks, _ = fused
+        trackers = self.solver.solve_dict(fused_landmarks)
+        self._send_tracking_data(trackers, newest)
+        self.fusion_times.append(time.perf_counter() - fusion_start)
+        # Latenza dall'acquisizione del frame più recente all'invio
+        self.fusion_latencies.append(time.time() - newest)
+        self.frames_fused += 1
+
+    def get_stats(self):
+        """FPS e inferenza per webcam, latenza e tempo di fusione"""
+        def percentile(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000.0 if values else None
+
+        cameras = {}
+        for camera_id, stats in self.camera_stats.items():
+            arrivals = stats['arrivals']
+            span = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else 0.0
+            cameras[str(camera_id)] = {
+                'fps': (len(arrivals) - 1) / span if span > 0 else 0.0,
+                'inference_ms_p50': percentile(stats['inference'], 0.5),
+                'frames_captured': stats['frames_captured'],
+                'frames_dropped': stats['frames_dropped'],
+                'failed': stats['failed']
+            }
+        return {
+            'cameras': cameras,
+            'frames_fused': self.frames_fused,
+            'fusion_latency_ms_p50': percentile(self.fusion_latencies, 0.5),
+            'fusion_latency_ms_p95': percentile(self.fusion_latencies, 0.95),
+            'fusion_ms_p50': percentile(self.fusion_times, 0.5)
+        }
@@ -1,84 +1,366 @@
 import argparse
 from pythonosc import dispatcher
-from pythonosc import osc_server
-from pythonosc import udp_client
+from osc_ingest import INGEST_MODES, create_ingest_server
+from osc_output import OUTPUT_MODES, OSCOutput
+from output_scheduler import OutputScheduler
+from jitter_buffer import JitterBuffer
+from osc_recorder import EVENT, INCOMING, OSCRecorder, RecordingOutput
 import math
 import threading
 import time
+from collections import namedtuple
+from drift_engine import BACKENDS, DriftEngine, is_numeric
+from camera_reference import CameraReference, parse_mapping
+from pose_ring import DEFAULT_NAME, PoseRing
+from metrics import REGISTRY
+
+MESSAGES = REGISTRY.counter("antidrift_messages_total", "Messaggi ricevuti per tracker", ("tracker",))
+PROCESSING = REGISTRY.histogram("antidrift_processing_seconds",
+                                "Tempo di elaborazione di un messaggio o di un tick", ("path",))
+
+# Stato letto a ogni pacchetto: tuple immutabili sostituite per intero, così
+# i thread del server le leggono senza lock e mai a metà di un aggiornamento
+class BridgeConfig(namedtuple("BridgeConfig", ["drift_threshold", "filter_coefficient", "drift_window"])):
+    __slots__ = ()
+
+    def updated(self, drift_threshold=None, filter_coefficient=None, drift_window=None):
+        """Nuova configurazione con i valori indicati (None = invariato); ValueError se non validi"""
+        if drift_threshold is not None and not drift_threshold > 0:
+            raise ValueError("drift_threshold deve essere maggiore di 0")
+        if filter_coefficient is not None and not 0 <= filter_coefficient <= 1:
+            raise ValueError("filter_coefficient deve essere compreso tra 0 e 1")
+        if drift_window is not None and (drift_window < 0 or drift_window == 1):
+            raise ValueError("drift_window deve essere 0 oppure almeno 2")
+        return BridgeConfig(
+            self.drift_threshold if drift_threshold is None else drift_threshold,
+            self.filter_coefficient if filter_coefficient is None else filter_coefficient,
+            self.drift_window if drift_window is None else int(drift_window))
+
+
+CalibrationState = namedtuple("CalibrationState", ["calibrated", "engine"])
+
+# Frequenza di invio del buffer anti-jitter se non è indicata --output-rate
+JITTER_OUTPUT_RATE = 120.0
 
 class AntiDriftBridge:
-    def __init__(self):
+    def __init__(self, output=None, output_rate=None, backend="python", drift_window=0, jitter_delay=None):
         # Configurazione client e server OSC
-        self.slimevr_client = udp_client.SimpleUDPClient("127.0.0.1", 9002)  # Invia a SlimeVR OSC router
-        self.drift_threshold = 5.0
-        self.filter_coefficient = 0.85
-        self.last_positions = {}
-        self.reference_positions = {}
-        self.is_calibrated = False
+        self.output = output or OSCOutput("127.0.0.1", 9002)  # Invia a SlimeVR OSC router
+        # Con output_rate l'invio avviene a frequenza fissa invece che a ogni pacchetto;
+        # con jitter_delay (secondi) i campioni passano dal buffer anti-jitter
+        self.scheduler = None
+        if jitter_delay is not None:
+            self.scheduler = JitterBuffer(self.output, output_rate or JITTER_OUTPUT_RATE, jitter_delay)
+            self.scheduler.start()
+        elif output_rate:
+            self.scheduler = OutputScheduler(self.output, output_rate)
+            self.scheduler.start()
+        # Timetag del bundle in elaborazione, impostato dal server asyncio
+        self._sender_time = None
+        self.config = BridgeConfig(drift_threshold=5.0, filter_coefficient=0.85, drift_window=drift_window)
+        self.calibration = CalibrationState(False, DriftEngine(self.config.drift_threshold,
+                                                               self.config.filter_coefficient,
+                                                               window=drift_window))
+        # Serializza solo chi scrive (interfaccia web, calibrazione); chi legge non aspetta
+        self._update_lock = threading.Lock()
+        self.set_backend(backend)
+        self._tick = None
+        self.recorder = None
+        # Ultimo campione per tracker: (timestamp, grezzo, corretto). Ogni voce
+        # viene sostituita per intero, quindi si legge senza lock
+        self.telemetry = {}
+        # Pose della webcam: ring in memoria condivisa (o OSC come ripiego) e
+        # riferimento opzionale per i tracker IMU
+        self.pose_ring = None
+        self.camera_reference = None
+        self._camera_thread = None
+        self.camera_poses = 0
+        self._register_metrics()
         print(f"Bridge inizializzato:")
         print(f"- In ascolto su porta 12345 (owoTracker)")
         print(f"- Invio a SlimeVR OSC router su porta 9002")
 
+    @property
+    def drift_threshold(self):
+        return self.config.drift_threshold
+
+    @property
+    def filter_coefficient(self):
+        return self.config.filter_coefficient
+
+    @property
+    def engine(self):
+        return self.calibration.engine
+
+    @property
+    def is_calibrated(self):
+        return self.calibration.calibrated
+
+    def _register_metrics(self):
+        """Metriche lette al momento dello scrape dallo stato del bridge"""
+        REGISTRY.function("counter", "antidrift_corrections_total",
+                          "Correzioni del drift scattate per tracker",
+                          lambda: {(tracker_id,): count for tracker_id, count
+                                   in self.engine.trigger_counts().items()}, ("tracker",))
+        REGISTRY.function("gauge", "antidrift_calibrated", "1 se il bridge è calibrato",
+                          lambda: int(self.is_calibrated))
+        REGISTRY.function("counter", "antidrift_datagrams_sent_total", "Datagrammi inviati a SlimeVR",
+                          lambda: getattr(self.output, 'datagrams_sent', 0))
+        if self.scheduler is not None:
+            REGISTRY.function("counter", "antidrift_samples_superseded_total",
+                              "Campioni sostituiti prima dell'invio a frequenza fissa",
+                              lambda: self.scheduler.samples_dropped)
+        if isinstance(self.scheduler, JitterBuffer):
+            REGISTRY.function("counter", "antidrift_jitter_late_dropped_total",
+                              "Campioni arrivati dopo il punto di riproduzione e scartati",
+                              lambda: self.scheduler.late_dropped)
+            REGISTRY.function("counter", "antidrift_jitter_updates_total",
+                              "Aggiornamenti inviati dal buffer anti-jitter per tipo",
+                              lambda: {("interpolated",): self.scheduler.interpolated,
+                                       ("extrapolated",): self.scheduler.extrapolated,
+                                       ("held",): self.scheduler.held}, ("kind",))
+
     def handle_tracker_data(self, address, *args):
         """Gestisce i dati in arrivo dai tracker"""
-        tracker_id = address.split('/')[-1]
-        
-        if not self.is_calibrated:
-            self.reference_positions[tracker_id] = list(args)
+        start = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.record(INCOMING, address, args)
+        parts = address.split('/')
+        if len(parts) > 3:
+            # /tracker/<nome>/<campo>: pose della webcam arrivate via OSC
+            self.handle_camera_message(parts[-2], parts[-1], args)
+            return
+        tracker_id = parts[-1]
+        MESSAGES.inc((tracker_id,))
+
+        # Una sola lettura dello stato di calibrazione per tutto il pacchetto
+        calibrated, engine = self.calibration
+        if not calibrated:
+            engine.set_reference(tracker_id, args)
+            self.telemetry[tracker_id] = (time.time(), args, None)
+            return
+
+        # Dentro un tick i campioni vengono corretti tutti insieme in end_tick()
+        if self._tick is not None:
+            self._tick.append((tracker_id, args, self._sender_time))
             return
 
         # Applica correzione drift
-        corrected_data = self.apply_drift_correction(tracker_id, list(args))
+        corrected_data = engine.correct(tracker_id, list(args))
+        reference = self.camera_reference
+        if reference is not None:
+            corrected_data = reference.apply(tracker_id, corrected_data)
+        self.telemetry[tracker_id] = (time.time(), args, corrected_data)
         
         # Invia dati corretti al router OSC di SlimeVR
-        self.slimevr_client.send_message(f"/tracker/{tracker_id}", corrected_data)
+        if self.scheduler is not None:
+            self.scheduler.submit(tracker_id, corrected_data, self._sender_time)
+        else:
+            self.output.send_tracker(tracker_id, corrected_data)
+        PROCESSING.observe(time.perf_counter() - start, ("message",))
+
+    def set_sender_time(self, sender_time):
+        """Timetag del mittente per i messaggi che seguono (None = tempo di arrivo)"""
+        self._sender_time = sender_time
+
+    def telemetry_snapshot(self):
+        """Copia dell'ultimo campione grezzo e corretto di ogni tracker"""
+        return dict(self.telemetry)
+
+    def record_to(self, recorder):
+        """Registra messaggi in ingresso, in uscita ed eventi di calibrazione"""
+        self.recorder = recorder
+        self.output = RecordingOutput(self.output, recorder)
+        if self.scheduler is not None:
+            self.scheduler.output = self.output
 
     def apply_drift_correction(self, tracker_id, current_data):
         """Applica la correzione del drift ai dati del tracker"""
-        if tracker_id not in self.last_positions:
-            self.last_positions[tracker_id] = current_data
-            return current_data
+        return self.engine.correct(tracker_id, current_data)
 
-        # Calcola il drift
-        drift = [abs(c - l) for c, l in zip(current_data, self.last_positions[tracker_id])]
-        
-        # Se il drift supera la soglia, applica la correzione
-        if max(drift) > self.drift_threshold:
-            # Applica il filtro di Kalman semplificato
-            corrected = []
-            for i in range(len(current_data)):
-                correction = (self.filter_coefficient * current_data[i] + 
-                            (1 - self.filter_coefficient) * self.last_positions[tracker_id][i])
-                corrected.append(correction)
-            current_data = corrected
-
-        self.last_positions[tracker_id] = current_data
-        return current_data
+    def apply_drift_correction_many(self, tracker_ids, samples):
+        """Applica la correzione del drift a tutti i campioni di un tick"""
+        return self.engine.correct_many(tracker_ids, samples)
+
+    def begin_tick(self):
+        """Inizia a raccogliere i campioni di un lotto di pacchetti"""
+        self._tick = []
+
+    def end_tick(self):
+        """Corregge in un'unica operazione i campioni raccolti e li invia insieme"""
+        tick, self._tick = self._tick, None
+        if not tick:
+            return
+        start = time.perf_counter()
+        engine = self.calibration.engine
+        tracker_ids = [tracker_id for tracker_id, _, _ in tick]
+        samples = [sample for _, sample, _ in tick]
+        try:
+            corrected = engine.correct_many(tracker_ids, samples)
+        except (TypeError, ValueError):
+            # Un campione non numerico fa fallire tutto il lotto: si scarta solo lui
+            tick = [entry for entry in tick if is_numeric(entry[1])]
+            tracker_ids = [tracker_id for tracker_id, _, _ in tick]
+            samples = [sample for _, sample, _ in tick]
+            corrected = engine.correct_many(tracker_ids, samples)
+        now = time.time()
+        telemetry = self.telemetry
+        reference = self.camera_reference
+        if self.scheduler is not None:
+            for (tracker_id, sample, sender_time), row in zip(tick, corrected):
+                values = row[:len(sample)].tolist()
+                if reference is not None:
+                    values = reference.apply(tracker_id, values)
+                telemetry[tracker_id] = (now, sample, values)
+                self.scheduler.submit(tracker_id, values, sender_time)
+        else:
+            for tracker_id, sample, row in zip(tracker_ids, samples, corrected):
+                values = row[:len(sample)].tolist()
+                if reference is not None:
+                    values = reference.apply(tracker_id, values)
+                telemetry[tracker_id] = (now, sample, values)
+                self.output.queue_tracker(tracker_id, values)
+            self.output.flush()
+        PROCESSING.observe(time.perf_counter() - start, ("tick",))
+
+    def open_pose_ring(self, name=DEFAULT_NAME):
+        """Crea il ring delle pose della webcam e il thread che lo legge.
+
+        Se il ring è già usato da un altro bridge avvisa e restituisce None:
+        la webcam avviata dall'interfaccia web invierà via OSC.
+        """
+        try:
+            self.pose_ring = PoseRing.create(name)
+        except FileExistsError as e:
+            print(f"Attenzione: {e}")
+            return None
+        self._camera_thread = threading.Thread(target=self._camera_loop)
+        self._camera_thread.daemon = True
+        self._camera_thread.start()
+        return self.pose_ring
+
+    def close_pose_ring(self):
+        ring, self.pose_ring = self.pose_ring, None
+        if ring is not None:
+            ring.wake()
+            self._camera_thread.join()
+            ring.close()
+
+    def _camera_loop(self):
+        """Dorme finché la webcam non pubblica una posa; il timeout serve solo
+        a ricontrollare la chiusura del ring"""
+        ring = self.pose_ring
+        while self.pose_ring is ring:
+            if not ring.wait(0.5):
+                continue
+            pose = ring.read_latest()
+            if pose is not None:
+                self.handle_camera_pose(ring.names, *pose)
+
+    def handle_camera_pose(self, names, frame_time, positions, rotations, visible):
+        """Inoltra a SlimeVR una posa della webcam e aggiorna il riferimento"""
+        items = []
+        for name, position, rotation, is_visible in zip(names, positions.tolist(), rotations.tolist(),
+                                                        visible.tolist()):
+            if is_visible:
+                items.append((name, position, 'position'))
+                items.append((name, rotation, 'rotation'))
+        if items:
+            self.output.send_trackers(items, frame_time)
+        reference = self.camera_reference
+        if reference is not None:
+            reference.update_pose(frame_time, names, positions, rotations, visible)
+        self.camera_poses += 1
+
+    def handle_camera_message(self, name, field, args):
+        """Tracker della webcam ricevuto via OSC (webcam su un'altra macchina)"""
+        self.output.send_tracker(name, args, field)
+        reference = self.camera_reference
+        if reference is not None:
+            reference.update(time.time(), name, field, list(args))
+
+    def set_camera_reference(self, mapping, gain=0.05):
+        """Associa tracker IMU e tracker della webcam ({id: (nome, campo)}); vuoto per disattivare"""
+        self.camera_reference = CameraReference(mapping, gain) if mapping else None
 
     def calibrate(self):
         """Esegue la calibrazione"""
         print("Calibrazione in corso...")
-        self.last_positions.clear()
-        self.reference_positions.clear()
-        self.is_calibrated = True
+        if self.recorder is not None:
+            self.recorder.record(EVENT, "/calibrate")
+        # Nuovo motore senza ultimi valori né riferimenti, pubblicato in un'unica assegnazione
+        with self._update_lock:
+            self.calibration = CalibrationState(True, self.calibration.engine.fresh())
         print("Calibrazione completata!")
 
-    def set_parameters(self, drift_threshold=None, filter_coefficient=None):
-        """Imposta i parametri di correzione"""
-        if drift_threshold is not None:
-            self.drift_threshold = drift_threshold
-        if filter_coefficient is not None:
-            self.filter_coefficient = filter_coefficient
+    def set_backend(self, backend):
+        """Sceglie il backend di correzione (python o native); se il modulo
+        nativo non è disponibile resta sul backend Python"""
+        with self._update_lock:
+            try:
+                self.calibration.engine.set_backend(backend)
+            except RuntimeError as e:
+                print(f"Attenzione: {e}; uso il backend Python")
+                self.calibration.engine.set_backend("python")
+        return self.calibration.engine.backend
+
+    def set_parameters(self, drift_threshold=None, filter_coefficient=None, drift_window=None):
+        """Imposta i parametri di correzione; valgono dal pacchetto successivo.
+
+        drift_window è il numero di campioni su cui si misura l'andamento
+        del drift (0 = salto rispetto al campione precedente); cambiarlo
+        azzera le statistiche raccolte.
+        """
+        with self._update_lock:
+            self.config = self.config.updated(drift_threshold, filter_coefficient, drift_window)
+            engine = self.calibration.engine
+            engine.set_parameters(drift_threshold, filter_coefficient)
+            if drift_window is not None:
+                engine.set_window(drift_window)
+        if self.recorder is not None:
+            self.recorder.record(EVENT, "/parameters", tuple(self.config), double=True)
 
 def main():
-    bridge = AntiDriftBridge()
+    parser = argparse.ArgumentParser(description="Anti-Drift Bridge")
+    parser.add_argument("--ingest", choices=INGEST_MODES, default="threading",
+                        help="Server OSC di ingresso: un thread per pacchetto o loop asyncio singolo")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="messages",
+                        help="Uscita verso SlimeVR: un messaggio per tracker o un bundle per tick")
+    parser.add_argument("--output-rate", type=float, default=0,
+                        help="Frequenza fissa di invio in Hz (es. 90, 120, 144); 0 = invia a ogni pacchetto")
+    parser.add_argument("--record", metavar="FILE",
+                        help="Registra i messaggi in ingresso e in uscita per riprodurli con osc_recorder.py")
+    parser.add_argument("--backend", choices=BACKENDS, default="python",
+                        help="Correzione del drift in NumPy o nel modulo C++ antidrift_native")
+    parser.add_argument("--no-pose-ring", action="store_true",
+                        help="Non aprire il ring in memoria condivisa per le pose della webcam")
+    parser.add_argument("--camera-reference", metavar="ID=TRACKER,...",
+                        help="Usa i tracker della webcam come riferimento per i tracker IMU, es. 1=hip,2=chest")
+    parser.add_argument("--drift-window", type=int, default=0,
+                        help="Campioni su cui misurare l'andamento del drift; 0 = confronto con il campione precedente")
+    parser.add_argument("--jitter-delay", type=float, default=None, metavar="MS",
+                        help="Buffer anti-jitter con questo ritardo in ms (0 = solo estrapolazione); "
+                             "ordina per timetag dei bundle con --ingest asyncio")
+    args = parser.parse_args()
+
+    bridge = AntiDriftBridge(output=OSCOutput("127.0.0.1", 9002, bundles=args.output == "bundle"),
+                             output_rate=args.output_rate, backend=args.backend, drift_window=args.drift_window,
+                             jitter_delay=None if args.jitter_delay is None else args.jitter_delay / 1000.0)
+    if args.record:
+        bridge.record_to(OSCRecorder(args.record))
+    if not args.no_pose_ring:
+        bridge.open_pose_ring()
+    if args.camera_reference:
+        bridge.set_camera_reference(parse_mapping(args.camera_reference))
     
     # Configurazione server OSC
-    dispatcher = dispatcher.Dispatcher()
-    dispatcher.map("/tracker/*", bridge.handle_tracker_data)
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data)
     
     # Avvia il server sulla porta 12345 per ricevere da owoTracker
-    server = osc_server.ThreadingOSCUDPServer(("0.0.0.0", 12345), dispatcher)
+    server = create_ingest_server(args.ingest, ("0.0.0.0", 12345), disp,
+                                  on_batch_start=bridge.begin_tick, on_batch_end=bridge.end_tick,
+                                  on_message_time=bridge.set_sender_time)
     
     print("\nAnti-Drift Bridge avviato!")
     print("Configurazione:")
@@ -97,6 +379,9 @@ def main():
     except KeyboardInterrupt:
         print("\nChiusura Anti-Drift Bridge...")
         server.server_close()
+        bridge.close_pose_ring()
+        if bridge.recorder is not None:
+            bridge.recorder.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import socket
+import threading
+from pythonosc import osc_packet
+from pythonosc import osc_server
+from pythonosc.parsing import osc_types
+
+INGEST_MODES = ("threading", "asyncio")
+
+
+class AsyncIOIngestServer:
+    """Server OSC a thread singolo basato su asyncio.
+
+    Riceve i datagrammi su un unico event loop e li consegna al dispatcher
+    in ordine di arrivo, senza creare un thread per ogni pacchetto come fa
+    ThreadingOSCUDPServer. A ogni risveglio il socket viene svuotato di
+    tutti i datagrammi in attesa, che formano un lotto. Espone
+    serve_forever/shutdown/server_close per poter essere usato al posto
+    del server a thread. Con sock si usa un socket già aperto (per esempio
+    con SO_REUSEPORT) invece di crearne uno su server_address.
+    on_message_time riceve prima dei messaggi di ogni datagramma il timetag
+    del bundle (secondi epoch del mittente), o None per un messaggio
+    singolo o un bundle "immediato": python-osc sostituisce i timetag
+    passati con l'ora di arrivo, quindi va letto dal datagramma.
+    Un'eccezione in un handler viene registrata nel log e contata in
+    errors senza interrompere il lotto, che si chiude sempre con
+    on_batch_end.
+    """
+
+    def __init__(self, server_address, dispatcher, on_batch_start=None, on_batch_end=None,
+                 max_batch=256, sock=None, on_message_time=None):
+        self.server_address = server_address
+        self.dispatcher = dispatcher
+        self.on_batch_start = on_batch_start
+        self.on_batch_end = on_batch_end
+        self.on_message_time = on_message_time
+        self.max_batch = max_batch
+        self.loop = None
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(server_address)
+        self.socket = sock
+        self.socket.setblocking(False)
+        self.recvfrom = self.socket.recvfrom
+        self.server_address = self.socket.getsockname()[:2]
+        self.batches = 0
+        self.datagrams = 0
+        self.errors = 0
+        self._stop = None
+        self._ready = threading.Event()
+
+    def _read_ready(self):
+        """Legge tutti i datagrammi disponibili e li smista come un unico lotto"""
+        batch = []
+        recvfrom = self.recvfrom
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(recvfrom(65535))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # Su Windows un ICMP port unreachable arriva come errore di recv
+                break
+        if not batch:
+            return
+        if self.on_batch_start is not None:
+            self.on_batch_start()
+        try:
+            for data, addr in batch:
+                self.handle_datagram(data, addr)
+        finally:
+            if self.on_batch_end is not None:
+                try:
+                    self.on_batch_end()
+                except Exception:
+                    self.errors += 1
+                    logging.exception("Errore nella chiusura di un lotto OSC")
+            self.batches += 1
+            self.datagrams += len(batch)
+
+    def handle_datagram(self, data, client_address):
+        """Decodifica un pacchetto OSC e invoca gli handler dei messaggi"""
+        try:
+            packet = osc_packet.OscPacket(data)
+        except osc_packet.ParseError:
+            return
+        if self.on_message_time is not None:
+            sender_time = None
+            if data.startswith(b"#bundle"):
+                sender_time = osc_types.get_date(data, 8)[0] or None
+            self.on_message_time(sender_time)
+        for timed_msg in packet.messages:
+            # I timetag futuri non vengono attesi: il loop non deve mai bloccarsi
+            for handler in self.dispatcher.handlers_for_address(timed_msg.message.address):
+                try:
+                    handler.invoke(client_address, timed_msg.message)
+                except Exception:
+                    self.errors += 1
+                    logging.exception(f"Errore nel messaggio OSC {timed_msg.message.address} da {client_address}")
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self.loop.add_reader(self.socket.fileno(), self._read_ready)
+        self._ready.set()
+        try:
+            await self._stop.wait()
+        finally:
+            self.loop.remove_reader(self.socket.fileno())
+
+    def serve_forever(self):
+        """Avvia l'event loop nel thread corrente fino a shutdown()"""
+        # add_reader richiede un loop basato su selector, anche su Windows
+        loop = asyncio.SelectorEventLoop()
+        try:
+            loop.run_until_complete(self._serve())
+        finally:
+            loop.close()
+
+    def wait_ready(self, timeout=None):
+        """Attende che il socket sia in ascolto"""
+        return self._ready.wait(timeout)
+
+    def shutdown(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def server_close(self):
+        self.socket.close()
+
+
+def create_ingest_server(mode, server_address, dispatcher, on_batch_start=None, on_batch_end=None,
+                         on_message_time=None):
+    """Crea il server OSC di ingresso nella modalità richiesta.
+
+    on_batch_start/on_batch_end delimitano ogni lotto di datagrammi e
+    on_message_time riceve i timetag dei bundle nella modalità asyncio; il
+    server a thread non ha lotti né timetag e li ignora.
+    """
+    if mode == "asyncio":
+        return AsyncIOIngestServer(server_address, dispatcher, on_batch_start=on_batch_start,
+                                   on_batch_end=on_batch_end, on_message_time=on_message_time)
+    if mode == "threading":
+        return osc_server.ThreadingOSCUDPServer(server_address, dispatcher)
+    raise ValueError(f"Modalità di ingresso sconosciuta: {mode}")
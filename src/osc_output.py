@@ -0,0 +1,156 @@
+import socket
+import struct
+import threading
+import time
+
+OUTPUT_MODES = ("messages", "bundle")
+
+_BUNDLE_HEADER = b"#bundle\x00"
+_NTP_EPOCH_OFFSET = 2208988800  # secondi tra 1900 (epoca NTP) e 1970
+_TIMETAG = struct.Struct(">II")
+_ELEMENT_SIZE = struct.Struct(">i")
+
+
+def _osc_string(text):
+    """Stringa OSC: UTF-8, terminata da zero e allineata a 4 byte"""
+    data = text.encode("utf-8") + b"\x00"
+    return data + b"\x00" * (-len(data) % 4)
+
+
+class OSCEncoder:
+    """Codifica messaggi OSC di soli float senza allocazioni per messaggio.
+
+    Indirizzo e type tag già allineati vengono calcolati una sola volta per
+    tracker e numero di argomenti; i float vengono scritti con
+    struct.pack_into in un bytearray riutilizzato.
+    """
+
+    def __init__(self, size=4096):
+        self.buffer = bytearray(size)
+        self._by_address = {}
+        self._by_tracker = {}
+
+    def message(self, address, count):
+        """Restituisce (prefisso, struct dei float) per un indirizzo OSC"""
+        key = (address, count)
+        entry = self._by_address.get(key)
+        if entry is None:
+            entry = (_osc_string(address) + _osc_string("," + "f" * count),
+                     struct.Struct(f">{count}f"))
+            self._by_address[key] = entry
+        return entry
+
+    def tracker_message(self, tracker_id, count, field=None):
+        """Come message(), per /tracker/<id> o /tracker/<id>/<field>"""
+        key = (tracker_id, field, count)
+        entry = self._by_tracker.get(key)
+        if entry is None:
+            address = f"/tracker/{tracker_id}" if field is None else f"/tracker/{tracker_id}/{field}"
+            entry = self.message(address, count)
+            self._by_tracker[key] = entry
+        return entry
+
+    def _reserve(self, size):
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+
+    def _pack_message(self, offset, entry, args):
+        prefix, values = entry
+        end = offset + len(prefix)
+        self.buffer[offset:end] = prefix
+        values.pack_into(self.buffer, end, *args)
+        return end + values.size
+
+    def pack_message(self, entry, args):
+        """Scrive un messaggio all'inizio del buffer e ne restituisce la lunghezza"""
+        self._reserve(len(entry[0]) + entry[1].size)
+        return self._pack_message(0, entry, args)
+
+    def pack_bundle(self, timestamp, items):
+        """Scrive un bundle con timestamp (secondi epoch) e restituisce la lunghezza"""
+        self._reserve(16 + sum(4 + len(prefix) + values.size for (prefix, values), _ in items))
+        buffer = self.buffer
+        buffer[0:8] = _BUNDLE_HEADER
+        seconds, fraction = divmod(timestamp, 1.0)
+        _TIMETAG.pack_into(buffer, 8, int(seconds) + _NTP_EPOCH_OFFSET, int(fraction * 4294967296.0))
+        offset = 16
+        for entry, args in items:
+            _ELEMENT_SIZE.pack_into(buffer, offset, len(entry[0]) + entry[1].size)
+            offset = self._pack_message(offset + 4, entry, args)
+        return offset
+
+
+class OSCOutput:
+    """Uscita OSC verso il router di SlimeVR.
+
+    In modalità bundle i messaggi accodati durante un tick (o un frame della
+    webcam) partono in un unico datagramma con timestamp, così tutti i
+    tracker dello stesso istante arrivano insieme. Per i ricevitori che non
+    gestiscono i bundle, con bundles=False gli stessi messaggi vengono
+    inviati uno per uno. La codifica usa OSCEncoder e il socket resta
+    aperto per tutta la vita dell'oggetto.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9002, bundles=False):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.encoder = OSCEncoder()
+        self.bundles = bundles
+        self._pending = []
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.datagrams_sent = 0
+
+    def _send_entry(self, entry, args):
+        with self._send_lock:
+            size = self.encoder.pack_message(entry, args)
+            self.socket.sendto(memoryview(self.encoder.buffer)[:size], self.address)
+            self.datagrams_sent += 1
+
+    def send_message(self, address, args):
+        """Invia subito un singolo messaggio"""
+        self._send_entry(self.encoder.message(address, len(args)), args)
+
+    def send_tracker(self, tracker_id, args, field=None):
+        """Invia subito /tracker/<id>[/<field>] usando il prefisso in cache"""
+        self._send_entry(self.encoder.tracker_message(tracker_id, len(args), field), args)
+
+    def queue(self, address, args):
+        """Accoda un messaggio fino al prossimo flush()"""
+        entry = self.encoder.message(address, len(args))
+        with self._lock:
+            self._pending.append((entry, args))
+
+    def queue_tracker(self, tracker_id, args, field=None):
+        """Accoda /tracker/<id>[/<field>] fino al prossimo flush()"""
+        entry = self.encoder.tracker_message(tracker_id, len(args), field)
+        with self._lock:
+            self._pending.append((entry, args))
+
+    def flush(self, timestamp=None):
+        """Invia i messaggi accodati, come bundle o come messaggi singoli"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        self._send_pending(pending, timestamp)
+
+    def send_trackers(self, items, timestamp=None):
+        """Invia subito insieme più (id, valori, campo), senza toccare i messaggi accodati"""
+        tracker_message = self.encoder.tracker_message
+        self._send_pending([(tracker_message(tracker_id, len(args), field), args)
+                            for tracker_id, args, field in items], timestamp)
+
+    def _send_pending(self, pending, timestamp):
+        if not pending:
+            return
+        if not self.bundles or len(pending) == 1:
+            for entry, args in pending:
+                self._send_entry(entry, args)
+            return
+
+        with self._send_lock:
+            size = self.encoder.pack_bundle(time.time() if timestamp is None else timestamp, pending)
+            self.socket.sendto(memoryview(self.encoder.buffer)[:size], self.address)
+            self.datagrams_sent += 1
+
+    def close(self):
+        self.socket.close()
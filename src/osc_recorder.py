@@ -0,0 +1,289 @@
+import argparse
+import mmap
+import numbers
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Formato del file: intestazione MAGIC, poi record in coda uno all'altro.
+# Ogni record: timestamp (float64), tipo (uint8), numero di argomenti (uint8),
+# lunghezza dell'indirizzo (uint16), indirizzo UTF-8, argomenti float32.
+# I valori OSC viaggiano già come float32, quindi non si perde precisione;
+# gli argomenti non numerici non vengono registrati e al massimo MAX_ARGS.
+# Con il bit FLOAT64 nel tipo gli argomenti sono float64: serve agli eventi
+# come /parameters, che vanno riapplicati con i valori Python esatti.
+MAGIC = b"ADREC02\0"
+# Registrazioni senza record FLOAT64, ancora leggibili
+_MAGIC_V1 = b"ADREC01\0"
+_RECORD = struct.Struct("<dBBH")
+MAX_ARGS = 255
+FLOAT64 = 0x80
+
+INCOMING = 0
+OUTGOING = 1
+EVENT = 2
+# Pose della webcam inoltrate a SlimeVR: la riproduzione non le rigenera
+CAMERA = 3
+
+
+def tracker_address(tracker_id, field=None):
+    return f"/tracker/{tracker_id}/{field}" if field else f"/tracker/{tracker_id}"
+
+
+def is_camera_address(address):
+    """I tracker della webcam hanno anche il campo: /tracker/<nome>/<campo>"""
+    return address.count('/') > 2
+
+
+class OSCRecorder:
+    """Registra messaggi in ingresso, in uscita ed eventi in un file binario append-only"""
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+        self.records = 0
+
+    def record(self, kind, address, args=(), timestamp=None, double=False):
+        """Aggiunge un record; con double=True gli argomenti restano float64"""
+        if len(args) > MAX_ARGS:
+            args = args[:MAX_ARGS]
+        code = "d" if double else "f"
+        try:
+            values = struct.pack(f"<{len(args)}{code}", *args)
+        except struct.error:
+            # Stringhe, blob e simili: si registrano solo gli argomenti numerici
+            args = [value for value in args if isinstance(value, numbers.Real)]
+            values = struct.pack(f"<{len(args)}{code}", *args)
+        encoded = address.encode()
+        data = (_RECORD.pack(time.time() if timestamp is None else timestamp,
+                             kind | FLOAT64 if double else kind, len(args), len(encoded))
+                + encoded + values)
+        with self._lock:
+            self._file.write(data)
+            self.records += 1
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._file.flush()
+                self._next_flush = now + self.flush_interval
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class OSCRecording:
+    """Registrazione letta tramite mmap, senza caricarla in memoria"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] not in (MAGIC, _MAGIC_V1):
+            self.close()
+            raise ValueError(f"{path} non è una registrazione OSC valida")
+
+    def __iter__(self):
+        """Restituisce (timestamp, tipo, indirizzo, valori) per ogni record"""
+        data = self._map
+        offset = len(MAGIC)
+        end = len(data)
+        while offset + _RECORD.size <= end:
+            timestamp, kind, count, length = _RECORD.unpack_from(data, offset)
+            start = offset + _RECORD.size
+            size, code = (8, "d") if kind & FLOAT64 else (4, "f")
+            offset = start + length + size * count
+            # Un record troncato (ad esempio per un'interruzione) chiude la lettura
+            if offset > end:
+                return
+            address = data[start:start + length].decode()
+            yield timestamp, kind & ~FLOAT64, address, struct.unpack_from(f"<{count}{code}", data, start + length)
+
+    def messages(self, kind):
+        """Lista (indirizzo, valori) dei record di un tipo"""
+        return [(address, values) for _, record_kind, address, values in self if record_kind == kind]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class RecordingOutput:
+    """Uscita OSC che registra tutto quello che invia l'uscita avvolta.
+
+    I tracker corretti diventano record OUTGOING, le pose della webcam
+    record CAMERA, così il confronto dopo una riproduzione li ignora.
+    """
+
+    def __init__(self, output, recorder):
+        self.output = output
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+    def _record(self, address, args):
+        self.recorder.record(CAMERA if is_camera_address(address) else OUTGOING, address, args)
+
+    def send_message(self, address, args):
+        self._record(address, args)
+        self.output.send_message(address, args)
+
+    def send_tracker(self, tracker_id, args, field=None):
+        self._record(tracker_address(tracker_id, field), args)
+        self.output.send_tracker(tracker_id, args, field)
+
+    def queue(self, address, args):
+        self._record(address, args)
+        self.output.queue(address, args)
+
+    def queue_tracker(self, tracker_id, args, field=None):
+        self._record(tracker_address(tracker_id, field), args)
+        self.output.queue_tracker(tracker_id, args, field)
+
+    def flush(self, timestamp=None):
+        self.output.flush(timestamp)
+
+    def send_trackers(self, items, timestamp=None):
+        for tracker_id, args, field in items:
+            self._record(tracker_address(tracker_id, field), args)
+        self.output.send_trackers(items, timestamp)
+
+    def close(self):
+        self.output.close()
+
+
+class MemoryOutput:
+    """Uscita senza rete: conserva in memoria i messaggi (indirizzo, valori)"""
+
+    def __init__(self):
+        self.messages = []
+        self.datagrams_sent = 0
+
+    def send_message(self, address, args):
+        self.messages.append((address, tuple(args)))
+
+    def send_tracker(self, tracker_id, args, field=None):
+        self.messages.append((tracker_address(tracker_id, field), tuple(args)))
+
+    def queue(self, address, args):
+        self.send_message(address, args)
+
+    def queue_tracker(self, tracker_id, args, field=None):
+        self.send_tracker(tracker_id, args, field)
+
+    def flush(self, timestamp=None):
+        pass
+
+    def send_trackers(self, items, timestamp=None):
+        for tracker_id, args, field in items:
+            self.send_tracker(tracker_id, args, field)
+
+    def close(self):
+        pass
+
+
+def replay(recording, bridge, speed=1.0, apply_parameters=True):
+    """Rimanda nel bridge i messaggi in ingresso e gli eventi di una registrazione.
+
+    speed 1.0 rispetta i tempi originali, N li accelera di N volte, 0 va alla
+    massima velocità. Con apply_parameters=False i cambi di parametri
+    registrati vengono ignorati. Restituisce numero di messaggi e secondi
+    impiegati.
+    """
+    first = None
+    start = time.perf_counter()
+    messages = 0
+    for timestamp, kind, address, values in recording:
+        if kind in (OUTGOING, CAMERA):
+            continue
+        if speed > 0:
+            if first is None:
+                first = timestamp
+            delay = (timestamp - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if kind == INCOMING:
+            bridge.handle_tracker_data(address, *values)
+            messages += 1
+        elif address == "/calibrate":
+            bridge.calibrate()
+        elif address == "/parameters" and apply_parameters:
+            bridge.set_parameters(*values)
+    return {"messages": messages, "seconds": time.perf_counter() - start}
+
+
+def diff_outputs(expected, actual):
+    """Confronta due sequenze di uscita (indirizzo, valori), in ordine per indirizzo.
+
+    I valori vengono confrontati in float32, come viaggiano su OSC.
+    """
+    def by_address(messages):
+        grouped = {}
+        for address, values in messages:
+            grouped.setdefault(address, []).append(values)
+        return grouped
+
+    expected, actual = by_address(expected), by_address(actual)
+    compared = mismatched = missing = extra = 0
+    max_diff = 0.0
+    for address in expected.keys() | actual.keys():
+        left, right = expected.get(address, []), actual.get(address, [])
+        missing += max(0, len(left) - len(right))
+        extra += max(0, len(right) - len(left))
+        for a, b in zip(left, right):
+            compared += 1
+            if len(a) != len(b):
+                mismatched += 1
+                continue
+            diff = np.abs(np.float32(a) - np.float32(b)).max(initial=0.0)
+            if diff > 0:
+                mismatched += 1
+                max_diff = max(max_diff, float(diff))
+    return {"compared": compared, "mismatched": mismatched, "missing": missing,
+            "extra": extra, "max_abs_diff": max_diff}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riproduce una registrazione OSC nel bridge, senza rete")
+    parser.add_argument("path", help="File registrato con --record")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="1 = tempi originali, N = N volte più veloce, 0 = massima velocità")
+    parser.add_argument("--drift-threshold", type=float, default=None)
+    parser.add_argument("--filter-coefficient", type=float, default=None)
+    parser.add_argument("--drift-window", type=int, default=None)
+    args = parser.parse_args()
+
+    from osc_bridge import AntiDriftBridge
+
+    recording = OSCRecording(args.path)
+    output = MemoryOutput()
+    bridge = AntiDriftBridge(output=output)
+    # Parametri dati da riga di comando: sostituiscono quelli registrati
+    override = any(value is not None for value in
+                   (args.drift_threshold, args.filter_coefficient, args.drift_window))
+    if override:
+        bridge.set_parameters(args.drift_threshold, args.filter_coefficient, args.drift_window)
+
+    result = replay(recording, bridge, args.speed, apply_parameters=not override)
+    # Le pose della webcam non dipendono dalla correzione: restano fuori dal confronto
+    diff = diff_outputs(recording.messages(OUTGOING),
+                        [message for message in output.messages if not is_camera_address(message[0])])
+    recording.close()
+
+    rate = result["messages"] / result["seconds"] if result["seconds"] > 0 else 0.0
+    print(f"\nMessaggi riprodotti: {result['messages']} in {result['seconds']:.3f} s ({rate:.0f} msg/s)")
+    print(f"Messaggi in uscita: {len(output.messages)}")
+    print(f"Confrontati con la registrazione: {diff['compared']}, diversi: {diff['mismatched']}, "
+          f"mancanti: {diff['missing']}, in più: {diff['extra']}, "
+          f"differenza massima: {diff['max_abs_diff']:.6g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class OutputScheduler:
+    """Invio a frequenza fissa, indipendente dall'arrivo dei pacchetti.
+
+    Per ogni tracker viene tenuto solo l'ultimo valore corretto; a ogni tick
+    parte esattamente un aggiornamento per tracker (in un unico flush, quindi
+    in un bundle se l'uscita lo prevede). I campioni sovrascritti prima di
+    essere inviati vengono scartati e contati. Un tracker che non manda
+    nulla da più di stale_after secondi smette di essere inviato.
+    """
+
+    def __init__(self, output, rate=120.0, stale_after=1.0):
+        self.output = output
+        self.rate = rate
+        self.stale_after = stale_after
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.running = False
+        self.samples_in = 0
+        self.samples_dropped = 0
+        self.ticks = 0
+        self.updates_sent = 0
+        self.late_ticks = 0
+
+    def submit(self, tracker_id, values, sender_time=None):
+        """Sostituisce l'ultimo valore del tracker (sender_time non serve a questo scheduler)"""
+        now = time.monotonic()
+        with self._lock:
+            previous = self._latest.get(tracker_id)
+            if previous is not None and previous[2]:
+                self.samples_dropped += 1
+            self._latest[tracker_id] = (values, now, True)
+            self.samples_in += 1
+
+    def tick(self):
+        """Invia un aggiornamento per ogni tracker attivo"""
+        now = time.monotonic()
+        with self._lock:
+            latest = self._latest
+            for tracker_id, (values, received, fresh) in list(latest.items()):
+                if now - received > self.stale_after:
+                    del latest[tracker_id]
+                    continue
+                self.output.queue_tracker(tracker_id, values)
+                if fresh:
+                    latest[tracker_id] = (values, received, False)
+                self.updates_sent += 1
+        self.output.flush()
+        self.ticks += 1
+
+    def _run(self):
+        period = 1.0 / self.rate
+        deadline = time.perf_counter()
+        while self.running:
+            self.tick()
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                # Troppo in ritardo: si riparte dal tempo attuale invece di recuperare a raffica
+                self.late_ticks += 1
+                deadline = time.perf_counter()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join()
+        self._thread = None
@@ -0,0 +1,279 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+from drift_engine import DriftEngine
+from pose_solver import TRACKERS, PoseSolver, landmarks_to_array
+
+# Campi dei tracker della webcam su cui si può provare la correzione del drift
+FIELDS = ("rotation", "position")
+
+
+def video_info(path):
+    """Numero di frame e FPS di un video.
+
+    Il numero di frame viene dai metadati del contenitore: con video a
+    frame rate variabile e molti MP4/H.264 è solo una stima, quindi
+    extract() lo usa per dividere il video ma conta i frame decodificati.
+    """
+    import cv2
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Impossibile aprire il video {path}")
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+    return frames, fps
+
+
+def _seek(capture, start):
+    """Porta capture al frame start.
+
+    CAP_PROP_POS_FRAMES salta al keyframe più vicino e su alcuni video (VFR,
+    MP4/H.264 senza indice preciso) finisce su un frame diverso: se la
+    posizione riletta non torna, riparte dall'inizio scartando start frame
+    con grab(), più lento ma esatto. Restituisce False se il seek è stato
+    sostituito dallo scorrimento.
+    """
+    import cv2
+    if start == 0:
+        return True
+    if capture.set(cv2.CAP_PROP_POS_FRAMES, start) and int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return True
+    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(start):
+        if not capture.grab():
+            break
+    return False
+
+
+def _extract_chunk(task):
+    """Processo del pool: MediaPipe e PoseSolver sui frame [start, stop) di un
+    video; con stop None fino alla fine del video"""
+    import cv2
+    import mediapipe as mp
+
+    video, path, start, stop, fps, trackers, model_complexity, input_scale = task
+    capture = cv2.VideoCapture(path)
+    exact_seek = _seek(capture, start)
+    pose = mp.solutions.pose.Pose(model_complexity=model_complexity,
+                                  min_detection_confidence=0.7, min_tracking_confidence=0.8)
+    solver = PoseSolver(trackers)
+    landmarks = np.empty((33, 4))
+    count = len(trackers)
+    positions, rotations, visible = [], [], []
+    inference = 0.0
+    frames = 0
+    try:
+        for row in (range(stop - start) if stop is not None else itertools.count()):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if input_scale < 1.0:
+                frame = cv2.resize(frame, None, fx=input_scale, fy=input_scale, interpolation=cv2.INTER_AREA)
+            inference_start = time.perf_counter()
+            result = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            inference += time.perf_counter() - inference_start
+            frames += 1
+            if result.pose_landmarks:
+                position, rotation, seen = solver.solve(
+                    landmarks_to_array(result.pose_landmarks.landmark, landmarks))
+            else:
+                position = rotation = np.zeros((count, 3))
+                seen = np.zeros(count, dtype=bool)
+            positions.append(position)
+            rotations.append(rotation)
+            visible.append(seen)
+    finally:
+        pose.close()
+        capture.release()
+    index = np.arange(start, start + frames)
+    return {'video': np.full(frames, video, dtype=np.uint16), 'frame': index.astype(np.int32),
+            'time': index / fps, 'position': np.array(positions, dtype=np.float32).reshape(frames, count, 3),
+            'rotation': np.array(rotations, dtype=np.float32).reshape(frames, count, 3),
+            'visible': np.array(visible, dtype=bool).reshape(frames, count),
+            'inference_seconds': inference, 'exact_seek': exact_seek}
+
+
+def extract(videos, workers=None, chunk_frames=0, trackers=tuple(TRACKERS), model_complexity=1, input_scale=1.0):
+    """Estrae le pose di tutti i video su un pool di processi.
+
+    Ogni video viene diviso in pezzi da chunk_frames frame (0 = un pezzo
+    per video), elaborati in parallelo e rimessi in ordine. MediaPipe segue
+    la persona da un frame all'altro, quindi all'inizio di ogni pezzo
+    riparte dal rilevamento: pezzi più piccoli usano meglio i core ma
+    possono dare pose leggermente diverse sui confini. I pezzi seguono il
+    numero di frame dichiarato dal contenitore, che per i video VFR e
+    molti MP4 è approssimato: l'ultimo pezzo legge fino alla fine del
+    video, i pezzi con un seek impreciso scorrono i frame dall'inizio, e
+    se i frame decodificati non corrispondono alla stima viene stampato un
+    avviso. Restituisce le colonne (vedi save_columns) e le statistiche
+    dell'estrazione.
+    """
+    tasks = []
+    expected = []
+    for video, path in enumerate(videos):
+        frames, fps = video_info(path)
+        expected.append(frames)
+        starts = range(0, frames, chunk_frames) if chunk_frames > 0 and frames > 0 else [0]
+        for start in starts:
+            stop = start + chunk_frames if 0 < chunk_frames and start + chunk_frames < frames else None
+            tasks.append((video, path, start, stop, fps, tuple(trackers), model_complexity, input_scale))
+    start = time.perf_counter()
+    with multiprocessing.get_context().Pool(workers) as pool:
+        # I pezzi tornano nell'ordine dei task, cioè per video e per frame
+        chunks = pool.map(_extract_chunk, tasks, chunksize=1)
+    elapsed = time.perf_counter() - start
+    for video, path in enumerate(videos):
+        decoded = sum(len(chunk['frame']) for task, chunk in zip(tasks, chunks) if task[0] == video)
+        if decoded != expected[video]:
+            print(f"Attenzione: {path}: decodificati {decoded} frame, CAP_PROP_FRAME_COUNT ne indicava "
+                  f"{expected[video]}: il video è probabilmente VFR e i tempi (frame / FPS) sono approssimati")
+    slow_seeks = sum(not chunk['exact_seek'] for chunk in chunks)
+    if slow_seeks:
+        print(f"Attenzione: seek impreciso in {slow_seeks} pezzi, frame scorsi dall'inizio del video "
+              f"(usa --chunk-frames 0 per evitarlo)")
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks])
+               for name in ('video', 'frame', 'time', 'position', 'rotation', 'visible')}
+    columns['trackers'] = np.array(trackers)
+    columns['videos'] = np.array(videos)
+    frames = len(columns['frame'])
+    stats = {'videos': len(videos), 'chunks': len(tasks), 'frames': frames, 'seconds': elapsed,
+             'fps': frames / elapsed if elapsed > 0 else 0.0,
+             'inference_seconds': sum(chunk['inference_seconds'] for chunk in chunks),
+             'detected': float(columns['visible'].any(axis=1).mean()) if frames else 0.0}
+    return columns, stats
+
+
+def save_columns(path, columns):
+    """Salva le colonne in un unico file .npz non compresso.
+
+    Una riga per frame: video (indice in videos), frame, time (secondi dal
+    primo frame del video), position e rotation (frame, tracker, 3) in
+    float32, visible (frame, tracker); trackers e videos danno i nomi.
+    """
+    with open(path, "wb") as f:
+        np.savez(f, **columns)
+
+
+def load_columns(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+# Dati del processo di sweep, caricati una volta sola per processo
+_sweep_data = None
+
+
+def _sweep_init(path, field, drift_window):
+    global _sweep_data
+    _sweep_data = (load_columns(path), field, drift_window)
+
+
+def _sweep_combo(params):
+    """Processo del pool: riproduce tutti i frame con una coppia di parametri"""
+    drift_threshold, filter_coefficient = params
+    columns, field, drift_window = _sweep_data
+    names = [str(name) for name in columns['trackers']]
+    values = columns[field].astype(float)
+    visible = columns['visible']
+    videos = columns['video']
+    start = time.perf_counter()
+    corrections = samples = 0
+    deviation = jitter_raw = jitter_corrected = 0.0
+    steps = 0
+    for video in np.unique(videos):
+        # Un motore nuovo per video, come una calibrazione a inizio registrazione
+        engine = DriftEngine(drift_threshold, filter_coefficient, window=drift_window)
+        previous_raw = np.full((len(names), 3), np.nan)
+        previous_corrected = np.full((len(names), 3), np.nan)
+        for row in np.flatnonzero(videos == video):
+            seen = np.flatnonzero(visible[row])
+            if not len(seen):
+                continue
+            raw = values[row, seen]
+            corrected = engine.correct_many([names[i] for i in seen], raw)
+            deviation += float(((corrected - raw) ** 2).sum())
+            samples += len(seen)
+            # Variazione da un frame al successivo, solo per i tracker visibili in entrambi
+            last_raw, last_corrected = previous_raw[seen], previous_corrected[seen]
+            both = ~np.isnan(last_raw[:, 0])
+            jitter_raw += float(((raw[both] - last_raw[both]) ** 2).sum())
+            jitter_corrected += float(((corrected[both] - last_corrected[both]) ** 2).sum())
+            steps += int(both.sum())
+            previous_raw[seen], previous_corrected[seen] = raw, corrected
+        corrections += sum(engine.triggers)
+    return {
+        'drift_threshold': drift_threshold,
+        'filter_coefficient': filter_coefficient,
+        'samples': samples,
+        'corrections': corrections,
+        'correction_rate': corrections / max(samples, 1),
+        'rms_deviation': (deviation / max(samples * 3, 1)) ** 0.5,
+        'rms_step_raw': (jitter_raw / max(steps * 3, 1)) ** 0.5,
+        'rms_step_corrected': (jitter_corrected / max(steps * 3, 1)) ** 0.5,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def sweep(path, thresholds, coefficients, workers=None, field="rotation", drift_window=0):
+    """Prova tutte le coppie (drift_threshold, filter_coefficient) sulle pose estratte, in parallelo.
+
+    Per ogni coppia riporta quante correzioni scattano, lo scarto RMS tra
+    uscita e ingresso (quanto la correzione sposta i tracker) e la
+    variazione RMS da un frame al successivo prima e dopo la correzione
+    (quanto tremano).
+    """
+    combos = list(itertools.product(thresholds, coefficients))
+    with multiprocessing.get_context().Pool(workers, initializer=_sweep_init,
+                                            initargs=(path, field, drift_window)) as pool:
+        return pool.map(_sweep_combo, combos, chunksize=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estrazione delle pose da video registrati e sweep dei parametri")
+    commands = parser.add_subparsers(dest="command", required=True)
+    parser_extract = commands.add_parser("extract", help="MediaPipe e PoseSolver sui video, in parallelo")
+    parser_extract.add_argument("videos", nargs="+")
+    parser_extract.add_argument("-o", "--output", default="poses.npz")
+    parser_extract.add_argument("--workers", type=int, default=None, help="Processi (default: tutti i core)")
+    parser_extract.add_argument("--chunk-frames", type=int, default=0,
+                                help="Divide ogni video in pezzi da N frame elaborati in parallelo")
+    parser_extract.add_argument("--model-complexity", type=int, choices=(0, 1, 2), default=1)
+    parser_extract.add_argument("--input-scale", type=float, default=1.0)
+    parser_sweep = commands.add_parser("sweep", help="Prova le coppie di parametri sulle pose estratte")
+    parser_sweep.add_argument("poses", help="File scritto da extract")
+    parser_sweep.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 2.0, 5.0, 10.0])
+    parser_sweep.add_argument("--coefficients", type=float, nargs="+", default=[0.5, 0.7, 0.85, 0.95])
+    parser_sweep.add_argument("--field", choices=FIELDS, default="rotation")
+    parser_sweep.add_argument("--drift-window", type=int, default=0)
+    parser_sweep.add_argument("--workers", type=int, default=None, help="Processi (default: tutti i core)")
+    parser_sweep.add_argument("--json", help="Scrive i risultati in questo file")
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        columns, stats = extract(args.videos, args.workers, args.chunk_frames,
+                                 model_complexity=args.model_complexity, input_scale=args.input_scale)
+        save_columns(args.output, columns)
+        print(f"{stats['frames']} frame da {stats['videos']} video in {stats['chunks']} pezzi: "
+              f"{stats['seconds']:.1f} s ({stats['fps']:.1f} frame/s), persona rilevata nel "
+              f"{stats['detected']:.0%} dei frame -> {args.output}")
+        return
+
+    results = sweep(args.poses, args.thresholds, args.coefficients, args.workers, args.field, args.drift_window)
+    print(f"{'soglia':>8}  {'coeff.':>6}  {'correzioni':>10}  {'scarto RMS':>10}  "
+          f"{'passo RMS grezzo':>16}  {'passo RMS corretto':>18}")
+    for r in results:
+        print(f"{r['drift_threshold']:>8g}  {r['filter_coefficient']:>6g}  {r['correction_rate']:>10.1%}  "
+              f"{r['rms_deviation']:>10.3f}  {r['rms_step_raw']:>16.3f}  {r['rms_step_corrected']:>18.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
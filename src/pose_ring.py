@@ -0,0 +1,251 @@
+import os
+import socket
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from pose_solver import TRACKERS
+
+# Nome del segmento aperto dal bridge; la webcam lo cerca con lo stesso nome
+DEFAULT_NAME = "antidrift_poses"
+MAGIC = b"ADPOSE3\0"
+
+# pid è il processo del bridge che ha creato il segmento, notify la porta UDP
+# locale su cui il bridge aspetta le nuove pose (0 = nessuna), waiting è 1
+# mentre il bridge è fermo in wait()
+_HEADER = np.dtype([("magic", "S8"), ("head", "i8"), ("slots", "i8"), ("trackers", "i8"), ("pid", "i8"),
+                    ("notify", "i8"), ("waiting", "i8")])
+
+
+def _slot_dtype(trackers):
+    return np.dtype([("seq", "i8"), ("time", "f8"), ("position", "f8", (trackers, 3)),
+                     ("rotation", "f8", (trackers, 3)), ("visible", "u1", (trackers,))])
+
+
+# Segmenti creati da questo processo: sono già registrati nel resource tracker
+_created = set()
+
+
+def _attach(name):
+    """Apre un segmento esistente senza che il resource tracker lo cancelli all'uscita"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if sys.platform != "win32" and name not in _created:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _process_alive(pid):
+    """True se il processo esiste ancora (o non si può escludere)"""
+    if sys.platform == "win32":
+        # Su Windows il segmento sparisce con l'ultimo processo che lo apre: se esiste, il bridge c'è
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_alive(name):
+    """True se il segmento esistente appartiene a un bridge ancora in esecuzione
+    o non è un ring riconoscibile, quindi non va toccato"""
+    shm = _attach(name)
+    try:
+        if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+            return True
+        pid = int(np.ndarray((), dtype=_HEADER, buffer=shm.buf)["pid"])
+        return pid <= 0 or _process_alive(pid)
+    finally:
+        shm.close()
+
+
+class PoseRing:
+    """Ring buffer in memoria condivisa con le pose dei tracker della webcam.
+
+    Ogni slot contiene il tempo del frame e posizione, rotazione e
+    visibilità di tutti i tracker di pose_solver.TRACKERS, come array
+    NumPy: niente codifica OSC né socket tra webcam e bridge, anche da
+    processi diversi (il segmento ha un nome). Un solo scrittore: scrive
+    lo slot con seq negativo, poi il numero della posa e infine head;
+    il lettore ricontrolla seq dopo la copia e scarta gli slot riscritti
+    nel frattempo. Il bridge dorme in wait() invece di interrogare il ring
+    a intervalli: se lo trova fermo (waiting), dopo una posa lo scrittore
+    gli invia un datagramma vuoto sulla porta notify; se il bridge sta
+    ancora elaborando la posa precedente non serve nessuna syscall.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.names = list(TRACKERS)
+        self.header = np.ndarray((), dtype=_HEADER, buffer=shm.buf)
+        slots = int(self.header["slots"])
+        self.ring = np.ndarray((slots,), dtype=_slot_dtype(int(self.header["trackers"])), buffer=shm.buf,
+                               offset=_HEADER.itemsize)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.last_read = int(self.header["head"])
+        self._listener = None
+        self._waker = None
+        self.poses_published = 0
+        self.poses_read = 0
+        self.poses_skipped = 0
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, slots=16):
+        """Crea il segmento (lato bridge).
+
+        Uno rimasto da un'esecuzione interrotta (il processo che l'ha creato
+        non esiste più) viene sostituito; se invece appartiene a un bridge
+        ancora in esecuzione solleva FileExistsError.
+        """
+        size = _HEADER.itemsize + slots * _slot_dtype(len(TRACKERS)).itemsize
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            if _owner_alive(name):
+                raise FileExistsError(f"Il ring delle pose '{name}' è già usato da un altro bridge in esecuzione "
+                                      f"(o non è un ring valido): chiudi l'altro bridge o avvia con --no-pose-ring")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(name)
+        header = np.ndarray((), dtype=_HEADER, buffer=shm.buf)
+        header["head"] = 0
+        header["slots"] = slots
+        header["trackers"] = len(TRACKERS)
+        header["pid"] = os.getpid()
+        header["waiting"] = 0
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(("127.0.0.1", 0))
+        header["notify"] = listener.getsockname()[1]
+        header["magic"] = MAGIC
+        ring = cls(shm, owner=True)
+        ring._listener = listener
+        return ring
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """Apre il segmento creato dal bridge (lato webcam); None se il bridge non c'è"""
+        try:
+            shm = _attach(name)
+        except FileNotFoundError:
+            return None
+        if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+            shm.close()
+            return None
+        return cls(shm, owner=False)
+
+    def publish(self, frame_time, data):
+        """Scrive una posa nel formato di PoseSolver.solve_dict()"""
+        head = int(self.header["head"]) + 1
+        slot = self.ring[head % len(self.ring)]
+        slot["seq"] = -head
+        positions, rotations, visible = slot["position"], slot["rotation"], slot["visible"]
+        visible[:] = 0
+        for name, tracker in data.items():
+            i = self._index.get(name)
+            if i is not None:
+                positions[i] = tracker['position']
+                rotations[i] = tracker['rotation']
+                visible[i] = tracker['visible']
+        slot["time"] = time.time() if frame_time is None else frame_time
+        slot["seq"] = head
+        self.header["head"] = head
+        self.poses_published += 1
+        if self.header["waiting"]:
+            self.wake()
+
+    def wake(self):
+        """Sveglia il bridge in attesa in wait(); se il suo buffer è pieno si è già svegliato"""
+        port = int(self.header["notify"])
+        if not port:
+            return
+        if self._waker is None:
+            self._waker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._waker.setblocking(False)
+        try:
+            self._waker.sendto(b"", ("127.0.0.1", port))
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        """Lato bridge: aspetta una nuova posa per al massimo timeout secondi.
+        Restituisce False allo scadere del timeout"""
+        header = self.header
+        if int(header["head"]) != self.last_read:
+            return True
+        # Prima si segnala l'attesa, poi si ricontrolla head: una posa scritta
+        # nel mezzo viene vista qui o porta il datagramma di sveglia
+        header["waiting"] = 1
+        try:
+            if int(header["head"]) != self.last_read:
+                return True
+            self._listener.settimeout(timeout)
+            try:
+                self._listener.recv(1)
+            except socket.timeout:
+                return False
+            return True
+        finally:
+            header["waiting"] = 0
+
+    def read_latest(self):
+        """Ultima posa non ancora letta come (tempo, posizioni, rotazioni, visibilità), o None"""
+        for _ in range(3):
+            head = int(self.header["head"])
+            if head == self.last_read:
+                return None
+            slot = self.ring[head % len(self.ring)]
+            if slot["seq"] != head:
+                continue
+            pose = (float(slot["time"]), slot["position"].copy(), slot["rotation"].copy(),
+                    slot["visible"].astype(bool))
+            if slot["seq"] != head:
+                continue  # riscritto durante la copia
+            self.poses_skipped += max(0, head - self.last_read - 1)
+            self.last_read = head
+            self.poses_read += 1
+            return pose
+        return None
+
+    def close(self):
+        for sock in (self._listener, self._waker):
+            if sock is not None:
+                sock.close()
+        self.ring = self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard(self.shm.name)
+
+
+class PoseSender:
+    """Invio delle pose dei tracker virtuali, comune a CameraTracker e MultiCameraTracker.
+
+    Chi la usa imposta client (OSCOutput verso SlimeVR) e pose_ring (None
+    finché non si chiama connect_pose_ring()).
+    """
+
+    def connect_pose_ring(self, ring=None):
+        """Invia le pose al bridge tramite PoseRing (quello dato o quello aperto
+        dal bridge in un altro processo); senza ring resta l'invio OSC"""
+        self.pose_ring = ring if ring is not None else PoseRing.attach()
+        return self.pose_ring is not None
+
+    def _send_tracking_data(self, data, frame_time=None):
+        """Invia i tracker visibili al bridge o via OSC, un bundle per frame"""
+        if self.pose_ring is not None:
+            self.pose_ring.publish(frame_time, data)
+            return
+        for tracker_id, tracker_data in data.items():
+            if tracker_data['visible']:
+                self.client.queue_tracker(tracker_id, tracker_data['position'], 'position')
+                self.client.queue_tracker(tracker_id, tracker_data['rotation'], 'rotation')
+        self.client.flush(frame_time)
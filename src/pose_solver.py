@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+
+LANDMARK_COUNT = 33
+
+# Indici dei landmark MediaPipe Pose usati dai tracker virtuali
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+LEFT_HEEL, RIGHT_HEEL = 29, 30
+LEFT_FOOT_INDEX, RIGHT_FOOT_INDEX = 31, 32
+
+HIPS = (LEFT_HIP, RIGHT_HIP)
+SHOULDERS = (LEFT_SHOULDER, RIGHT_SHOULDER)
+
+# Ogni tracker: posizione = media di due landmark; asse "su" (Y) e asse
+# secondario, laterale (X, 'side') o in avanti (Z, 'forward'), definiti da due
+# punti, ciascuno media di due landmark (da, a).
+TRACKERS = {
+    'hip': {'position': HIPS, 'up': (HIPS, SHOULDERS),
+            'side': ((RIGHT_HIP,) * 2, (LEFT_HIP,) * 2)},
+    'chest': {'position': SHOULDERS, 'up': (HIPS, SHOULDERS),
+              'side': ((RIGHT_SHOULDER,) * 2, (LEFT_SHOULDER,) * 2)},
+    'left_foot': {'position': (LEFT_ANKLE, LEFT_HEEL), 'up': ((LEFT_ANKLE,) * 2, (LEFT_KNEE,) * 2),
+                  'forward': ((LEFT_HEEL,) * 2, (LEFT_FOOT_INDEX,) * 2)},
+    'right_foot': {'position': (RIGHT_ANKLE, RIGHT_HEEL), 'up': ((RIGHT_ANKLE,) * 2, (RIGHT_KNEE,) * 2),
+                   'forward': ((RIGHT_HEEL,) * 2, (RIGHT_FOOT_INDEX,) * 2)},
+    'left_knee': {'position': (LEFT_KNEE,) * 2, 'up': ((LEFT_KNEE,) * 2, (LEFT_HIP,) * 2),
+                  'side': ((RIGHT_HIP,) * 2, (LEFT_HIP,) * 2)},
+    'right_knee': {'position': (RIGHT_KNEE,) * 2, 'up': ((RIGHT_KNEE,) * 2, (RIGHT_HIP,) * 2),
+                   'side': ((RIGHT_HIP,) * 2, (LEFT_HIP,) * 2)},
+    'left_elbow': {'position': (LEFT_ELBOW,) * 2, 'up': ((LEFT_ELBOW,) * 2, (LEFT_SHOULDER,) * 2),
+                   'side': ((RIGHT_SHOULDER,) * 2, (LEFT_SHOULDER,) * 2)},
+    'right_elbow': {'position': (RIGHT_ELBOW,) * 2, 'up': ((RIGHT_ELBOW,) * 2, (RIGHT_SHOULDER,) * 2),
+                    'side': ((RIGHT_SHOULDER,) * 2, (LEFT_SHOULDER,) * 2)},
+}
+
+DEFAULT_TRACKERS = ('hip', 'chest', 'left_foot', 'right_foot')
+
+
+def landmarks_to_array(landmarks, out=None):
+    """Copia i 33 landmark MediaPipe in un array (33, 4): x, y, z, visibility"""
+    if out is None:
+        out = np.empty((LANDMARK_COUNT, 4))
+    out[:] = [(l.x, l.y, l.z, l.visibility) for l in landmarks]
+    return out
+
+
+class PoseSolver:
+    """Calcola tutti i tracker virtuali dai 33 landmark in un unico passaggio.
+
+    Ogni tracker è una riga precalcolata di indici di landmark (posizione,
+    inizio e fine dell'asse "su", inizio e fine dell'asse secondario), così
+    il calcolo è un solo ciclo sulle righe. L'orientamento è costruito
+    dalla geometria dei landmark: asse Y lungo il segmento "su", asse X (o Z
+    per i piedi) lungo l'asse secondario reso ortogonale, il terzo asse dal
+    prodotto vettoriale; la rotazione viene
+    restituita come angoli di Eulero in gradi [x, y, z] (convenzione ZYX).
+    Le posizioni restano nelle coordinate normalizzate di MediaPipe, mentre
+    le rotazioni usano lo stesso sistema con Y e Z invertiti (Y verso l'alto),
+    così una persona in piedi di fronte alla webcam ha rotazione [0, 0, 0].
+    Il calcolo è in Python puro: con gli 8 tracker di TRACKERS costa meno
+    delle operazioni NumPy, il cui costo fisso per chiamata domina.
+    """
+
+    def __init__(self, trackers=DEFAULT_TRACKERS, visibility_threshold=0.5):
+        self.names = list(trackers)
+        self.visibility_threshold = visibility_threshold
+        # Per tracker: 5 punti da 2 landmark ciascuno, poi True se l'asse secondario è in avanti
+        self._rows = []
+        for name in self.names:
+            t = TRACKERS[name]
+            secondary = t.get('side') or t['forward']
+            points = (t['position'], t['up'][0], t['up'][1], secondary[0], secondary[1])
+            self._rows.append(tuple(point for pair in points for point in pair) + ('forward' in t,))
+
+    def solve(self, landmarks):
+        """Restituisce (posizioni (T, 3), rotazioni (T, 3) in gradi, visibilità (T,)) da un array
+        (33, 4) o da una lista di 33 righe x, y, z, visibility"""
+        positions, rotations, visible = self._solve(landmarks)
+        return np.array(positions), np.array(rotations), np.array(visible, dtype=bool)
+
+    def _solve(self, landmarks):
+        """Come solve(), ma restituisce tre liste"""
+        rows = landmarks.tolist() if isinstance(landmarks, np.ndarray) else landmarks
+        threshold = self.visibility_threshold
+        positions, rotations, visible = [], [], []
+        for p0, p1, u0, u1, v0, v1, w0, w1, s0, s1, forward in self._rows:
+            a, b = rows[p0], rows[p1]
+            positions.append([(a[0] + b[0]) / 2, (a[1] + b[1]) / 2, (a[2] + b[2]) / 2])
+            visible.append(a[3] > threshold and b[3] > threshold)
+
+            # Assi dai punti medi, in un sistema con Y verso l'alto e Z verso la webcam
+            a, b, c, d = rows[u0], rows[u1], rows[v0], rows[v1]
+            ux = (c[0] + d[0]) / 2 - (a[0] + b[0]) / 2
+            uy = (a[1] + b[1]) / 2 - (c[1] + d[1]) / 2
+            uz = (a[2] + b[2]) / 2 - (c[2] + d[2]) / 2
+            a, b, c, d = rows[w0], rows[w1], rows[s0], rows[s1]
+            sx = (c[0] + d[0]) / 2 - (a[0] + b[0]) / 2
+            sy = (a[1] + b[1]) / 2 - (c[1] + d[1]) / 2
+            sz = (a[2] + b[2]) / 2 - (c[2] + d[2]) / 2
+
+            # Base ortonormale con Gram-Schmidt; segmenti degeneri danno rotazione nulla
+            y_norm = math.sqrt(ux * ux + uy * uy + uz * uz)
+            scale = max(y_norm, 1e-9)
+            yx, yy, yz = ux / scale, uy / scale, uz / scale
+            dot = sx * yx + sy * yy + sz * yz
+            sx, sy, sz = sx - dot * yx, sy - dot * yy, sz - dot * yz
+            s_norm = math.sqrt(sx * sx + sy * sy + sz * sz)
+            if y_norm <= 1e-9 or s_norm <= 1e-9:
+                rotations.append([0.0, 0.0, 0.0])
+                continue
+            sx, sy, sz = sx / s_norm, sy / s_norm, sz / s_norm
+            if forward:
+                xx, xy, xz = yy * sz - yz * sy, yz * sx - yx * sz, yx * sy - yy * sx
+                zz = sz
+            else:
+                xx, xy, xz = sx, sy, sz
+                zz = sx * yy - sy * yx
+            # Matrice di rotazione con colonne X, Y, Z -> angoli di Eulero ZYX
+            rotations.append([math.degrees(math.atan2(yz, zz)),
+                              math.degrees(math.asin(min(max(-xz, -1.0), 1.0))),
+                              math.degrees(math.atan2(xy, xx))])
+        return positions, rotations, visible
+
+    def solve_landmarks(self, landmarks):
+        """Come solve_dict(), direttamente dalla lista di landmark MediaPipe
+        (copiati in una lista di tuple, senza passare da un array)"""
+        return self.solve_dict([(l.x, l.y, l.z, l.visibility) for l in landmarks])
+
+    def solve_dict(self, landmarks):
+        """Come solve(), nel formato {nome: {'position', 'rotation', 'visible'}}"""
+        positions, rotations, visible = self._solve(landmarks)
+        return {
+            name: {'position': position, 'rotation': rotation, 'visible': is_visible}
+            for name, position, rotation, is_visible in zip(self.names, positions, rotations, visible)
+        }
@@ -0,0 +1,142 @@
+import threading
+import time
+
+BOUNDARY = "frame"
+
+
+class PreviewStreamer:
+    """Anteprima MJPEG condivisa tra tutti i client.
+
+    Un solo thread codifica in JPEG l'ultimo frame della webcam, ridotto a
+    `width` pixel di larghezza e al massimo `max_fps` volte al secondo; il
+    risultato viene condiviso con tutti i browser collegati. Senza client
+    il thread si ferma e non si codifica nulla.
+    """
+
+    def __init__(self, width=480, quality=70, max_fps=15.0, draw_landmarks=True):
+        self.width = width
+        self.quality = quality
+        self.max_fps = max_fps
+        self.draw_landmarks = draw_landmarks
+        self.tracker = None
+        self.clients = 0
+        self.frames_encoded = 0
+        self._latest = (0, None)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def configure(self, width=None, quality=None, max_fps=None, draw_landmarks=None):
+        """Aggiorna le impostazioni; valgono dal frame successivo"""
+        # Si controlla tutto prima di applicare, così un valore errato non lascia modifiche a metà
+        if width is not None:
+            width = int(width)
+            if width <= 0:
+                raise ValueError("width deve essere maggiore di 0")
+        if quality is not None:
+            quality = int(quality)
+            if not 1 <= quality <= 100:
+                raise ValueError("quality deve essere compresa tra 1 e 100")
+        if max_fps is not None:
+            max_fps = float(max_fps)
+            if not max_fps > 0:
+                raise ValueError("max_fps deve essere maggiore di 0")
+        if width is not None:
+            self.width = width
+        if quality is not None:
+            self.quality = quality
+        if max_fps is not None:
+            self.max_fps = max_fps
+        if draw_landmarks is not None:
+            self.draw_landmarks = bool(draw_landmarks)
+
+    def _add_client(self):
+        with self._condition:
+            self.clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._encode_loop)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _remove_client(self):
+        with self._condition:
+            self.clients -= 1
+
+    def _encode_loop(self):
+        """Codifica i frame finché c'è almeno un client collegato"""
+        try:
+            self._encode_frames()
+        finally:
+            # Anche se la codifica fallisce, il prossimo client riavvia il thread;
+            # se è già partito un nuovo thread non va toccato
+            with self._condition:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _encode_frames(self):
+        last_seq = 0
+        next_frame = 0.0
+        while True:
+            with self._condition:
+                if self.clients <= 0:
+                    # Nella stessa sezione critica del controllo: un client che arriva
+                    # subito dopo trova _thread vuoto e avvia un nuovo encoder
+                    self._thread = None
+                    return
+            tracker = self.tracker
+            capture = tracker.capture if tracker is not None else None
+            if capture is None:
+                time.sleep(0.1)
+                continue
+
+            # Limita la frequenza di codifica a max_fps
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            latest = capture.wait_newer(last_seq, timeout=0.5)
+            if latest is None:
+                continue
+            last_seq, _, frame = latest
+            next_frame = time.monotonic() + 1.0 / self.max_fps
+
+            jpeg = self._encode(frame, tracker)
+            if jpeg is None:
+                continue
+            with self._condition:
+                self._latest = (self._latest[0] + 1, jpeg)
+                self.frames_encoded += 1
+                self._condition.notify_all()
+
+    def _encode(self, frame, tracker):
+        import cv2
+        height, width = frame.shape[:2]
+        if self.width and width > self.width:
+            frame = cv2.resize(frame, (self.width, int(height * self.width / width)),
+                               interpolation=cv2.INTER_AREA)
+        elif self.draw_landmarks:
+            # Si disegna su una copia: il frame pubblicato è condiviso
+            frame = frame.copy()
+
+        landmarks = getattr(tracker, 'last_landmarks', None)
+        if self.draw_landmarks and landmarks is not None:
+            import mediapipe as mp
+            mp.solutions.drawing_utils.draw_landmarks(
+                frame, landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes() if ok else None
+
+    def frames(self):
+        """Generatore multipart/x-mixed-replace per una risposta Flask"""
+        self._add_client()
+        try:
+            seq = 0
+            while self.tracker is not None:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._latest[0] > seq, timeout=1.0)
+                    if self._latest[0] <= seq:
+                        continue
+                    seq, jpeg = self._latest
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+        finally:
+            self._remove_client()
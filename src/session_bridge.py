@@ -0,0 +1,394 @@
+import threading
+import time
+
+from drift_engine import DriftEngine, is_numeric
+from jitter_buffer import JitterBuffer
+from metrics import REGISTRY
+from osc_bridge import JITTER_OUTPUT_RATE, PROCESSING, BridgeConfig
+from osc_output import OSCOutput
+from output_scheduler import OutputScheduler
+
+# Secondi senza messaggi dopo cui una sessione viene chiusa e i suoi slot liberati
+IDLE_TIMEOUT = 30.0
+# Ogni quanto si cercano le sessioni inattive
+EVICTION_INTERVAL = 1.0
+DEFAULT_ROUTE = ("127.0.0.1", 9002)
+
+
+def parse_routes(text):
+    """Converte "192.168.1.20=127.0.0.1:9010,..." in {ip del telefono: (host, porta)}"""
+    routes = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        sender, _, target = item.partition("=")
+        host, _, port = target.rpartition(":")
+        if not sender or not host or not port.isdigit():
+            raise ValueError(f"Instradamento non valido: {item} (formato: ip=host:porta)")
+        routes[sender] = (host, int(port))
+    return routes
+
+
+def session_label(sender):
+    return f"{sender[0]}:{sender[1]}"
+
+
+class SessionTable:
+    """Tabella compatta delle sessioni: una riga per mittente (ip, porta).
+
+    Le colonne sono liste parallele indicizzate dal numero di riga, come
+    gli slot di DriftEngine; rows porta dal mittente alla riga. Le righe
+    delle sessioni chiuse vengono riusate dalle nuove.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.senders = []
+        self.labels = []
+        self.outputs = []
+        self.calibrated = []
+        self.last_seen = []
+        self.messages = []
+        self.trackers = []
+        self._free = []
+        self.opened = 0
+        self.evicted = 0
+        # Messaggi delle sessioni già chiuse, per i totali
+        self.closed_messages = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def open(self, sender, output, calibrated, now):
+        """Aggiunge una sessione e ne restituisce la riga"""
+        values = (sender, session_label(sender), output, calibrated, now, 0, set())
+        columns = (self.senders, self.labels, self.outputs, self.calibrated, self.last_seen, self.messages,
+                   self.trackers)
+        if self._free:
+            row = self._free.pop()
+            for column, value in zip(columns, values):
+                column[row] = value
+        else:
+            row = len(self.senders)
+            for column, value in zip(columns, values):
+                column.append(value)
+        self.rows[sender] = row
+        self.opened += 1
+        return row
+
+    def close(self, row):
+        """Toglie una sessione e restituisce i suoi tracker"""
+        del self.rows[self.senders[row]]
+        trackers = self.trackers[row]
+        self.closed_messages += self.messages[row]
+        self.senders[row] = self.labels[row] = self.outputs[row] = None
+        self.trackers[row] = set()
+        self._free.append(row)
+        self.evicted += 1
+        return trackers
+
+    def idle(self, now, timeout):
+        """Righe delle sessioni senza messaggi da più di timeout secondi"""
+        last_seen = self.last_seen
+        return [row for row in self.rows.values() if now - last_seen[row] > timeout]
+
+
+class SessionBridge:
+    """Bridge per più utenti in un solo processo.
+
+    Ogni telefono, identificato dall'indirizzo (ip, porta) da cui invia, è
+    una sessione con calibrazione, uscita e statistiche proprie: due
+    telefoni che inviano entrambi /tracker/1 non si sovrascrivono più. Lo
+    stato di correzione di tutte le sessioni sta in un unico DriftEngine,
+    con chiave (riga della sessione, id del tracker), così un lotto di
+    pacchetti di più utenti si corregge con una sola correct_many().
+    Ogni sessione ha la propria uscita, verso il router scelto per ip del
+    telefono (routes) o default_route per gli altri. Le sessioni inattive
+    da idle_timeout secondi vengono chiuse, con i loro slot e la loro
+    uscita. Con calibrate_new le nuove sessioni partono calibrate,
+    altrimenti aspettano calibrate(). output_rate e jitter_delay funzionano
+    come in AntiDriftBridge, con uno scheduler per sessione: i tracker di
+    due utenti non si scartano né si interpolano a vicenda.
+    Espone config, is_calibrated, calibrate(), set_parameters() e
+    telemetry_snapshot() come AntiDriftBridge, per l'interfaccia web.
+    """
+
+    def __init__(self, routes=None, default_route=DEFAULT_ROUTE, bundles=False, backend="python",
+                 drift_window=0, idle_timeout=IDLE_TIMEOUT, calibrate_new=False, output_factory=OSCOutput,
+                 output_rate=None, jitter_delay=None):
+        self.routes = dict(routes or {})
+        self.default_route = default_route
+        self.bundles = bundles
+        self.output_rate = output_rate
+        self.jitter_delay = jitter_delay
+        # Con uno scheduler in uscita i campioni si consegnano con submit()
+        self._scheduled = jitter_delay is not None or bool(output_rate)
+        # Timetag del bundle in elaborazione, impostato dal server asyncio
+        self._sender_time = None
+        self.idle_timeout = idle_timeout
+        self.calibrate_new = calibrate_new
+        self.output_factory = output_factory
+        self.config = BridgeConfig(drift_threshold=5.0, filter_coefficient=0.85, drift_window=drift_window)
+        self.engine = DriftEngine(self.config.drift_threshold, self.config.filter_coefficient, capacity=64,
+                                  window=drift_window)
+        try:
+            self.engine.set_backend(backend)
+        except RuntimeError as e:
+            print(f"Attenzione: {e}; uso il backend Python")
+        self.sessions = SessionTable()
+        # Router già segnalati come condivisi da più sessioni
+        self._shared_routes = set()
+        # Serializza apertura e chiusura delle sessioni, calibrazioni, cambi di
+        # parametri e correzioni: la calibrazione di una sessione azzera i suoi
+        # slot nel motore condiviso, che quindi non si può sostituire per intero
+        self._update_lock = threading.Lock()
+        self._tick = None
+        self._next_eviction = time.monotonic() + EVICTION_INTERVAL
+        self.telemetry = {}
+        # Correzioni e datagrammi delle sessioni già chiuse, per i totali
+        self.closed_corrections = 0
+        self.closed_datagrams = 0
+        self._register_metrics()
+
+    @property
+    def drift_threshold(self):
+        return self.config.drift_threshold
+
+    @property
+    def filter_coefficient(self):
+        return self.config.filter_coefficient
+
+    @property
+    def is_calibrated(self):
+        """True se tutte le sessioni aperte sono calibrate"""
+        sessions = self.sessions
+        rows = list(sessions.rows.values())
+        if not rows:
+            return self.calibrate_new
+        return all(sessions.calibrated[row] for row in rows)
+
+    def _register_metrics(self):
+        """Metriche per sessione lette al momento dello scrape"""
+        REGISTRY.function("gauge", "antidrift_sessions", "Sessioni aperte", lambda: len(self.sessions))
+        REGISTRY.function("counter", "antidrift_sessions_evicted_total", "Sessioni chiuse per inattività",
+                          lambda: self.sessions.evicted)
+        REGISTRY.function("counter", "antidrift_session_messages_total", "Messaggi ricevuti per sessione",
+                          lambda: {(stats['session'],): stats['messages'] for stats in self.session_stats()},
+                          ("session",))
+        REGISTRY.function("counter", "antidrift_session_corrections_total",
+                          "Correzioni del drift scattate per sessione",
+                          lambda: {(stats['session'],): stats['corrections'] for stats in self.session_stats()},
+                          ("session",))
+
+    def _open_output(self, target):
+        """Uscita di una sessione verso un router SlimeVR, dietro il suo scheduler se c'è"""
+        output = self.output_factory(*target, bundles=self.bundles)
+        if self.jitter_delay is not None:
+            output = JitterBuffer(output, self.output_rate or JITTER_OUTPUT_RATE, self.jitter_delay)
+            output.start()
+        elif self.output_rate:
+            output = OutputScheduler(output, self.output_rate)
+            output.start()
+        return output
+
+    @staticmethod
+    def _close_output(output):
+        """Ferma lo scheduler e chiude l'uscita; restituisce i datagrammi inviati"""
+        if isinstance(output, OutputScheduler):
+            output.stop()
+            output = output.output
+        output.close()
+        return getattr(output, 'datagrams_sent', 0)
+
+    def _open_session(self, sender, now):
+        with self._update_lock:
+            row = self.sessions.rows.get(sender)
+            if row is None:
+                target = self.routes.get(sender[0], self.default_route)
+                self._check_shared_route(sender, target)
+                output = self._open_output(target)
+                row = self.sessions.open(sender, output, self.calibrate_new, now)
+                print(f"Nuova sessione: {session_label(sender)}")
+        return row
+
+    def _check_shared_route(self, sender, target):
+        """Avvisa (una volta per router) se un'altra sessione aperta invia già allo stesso router:
+        SlimeVR riceve gli stessi /tracker/<id> da entrambe e non può distinguerle"""
+        if target in self._shared_routes:
+            return
+        sessions = self.sessions
+        for row in sessions.rows.values():
+            if self.routes.get(sessions.senders[row][0], self.default_route) == target:
+                self._shared_routes.add(target)
+                print(f"Attenzione: {session_label(sender)} e {sessions.labels[row]} inviano entrambe a "
+                      f"{session_label(target)} e SlimeVR non distingue i loro tracker; "
+                      f"usa --route per dare a ogni telefono il suo router")
+                return
+
+    def handle_tracker_data(self, client_address, address, *args):
+        """Gestisce i dati di un tracker; va registrato con needs_reply_address=True"""
+        start = time.perf_counter()
+        now = time.monotonic()
+        sessions = self.sessions
+        row = sessions.rows.get(client_address)
+        if row is None:
+            row = self._open_session(client_address, now)
+        tracker_id = address.split('/')[-1]
+        sessions.messages[row] += 1
+        sessions.last_seen[row] = now
+        trackers = sessions.trackers[row]
+        if tracker_id not in trackers:
+            trackers.add(tracker_id)
+        key = (row, tracker_id)
+
+        if not sessions.calibrated[row]:
+            with self._update_lock:
+                self.engine.set_reference(key, args)
+            self.telemetry[f"{sessions.labels[row]}/{tracker_id}"] = (time.time(), args, None)
+        elif self._tick is not None:
+            self._tick.append((row, tracker_id, args, self._sender_time))
+            return
+        else:
+            with self._update_lock:
+                corrected = self.engine.correct(key, list(args))
+            self.telemetry[f"{sessions.labels[row]}/{tracker_id}"] = (time.time(), args, corrected)
+            if self._scheduled:
+                sessions.outputs[row].submit(tracker_id, corrected, self._sender_time)
+            else:
+                sessions.outputs[row].send_tracker(tracker_id, corrected)
+            PROCESSING.observe(time.perf_counter() - start, ("message",))
+        if now >= self._next_eviction:
+            self.evict_idle(now)
+
+    def set_sender_time(self, sender_time):
+        """Timetag del mittente per i messaggi che seguono (None = tempo di arrivo)"""
+        self._sender_time = sender_time
+
+    def begin_tick(self):
+        """Inizia a raccogliere i campioni di un lotto di pacchetti"""
+        self._tick = []
+
+    def end_tick(self):
+        """Corregge insieme i campioni di tutte le sessioni e li invia alle rispettive uscite"""
+        tick, self._tick = self._tick, None
+        now = time.monotonic()
+        if tick:
+            start = time.perf_counter()
+            sessions = self.sessions
+            with self._update_lock:
+                try:
+                    corrected = self.engine.correct_many([(row, tracker_id) for row, tracker_id, _, _ in tick],
+                                                         [sample for _, _, sample, _ in tick])
+                except (TypeError, ValueError):
+                    # Un campione non numerico fa fallire tutto il lotto: si scarta solo lui
+                    tick = [entry for entry in tick if is_numeric(entry[2])]
+                    corrected = self.engine.correct_many([(row, tracker_id) for row, tracker_id, _, _ in tick],
+                                                         [sample for _, _, sample, _ in tick])
+            wall = time.time()
+            telemetry = self.telemetry
+            labels, outputs = sessions.labels, sessions.outputs
+            scheduled = self._scheduled
+            touched = set()
+            for (row, tracker_id, sample, sender_time), values in zip(tick, corrected):
+                values = values[:len(sample)].tolist()
+                telemetry[f"{labels[row]}/{tracker_id}"] = (wall, sample, values)
+                output = outputs[row]
+                if scheduled:
+                    output.submit(tracker_id, values, sender_time)
+                    continue
+                output.queue_tracker(tracker_id, values)
+                touched.add(output)
+            for output in touched:
+                output.flush()
+            PROCESSING.observe(time.perf_counter() - start, ("tick",))
+        if now >= self._next_eviction:
+            self.evict_idle(now)
+
+    def evict_idle(self, now=None):
+        """Chiude le sessioni inattive da più di idle_timeout secondi"""
+        now = time.monotonic() if now is None else now
+        self._next_eviction = now + EVICTION_INTERVAL
+        with self._update_lock:
+            sessions = self.sessions
+            for row in sessions.idle(now, self.idle_timeout):
+                label = sessions.labels[row]
+                output = sessions.outputs[row]
+                trackers = sessions.close(row)
+                self.closed_datagrams += self._close_output(output)
+                keys = [(row, tracker_id) for tracker_id in trackers]
+                self.closed_corrections += sum(self.engine.triggers[self.engine.slots[key]] for key in keys
+                                               if key in self.engine.slots)
+                self.engine.release(keys)
+                for tracker_id in trackers:
+                    self.telemetry.pop(f"{label}/{tracker_id}", None)
+                print(f"Sessione chiusa per inattività: {label}")
+
+    def _find(self, session):
+        """Riga di una sessione data come "ip:porta" o (ip, porta)"""
+        sessions = self.sessions
+        if isinstance(session, str):
+            for row in sessions.rows.values():
+                if sessions.labels[row] == session:
+                    return row
+            raise KeyError(f"Sessione sconosciuta: {session}")
+        return sessions.rows[tuple(session)]
+
+    def calibrate(self, session=None):
+        """Calibra una sessione ("ip:porta") o, senza argomenti, tutte quelle aperte"""
+        print("Calibrazione in corso...")
+        with self._update_lock:
+            sessions = self.sessions
+            rows = list(sessions.rows.values()) if session is None else [self._find(session)]
+            for row in rows:
+                # Prima si azzera lo stato, poi la sessione comincia a correggere
+                self.engine.clear([(row, tracker_id) for tracker_id in sessions.trackers[row]])
+                sessions.calibrated[row] = True
+        print(f"Calibrazione completata ({len(rows)} sessioni)")
+
+    def set_parameters(self, drift_threshold=None, filter_coefficient=None, drift_window=None):
+        """Imposta i parametri di correzione di tutte le sessioni"""
+        with self._update_lock:
+            self.config = self.config.updated(drift_threshold, filter_coefficient, drift_window)
+            self.engine.set_parameters(drift_threshold, filter_coefficient)
+            if drift_window is not None:
+                self.engine.set_window(drift_window)
+
+    def telemetry_snapshot(self):
+        """Ultimo campione grezzo e corretto di ogni tracker, con chiave "ip:porta/id" """
+        return dict(self.telemetry)
+
+    def session_stats(self):
+        """Messaggi, correzioni, tracker, uscita e inattività di ogni sessione aperta"""
+        sessions = self.sessions
+        engine = self.engine
+        now = time.monotonic()
+        stats = []
+        for sender, row in list(sessions.rows.items()):
+            slots = [engine.slots.get((row, tracker_id)) for tracker_id in list(sessions.trackers[row])]
+            stats.append({
+                'session': session_label(sender),
+                'output': session_label(self.routes.get(sender[0], self.default_route)),
+                'trackers': len(slots),
+                'messages': sessions.messages[row],
+                'corrections': sum(engine.triggers[slot] for slot in slots if slot is not None),
+                'calibrated': sessions.calibrated[row],
+                'idle_seconds': now - sessions.last_seen[row],
+            })
+        return stats
+
+    def totals(self):
+        """Messaggi ricevuti, correzioni e datagrammi inviati da quando il bridge è partito"""
+        sessions = self.sessions
+        messages = sessions.closed_messages + sum(sessions.messages[row] for row in list(sessions.rows.values()))
+        corrections = self.closed_corrections + sum(self.engine.triggers)
+        datagrams = self.closed_datagrams
+        for row in list(sessions.rows.values()):
+            output = sessions.outputs[row]
+            if isinstance(output, OutputScheduler):
+                output = output.output
+            datagrams += getattr(output, 'datagrams_sent', 0)
+        return messages, corrections, datagrams
+
+    def stop(self):
+        with self._update_lock:
+            sessions = self.sessions
+            for row in list(sessions.rows.values()):
+                self.closed_datagrams += self._close_output(sessions.outputs[row])
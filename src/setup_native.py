@@ -0,0 +1,21 @@
+"""Compila il backend nativo di DriftEngine (opzionale).
+
+Uso, dalla cartella src: python setup_native.py build_ext --inplace
+Senza il modulo compilato il bridge usa il backend Python.
+"""
+import sys
+
+from setuptools import Extension, setup
+
+# Niente fused multiply-add: i risultati devono coincidere con quelli NumPy
+extra_compile_args = [] if sys.platform == "win32" else ["-O2", "-ffp-contract=off", "-std=c++11"]
+
+setup(
+    name="antidrift_native",
+    ext_modules=[
+        Extension("antidrift_native",
+                  sources=["antidrift_native.cpp", "AntiDriftAlgorithm.cpp"],
+                  language="c++",
+                  extra_compile_args=extra_compile_args),
+    ],
+)
@@ -0,0 +1,373 @@
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+from pythonosc import dispatcher
+
+from osc_bridge import BridgeConfig
+from osc_ingest import AsyncIOIngestServer
+from metrics import REGISTRY
+from session_bridge import IDLE_TIMEOUT, SessionBridge
+
+# reuseport: ogni worker apre la stessa porta e il kernel distribuisce i
+# mittenti; dispatcher: un thread riceve e inoltra ai worker per mittente
+SHARD_MODES = ("reuseport", "dispatcher")
+# SO_REUSEPORT bilancia l'UDP tra i socket solo su Linux
+DEFAULT_MODE = "reuseport" if sys.platform.startswith("linux") else "dispatcher"
+
+# Campi di control
+VERSION, DRIFT_THRESHOLD, FILTER_COEFFICIENT, CALIBRATION, DRIFT_WINDOW = range(5)
+# Campi dei contatori di ogni shard
+SEQ, MESSAGES_IN, CORRECTIONS, DATAGRAMS = range(4)
+
+# Righe di telemetria per shard: una per tracker di ogni sessione
+TRACKERS_PER_SHARD = 256
+# Indirizzo IPv4 e porta del mittente davanti ai datagrammi inoltrati
+_FORWARD_HEADER = struct.Struct("!4sH")
+
+
+def _tracker_dtype(width):
+    return np.dtype([("id", "S64"), ("time", "f8"), ("raw_len", "i8"), ("raw", "f8", (width,)),
+                     ("corrected_len", "i8"), ("corrected", "f8", (width,))])
+
+
+class SharedState:
+    """Stato condiviso tra il supervisore e i worker, in memoria condivisa.
+
+    control contiene versione, parametri e generazione della calibrazione:
+    scrive solo il supervisore, che porta la versione a un valore dispari
+    prima di scrivere e di nuovo pari dopo; i worker la confrontano a ogni
+    lotto e scartano le letture con versione dispari o cambiata nel mezzo.
+    counters e trackers hanno una riga per shard, scritta solo dal suo
+    worker con lo stesso schema su SEQ, così il supervisore scarta le
+    letture a metà.
+    """
+
+    def __init__(self, context, shards, width=4):
+        self.shards = shards
+        self.width = width
+        self.control = context.RawArray('d', 5)
+        self.counters = context.RawArray('q', shards * 4)
+        self.table = context.RawArray('b', shards * TRACKERS_PER_SHARD * _tracker_dtype(width).itemsize)
+
+    def trackers(self):
+        """Vista NumPy (shard, tracker) della tabella dei tracker"""
+        table = np.frombuffer(self.table, dtype=_tracker_dtype(self.width))
+        return table.reshape(self.shards, TRACKERS_PER_SHARD)
+
+
+class ForwardedIngestServer(AsyncIOIngestServer):
+    """Server di un worker in modalità dispatcher: legge i datagrammi inoltrati
+    dal supervisore e ripristina l'indirizzo del mittente originale"""
+
+    def __init__(self, dispatcher, **kwargs):
+        super().__init__(("127.0.0.1", 0), dispatcher, **kwargs)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._recv = self.socket.recv
+        self.recvfrom = self._recv_forwarded
+
+    def _recv_forwarded(self, size):
+        data = self._recv(size)
+        host, port = _FORWARD_HEADER.unpack_from(data)
+        return data[_FORWARD_HEADER.size:], (socket.inet_ntoa(host), port)
+
+
+class ShardWorker:
+    """Lato worker: applica al SessionBridge locale i cambi pubblicati dal
+    supervisore e pubblica contatori e ultimi valori dei tracker"""
+
+    def __init__(self, index, bridge, state):
+        self.index = index
+        self.bridge = bridge
+        self.state = state
+        self.version = 0.0
+        self.calibration = 0.0
+        self._trackers = state.trackers()[index]
+
+    def sync(self):
+        """Controlla la versione di control: costa una lettura se non è cambiato nulla"""
+        control = self.state.control
+        for _ in range(10):
+            version = control[VERSION]
+            if version == self.version:
+                return
+            if version % 2 == 0:
+                config = BridgeConfig(control[DRIFT_THRESHOLD], control[FILTER_COEFFICIENT],
+                                      int(control[DRIFT_WINDOW]))
+                calibration = control[CALIBRATION]
+                if control[VERSION] == version:
+                    break
+        else:
+            return  # il supervisore sta ancora scrivendo: riprova al prossimo lotto
+        if config != self.bridge.config:
+            self.bridge.set_parameters(*config)
+        if calibration != self.calibration:
+            self.calibration = calibration
+            self.bridge.calibrate()
+            # Come nel bridge a un processo: dopo la calibrazione i nuovi telefoni vengono corretti subito
+            self.bridge.calibrate_new = True
+        self.version = version
+
+    def begin_tick(self):
+        self.sync()
+        self.bridge.begin_tick()
+
+    def publish(self):
+        """Copia contatori e telemetria del bridge nella riga di questo shard"""
+        counters = self.state.counters
+        base = self.index * 4
+        trackers = self._trackers
+        width = self.state.width
+        snapshot = list(self.bridge.telemetry_snapshot().items())[:TRACKERS_PER_SHARD]
+        counters[base + SEQ] += 1
+        messages, corrections, datagrams = self.bridge.totals()
+        counters[base + MESSAGES_IN] = messages
+        counters[base + CORRECTIONS] = corrections
+        counters[base + DATAGRAMS] = datagrams
+        for row, (tracker_id, (timestamp, raw, corrected)) in enumerate(snapshot):
+            raw = list(raw)[:width]
+            corrected = [] if corrected is None else list(corrected)[:width]
+            trackers[row] = (tracker_id.encode()[:64], timestamp,
+                             len(raw), raw + [0.0] * (width - len(raw)),
+                             len(corrected), corrected + [0.0] * (width - len(corrected)))
+        trackers["time"][len(snapshot):] = 0.0
+        counters[base + SEQ] += 1
+
+
+def _reuseport_socket(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(address)
+    return sock
+
+
+def _shard_worker(index, mode, listen, output, routes, idle_timeout, bundles, output_rate, backend, jitter_delay,
+                  state, ready, stop):
+    """Processo di uno shard: un SessionBridge con ingresso asyncio, una sessione per telefono"""
+    bridge = SessionBridge(routes=routes, default_route=output, bundles=bundles, backend=backend,
+                           idle_timeout=idle_timeout, output_rate=output_rate, jitter_delay=jitter_delay)
+    worker = ShardWorker(index, bridge, state)
+    worker.sync()
+    disp = dispatcher.Dispatcher()
+    disp.map("/tracker/*", bridge.handle_tracker_data, needs_reply_address=True)
+    if mode == "reuseport":
+        server = AsyncIOIngestServer(listen, disp, on_batch_start=worker.begin_tick,
+                                     on_batch_end=bridge.end_tick, sock=_reuseport_socket(listen),
+                                     on_message_time=bridge.set_sender_time)
+    else:
+        server = ForwardedIngestServer(disp, on_batch_start=worker.begin_tick, on_batch_end=bridge.end_tick,
+                                       on_message_time=bridge.set_sender_time)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.wait_ready()
+    ready.put((index, server.server_address[1]))
+    while not stop.wait(0.1):
+        worker.publish()
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    worker.publish()
+    bridge.stop()
+
+
+class ShardedBridge:
+    """Bridge su più processi per servire più utenti sulla stessa macchina.
+
+    Ogni worker esegue un SessionBridge e riceve sempre gli stessi
+    mittenti: più telefoni sullo stesso worker restano sessioni separate,
+    lo stato di correzione di un telefono sta in un solo processo e il
+    percorso caldo non condivide nulla. routes e idle_timeout valgono per
+    le sessioni di ogni worker come in SessionBridge. Parametri e
+    calibrazione passano ai worker tramite SharedState; contatori e
+    ultimi valori dei tracker tornano al supervisore nello stesso modo.
+    Espone config, is_calibrated, calibrate(), set_parameters() e
+    telemetry_snapshot() come AntiDriftBridge, per l'interfaccia web.
+    """
+
+    def __init__(self, workers=None, mode=None, listen=("0.0.0.0", 12345),
+                 output=("127.0.0.1", 9002), bundles=False, output_rate=None, backend="python",
+                 drift_threshold=5.0, filter_coefficient=0.85, drift_window=0, jitter_delay=None,
+                 routes=None, idle_timeout=IDLE_TIMEOUT):
+        mode = mode or DEFAULT_MODE
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Modalità di sharding sconosciuta: {mode}")
+        if mode == "reuseport" and not hasattr(socket, "SO_REUSEPORT"):
+            raise ValueError("SO_REUSEPORT non disponibile su questo sistema: usa la modalità dispatcher")
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.listen = listen
+        self.output = output
+        self.routes = dict(routes or {})
+        self.idle_timeout = idle_timeout
+        self.bundles = bundles
+        self.output_rate = output_rate
+        self.backend = backend
+        self.jitter_delay = jitter_delay
+        self._context = multiprocessing.get_context()
+        self.state = SharedState(self._context, self.workers)
+        control = self.state.control
+        control[DRIFT_THRESHOLD] = drift_threshold
+        control[FILTER_COEFFICIENT] = filter_coefficient
+        control[DRIFT_WINDOW] = drift_window
+        control[VERSION] = 2
+        self._update_lock = threading.Lock()
+        self._stop = self._context.Event()
+        self.processes = []
+        self.dispatcher_thread = None
+        self.datagrams_forwarded = 0
+        self._register_metrics()
+
+    @property
+    def config(self):
+        control = self.state.control
+        return BridgeConfig(control[DRIFT_THRESHOLD], control[FILTER_COEFFICIENT], int(control[DRIFT_WINDOW]))
+
+    @property
+    def is_calibrated(self):
+        return self.state.control[CALIBRATION] > 0
+
+    def _register_metrics(self):
+        """Metriche lette dai contatori condivisi dei worker"""
+        REGISTRY.function("counter", "antidrift_shard_messages_total", "Messaggi ricevuti per shard",
+                          lambda: {(str(i),): stats['messages'] for i, stats in enumerate(self.shard_stats())},
+                          ("shard",))
+        REGISTRY.function("counter", "antidrift_shard_corrections_total",
+                          "Correzioni del drift scattate per shard",
+                          lambda: {(str(i),): stats['corrections'] for i, stats in enumerate(self.shard_stats())},
+                          ("shard",))
+        REGISTRY.function("gauge", "antidrift_calibrated", "1 se il bridge è calibrato",
+                          lambda: int(self.is_calibrated))
+
+    def start(self, timeout=30.0):
+        """Avvia i worker e, in modalità dispatcher, il thread che li alimenta"""
+        ready = self._context.Queue()
+        self._stop.clear()
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=_shard_worker,
+                args=(index, self.mode, self.listen, self.output, self.routes, self.idle_timeout, self.bundles,
+                      self.output_rate, self.backend, self.jitter_delay, self.state, ready, self._stop))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+        ports = dict(ready.get(timeout=timeout) for _ in range(self.workers))
+        if self.mode == "dispatcher":
+            targets = [("127.0.0.1", ports[index]) for index in range(self.workers)]
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            self._socket.bind(self.listen)
+            self._socket.settimeout(0.5)
+            self.dispatcher_thread = threading.Thread(target=self._dispatch_loop, args=(targets,))
+            self.dispatcher_thread.daemon = True
+            self.dispatcher_thread.start()
+        print(f"Bridge avviato su {self.workers} processi (modalità {self.mode})")
+
+    def _dispatch_loop(self, targets):
+        """Inoltra ogni datagramma al worker del suo mittente, con l'indirizzo in testa"""
+        recvfrom = self._socket.recvfrom
+        out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sendto = out.sendto
+        routes = {}
+        while not self._stop.is_set():
+            try:
+                data, addr = recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stop.is_set():
+                    break
+                continue
+            route = routes.get(addr)
+            if route is None:
+                if len(routes) > 4096:
+                    routes.clear()
+                route = routes[addr] = (_FORWARD_HEADER.pack(socket.inet_aton(addr[0]), addr[1]),
+                                        targets[hash(addr) % len(targets)])
+            sendto(route[0] + data, route[1])
+            self.datagrams_forwarded += 1
+        out.close()
+
+    def stop(self):
+        """Ferma il dispatcher e i worker"""
+        self._stop.set()
+        if self.dispatcher_thread is not None:
+            self.dispatcher_thread.join()
+            self._socket.close()
+            self.dispatcher_thread = None
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def _publish_control(self, values):
+        """Scrive i campi di control tra due incrementi della versione:
+        dispari durante la scrittura, pari quando è completa"""
+        with self._update_lock:
+            control = self.state.control
+            control[VERSION] += 1
+            for field, value in values.items():
+                control[field] = value
+            control[VERSION] += 1
+
+    def calibrate(self):
+        """Chiede a tutti i worker di calibrare al prossimo lotto"""
+        print("Calibrazione in corso...")
+        self._publish_control({CALIBRATION: self.state.control[CALIBRATION] + 1})
+        print("Calibrazione inviata ai worker")
+
+    def set_parameters(self, drift_threshold=None, filter_coefficient=None, drift_window=None):
+        """Imposta i parametri di correzione di tutti i worker"""
+        self.config.updated(drift_threshold, filter_coefficient, drift_window)
+        values = {}
+        if drift_threshold is not None:
+            values[DRIFT_THRESHOLD] = drift_threshold
+        if filter_coefficient is not None:
+            values[FILTER_COEFFICIENT] = filter_coefficient
+        if drift_window is not None:
+            values[DRIFT_WINDOW] = int(drift_window)
+        self._publish_control(values)
+
+    def _read_shard(self, index, read):
+        counters = self.state.counters
+        for _ in range(10):
+            seq = counters[index * 4 + SEQ]
+            if seq % 2 == 0:
+                result = read()
+                if counters[index * 4 + SEQ] == seq:
+                    return result
+            time.sleep(0.001)
+        return read()
+
+    def shard_stats(self):
+        """Messaggi, correzioni e datagrammi inviati di ogni shard"""
+        counters = self.state.counters
+        stats = []
+        for index in range(self.workers):
+            base = index * 4
+            stats.append(self._read_shard(index, lambda: {
+                'messages': counters[base + MESSAGES_IN],
+                'corrections': counters[base + CORRECTIONS],
+                'datagrams_sent': counters[base + DATAGRAMS]}))
+        return stats
+
+    def telemetry_snapshot(self):
+        """Ultimo campione grezzo e corretto dei tracker di tutti gli shard, con chiave "ip:porta/id".
+
+        Ogni telefono è servito da un solo shard, quindi le chiavi non si ripetono tra shard.
+        """
+        telemetry = {}
+        trackers = self.state.trackers()
+        for index in range(self.workers):
+            rows = self._read_shard(index, lambda: trackers[index].copy())
+            for row in rows[rows["time"] > 0]:
+                corrected = row["corrected"][:row["corrected_len"]].tolist() if row["corrected_len"] else None
+                telemetry[row["id"].decode()] = (float(row["time"]), row["raw"][:row["raw_len"]].tolist(),
+                                                 corrected)
+        return telemetry
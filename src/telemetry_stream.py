@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+
+
+class TelemetryStreamer:
+    """Telemetria live dei tracker via Server-Sent Events, condivisa tra i client.
+
+    Un solo thread legge `rate` volte al secondo la snapshot pubblicata dal
+    bridge (senza lock, vedi AntiDriftBridge.telemetry_snapshot) e prepara
+    un unico payload JSON con i tracker aggiornati dall'ultimo invio; tutti
+    i browser collegati ricevono lo stesso payload. Senza client il thread
+    si ferma, quindi il bridge non paga nulla oltre alla pubblicazione.
+    """
+
+    def __init__(self, rate=20.0):
+        self.rate = rate
+        self.bridge = None
+        self.clients = 0
+        self.payloads_built = 0
+        self._latest = (0, None)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def configure(self, rate=None):
+        """Aggiorna la frequenza di invio; vale dal ciclo successivo"""
+        if rate is not None:
+            rate = float(rate)
+            if rate <= 0:
+                raise ValueError("rate deve essere maggiore di 0")
+            self.rate = rate
+
+    def _add_client(self):
+        with self._condition:
+            self.clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._publish_loop)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _remove_client(self):
+        with self._condition:
+            self.clients -= 1
+
+    def _publish_loop(self):
+        """Prepara un payload per ciclo finché c'è almeno un client collegato"""
+        sent = {}
+        next_push = time.monotonic()
+        while True:
+            with self._condition:
+                if self.clients <= 0:
+                    self._thread = None
+                    return
+            next_push += 1.0 / self.rate
+            delay = next_push - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_push = time.monotonic()
+
+            bridge = self.bridge
+            if bridge is None:
+                continue
+            now = time.time()
+            trackers = {}
+            for tracker_id, (timestamp, raw, corrected) in bridge.telemetry_snapshot().items():
+                # Solo i tracker aggiornati dall'ultimo invio
+                if sent.get(tracker_id) == timestamp:
+                    continue
+                sent[tracker_id] = timestamp
+                trackers[tracker_id] = {'raw': list(raw), 'corrected': corrected,
+                                        'age_ms': (now - timestamp) * 1000.0}
+            if not trackers:
+                continue
+            payload = json.dumps({'time': now, 'calibrated': bridge.is_calibrated, 'trackers': trackers})
+            with self._condition:
+                self._latest = (self._latest[0] + 1, payload)
+                self.payloads_built += 1
+                self._condition.notify_all()
+
+    def events(self):
+        """Generatore text/event-stream per una risposta Flask"""
+        self._add_client()
+        try:
+            seq = 0
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._latest[0] > seq, timeout=5.0)
+                    latest = self._latest if self._latest[0] > seq else None
+                if latest is None:
+                    # Commento SSE: tiene viva la connessione e rileva i client chiusi
+                    yield ": keepalive\n\n"
+                    continue
+                seq, payload = latest
+                yield f"data: {payload}\n\n"
+        finally:
+            self._remove_client()
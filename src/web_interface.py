@@ -1,12 +1,22 @@
-from flask import Flask, render_template_string, jsonify, request
+from flask import Flask, Response, render_template_string, jsonify, request
 import threading
 from pythonosc import udp_client
 import json
 import os
-from camera_tracking import CameraTracker, select_camera
+from preview_stream import BOUNDARY, PreviewStreamer
+from camera_discovery import DISCOVERY
+from multi_camera import MultiCameraTracker
+from metrics import REGISTRY
+from telemetry_stream import TelemetryStreamer
 
 app = Flask(__name__)
 camera_tracker = None
+preview = PreviewStreamer()
+camera_discovery = DISCOVERY
+telemetry = TelemetryStreamer()
+output_bundles = False
+# Bridge OSC in esecuzione, passato da main.py
+bridge = None
 
 # Template HTML integrato
 HTML_TEMPLATE = """
@@ -37,17 +47,21 @@ HTML_TEMPLATE = """
         function saveSettings() {
             var threshold = document.getElementById('driftThreshold').value;
             var coefficient = document.getElementById('filterCoefficient').value;
+            var window = document.getElementById('driftWindow').value;
             
             fetch('/settings', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({
                     drift_threshold: parseFloat(threshold),
-                    filter_coefficient: parseFloat(coefficient)
+                    filter_coefficient: parseFloat(coefficient),
+                    drift_window: parseInt(window)
                 })
             })
-            .then(function(response) {
-                showMessage(response.ok ? 'Impostazioni salvate!' : 'Errore nel salvare', !response.ok);
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                var ok = data.status === 'success';
+                showMessage(ok ? 'Impostazioni salvate!' : 'Errore nel salvare: ' + data.message, !ok);
             })
             .catch(function(error) {
                 showMessage('Errore: ' + error, true);
@@ -57,8 +71,10 @@ HTML_TEMPLATE = """
         // Funzione per la calibrazione
         function calibrate() {
             fetch('/calibrate', { method: 'POST' })
-            .then(function(response) {
-                showMessage(response.ok ? 'Calibrazione completata!' : 'Errore nella calibrazione', !response.ok);
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                var ok = data.status === 'success';
+                showMessage(ok ? 'Calibrazione completata!' : 'Errore nella calibrazione: ' + data.message, !ok);
             })
             .catch(function(error) {
                 showMessage('Errore: ' + error, true);
@@ -67,10 +83,9 @@ HTML_TEMPLATE = """
 
         // Gestione della camera
         var cameraActive = false;
-        var previewInterval = null;
 
-        function loadCameras() {
-            fetch('/get_cameras')
+        function loadCameras(refresh) {
+            fetch('/get_cameras' + (refresh ? '?refresh=1' : ''))
             .then(response => response.json())
             .then(data => {
                 const select = document.getElementById('cameraSelect');
@@ -79,7 +94,7 @@ HTML_TEMPLATE = """
                 data.cameras.forEach(camera => {
                     const option = document.createElement('option');
                     option.value = camera.id;
-                    option.textContent = camera.name;
+                    option.textContent = camera.in_use ? camera.name + ' (in uso)' : camera.name;
                     select.appendChild(option);
                 });
 
@@ -95,19 +110,12 @@ HTML_TEMPLATE = """
         function refreshCameras() {
             const refreshBtn = document.querySelector('button[onclick="refreshCameras()"] i');
             refreshBtn.className = 'fas fa-sync-alt fa-spin';
-            loadCameras();
+            loadCameras(true);
             setTimeout(() => {
                 refreshBtn.className = 'fas fa-sync-alt';
             }, 1000);
         }
 
-        function updatePreview() {
-            if (cameraActive) {
-                const preview = document.getElementById('cameraPreview');
-                preview.src = '/get_frame?' + new Date().getTime();
-            }
-        }
-
         function toggleCamera() {
             const selectedCamera = document.getElementById('cameraSelect').value;
             if (!selectedCamera && !cameraActive) {
@@ -134,24 +142,22 @@ HTML_TEMPLATE = """
                     const btnText = document.getElementById('cameraButtonText');
                     const btnIcon = btn.querySelector('i');
                     const previewContainer = document.getElementById('previewContainer');
+                    const preview = document.getElementById('cameraPreview');
                     
                     if (cameraActive) {
                         btn.className = 'bg-red-500 text-white px-4 py-2 rounded hover:bg-red-600 transition-colors w-full';
                         btnIcon.className = 'fas fa-stop mr-2';
                         btnText.textContent = 'Ferma Camera';
                         previewContainer.className = 'block';
-                        // Avvia l'aggiornamento della preview
-                        previewInterval = setInterval(updatePreview, 100);
+                        // Avvia lo stream MJPEG della preview
+                        preview.src = '/video_feed?' + new Date().getTime();
                     } else {
                         btn.className = 'bg-purple-500 text-white px-4 py-2 rounded hover:bg-purple-600 transition-colors w-full';
                         btnIcon.className = 'fas fa-play mr-2';
                         btnText.textContent = 'Avvia Camera';
                         previewContainer.className = 'hidden';
-                        // Ferma l'aggiornamento della preview
-                        if (previewInterval) {
-                            clearInterval(previewInterval);
-                            previewInterval = null;
-                        }
+                        // Chiude lo stream della preview
+                        preview.removeAttribute('src');
                     }
                     showMessage(cameraActive ? 'Camera avviata!' : 'Camera fermata!', false);
                 } else {
@@ -163,14 +169,53 @@ HTML_TEMPLATE = """
             });
         }
 
+        // Telemetria live: una riga per tracker, aggiornata dal server
+        function formatValues(values) {
+            return values ? values.map(function(v) { return v.toFixed(3); }).join(', ') : '-';
+        }
+
+        function startTelemetry() {
+            var source = new EventSource('/telemetry');
+            source.onmessage = function(event) {
+                var data = JSON.parse(event.data);
+                var body = document.getElementById('telemetryBody');
+                Object.keys(data.trackers).forEach(function(id) {
+                    var tracker = data.trackers[id];
+                    var row = document.getElementById('telemetry-' + id);
+                    if (!row) {
+                        row = document.createElement('tr');
+                        row.id = 'telemetry-' + id;
+                        row.innerHTML = '<td class="pr-4 font-medium"></td><td class="pr-4"></td><td></td>';
+                        row.cells[0].textContent = id;
+                        body.appendChild(row);
+                    }
+                    row.cells[1].textContent = formatValues(tracker.raw);
+                    row.cells[2].textContent = formatValues(tracker.corrected);
+                });
+            };
+        }
+
         // Inizializzazione quando il documento è caricato
         document.addEventListener('DOMContentLoaded', function() {
             // Carica le webcam
             loadCameras();
+            startTelemetry();
             
-            // Imposta i valori iniziali degli slider
+            // Imposta i valori iniziali degli slider da quelli del bridge
             updateValue('driftThreshold', 'thresholdValue');
             updateValue('filterCoefficient', 'coefficientValue');
+            updateValue('driftWindow', 'windowValue');
+            fetch('/settings')
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                if (data.status !== 'success') return;
+                document.getElementById('driftThreshold').value = data.settings.drift_threshold;
+                document.getElementById('filterCoefficient').value = data.settings.filter_coefficient;
+                document.getElementById('driftWindow').value = data.settings.drift_window;
+                updateValue('driftThreshold', 'thresholdValue');
+                updateValue('filterCoefficient', 'coefficientValue');
+                updateValue('driftWindow', 'windowValue');
+            });
 
             // Aggiungi i listener per gli slider
             document.getElementById('driftThreshold').addEventListener('input', function() {
@@ -179,6 +224,9 @@ HTML_TEMPLATE = """
             document.getElementById('filterCoefficient').addEventListener('input', function() {
                 updateValue('filterCoefficient', 'coefficientValue');
             });
+            document.getElementById('driftWindow').addEventListener('input', function() {
+                updateValue('driftWindow', 'windowValue');
+            });
         });
     </script>
 </head>
@@ -210,6 +258,16 @@ HTML_TEMPLATE = """
                     <p class="text-sm text-gray-500">Valori più alti = correzioni più fluide ma più lente</p>
                 </div>
 
+                <div class="space-y-2">
+                    <label class="block text-sm font-medium text-gray-700">
+                        Drift Window: <span id="windowValue">0</span>
+                    </label>
+                    <input type="range" id="driftWindow" min="0" max="500" step="10" value="0"
+                           class="w-full h-2 bg-blue-200 rounded-lg appearance-none cursor-pointer">
+                    <p class="text-sm text-gray-500">0 = confronta ogni campione con il precedente; altrimenti
+                        il drift è l'andamento sugli ultimi N campioni (ignora i pacchetti rumorosi)</p>
+                </div>
+
                 <div class="flex space-x-4">
                     <button onclick="calibrate()" 
                             class="bg-green-500 text-white px-4 py-2 rounded hover:bg-green-600 transition-colors flex-1">
@@ -223,6 +281,20 @@ HTML_TEMPLATE = """
             </div>
         </div>
 
+        <!-- Telemetria -->
+        <div class="bg-white p-6 rounded-lg shadow-lg">
+            <div class="flex items-center space-x-3 mb-6">
+                <i class="fas fa-chart-line text-green-500 text-3xl"></i>
+                <h1 class="text-2xl font-bold text-gray-800">Tracker</h1>
+            </div>
+            <table class="w-full text-sm text-left font-mono">
+                <thead class="text-gray-500">
+                    <tr><th class="pr-4">Tracker</th><th class="pr-4">Grezzo</th><th>Corretto</th></tr>
+                </thead>
+                <tbody id="telemetryBody"></tbody>
+            </table>
+        </div>
+
         <!-- Camera Tracking -->
         <div class="bg-white p-6 rounded-lg shadow-lg">
             <div class="flex items-center space-x-3 mb-6">
@@ -270,22 +342,58 @@ HTML_TEMPLATE = """
 def index():
     return HTML_TEMPLATE
 
-@app.route('/settings', methods=['POST'])
+@app.route('/settings', methods=['GET', 'POST'])
 def update_settings():
-    data = request.json
-    # Qui implementeremo l'aggiornamento delle impostazioni
-    return jsonify({'status': 'success'})
+    """Legge o aggiorna i parametri del bridge in esecuzione"""
+    if bridge is None:
+        return jsonify({'status': 'error', 'message': 'Bridge non attivo'})
+    try:
+        if request.method == 'POST':
+            data = request.json
+            drift_threshold = data.get('drift_threshold')
+            filter_coefficient = data.get('filter_coefficient')
+            drift_window = data.get('drift_window')
+            bridge.set_parameters(
+                drift_threshold=None if drift_threshold is None else float(drift_threshold),
+                filter_coefficient=None if filter_coefficient is None else float(filter_coefficient),
+                drift_window=None if drift_window is None else int(drift_window)
+            )
+        return jsonify({'status': 'success', 'settings': bridge.config._asdict(),
+                        'calibrated': bridge.is_calibrated})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
 
 @app.route('/calibrate', methods=['POST'])
 def calibrate():
-    # Qui implementeremo la calibrazione
-    return jsonify({'status': 'success'})
+    """Calibra il bridge in esecuzione"""
+    if bridge is None:
+        return jsonify({'status': 'error', 'message': 'Bridge non attivo'})
+    try:
+        # Con più sessioni (--sessions) si può calibrare un solo telefono: {"session": "ip:porta"}
+        session = (request.get_json(silent=True) or {}).get('session')
+        if session:
+            bridge.calibrate(session)
+        else:
+            bridge.calibrate()
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/sessions', methods=['GET'])
+def sessions():
+    """Statistiche per sessione del bridge multi-utente"""
+    if bridge is None or not hasattr(bridge, 'session_stats'):
+        return jsonify({'status': 'error', 'message': 'Bridge multi-sessione non attivo'})
+    return jsonify({'status': 'success', 'sessions': bridge.session_stats()})
 
 @app.route('/get_cameras', methods=['GET'])
 def get_cameras():
-    """Ottiene la lista delle webcam disponibili"""
-    from camera_tracking import get_available_cameras
-    cameras = get_available_cameras()
+    """Ottiene la lista delle webcam disponibili (dalla cache, senza toccare la webcam attiva)"""
+    busy = []
+    if camera_tracker is not None and camera_tracker.capture is not None:
+        busy.append(camera_tracker.capture.source)
+    busy.extend(getattr(camera_tracker, 'camera_ids', ()))
+    cameras = camera_discovery.get_cameras(busy=busy, force=request.args.get('refresh') == '1')
     return jsonify({'cameras': cameras})
 
 @app.route('/start_camera', methods=['POST'])
@@ -294,11 +402,46 @@ def start_camera():
     try:
         data = request.json
         camera_id = data.get('camera_id', 0)
+        # Impostazioni di acquisizione opzionali (risoluzione, FPS, MJPG)
+        capture_settings = {key: data[key] for key in ('width', 'height', 'fps', 'mjpg') if key in data}
         
+        # Più webcam: un processo per webcam e uscita fusa
+        camera_ids = data.get('camera_ids')
+        if camera_tracker is None and camera_ids and len(camera_ids) > 1:
+            camera_tracker = MultiCameraTracker(
+                output_bundles=output_bundles,
+                capture_settings=capture_settings,
+                model_complexity=data.get('model_complexity', 1),
+                input_scale=data.get('input_scale', 1.0),
+                max_skew=data.get('max_skew', 0.1)
+            )
+            if getattr(bridge, 'pose_ring', None) is not None:
+                camera_tracker.connect_pose_ring(bridge.pose_ring)
+            if camera_tracker.start_camera(camera_ids):
+                preview.tracker = camera_tracker
+                return jsonify({'status': 'success'})
+            failed = ', '.join(str(camera_id) for camera_id in camera_tracker.failed_cameras)
+            camera_tracker = None
+            return jsonify({'status': 'error', 'message': f'Impossibile avviare le webcam: {failed}'})
+
         if camera_tracker is None:
-            camera_tracker = CameraTracker()
+            # OpenCV e MediaPipe si caricano solo al primo avvio della webcam
+            from camera_tracking import CameraTracker
+            camera_tracker = CameraTracker(
+                output_bundles=output_bundles,
+                capture_settings=capture_settings,
+                pipelined=data.get('pipelined', False),
+                model_complexity=data.get('model_complexity', 1),
+                input_scale=data.get('input_scale', 1.0),
+                adaptive=data.get('adaptive', False)
+            )
+            # Bridge nello stesso processo: le pose passano dal ring, non da OSC
+            if getattr(bridge, 'pose_ring', None) is not None:
+                camera_tracker.connect_pose_ring(bridge.pose_ring)
             if camera_tracker.start_camera(camera_id):
+                preview.tracker = camera_tracker
                 return jsonify({'status': 'success'})
+            camera_tracker = None
         return jsonify({'status': 'error', 'message': 'Camera già in esecuzione o errore di avvio'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -308,9 +451,10 @@ def get_frame():
     """Ottiene un frame dalla webcam attiva"""
     global camera_tracker
     try:
-        if camera_tracker and camera_tracker.camera:
-            ret, frame = camera_tracker.camera.read()
-            if ret:
+        if camera_tracker and camera_tracker.capture:
+            # Legge l'ultimo frame pubblicato senza toccare il dispositivo
+            _, _, frame = camera_tracker.capture.latest()
+            if frame is not None:
                 # Converti il frame in JPEG
                 import cv2
                 _, buffer = cv2.imencode('.jpg', frame)
@@ -319,18 +463,89 @@ def get_frame():
         pass
     return '', 404
 
+@app.route('/video_feed', methods=['GET'])
+def video_feed():
+    """Stream MJPEG della webcam attiva, codificato una volta per tutti i client"""
+    if camera_tracker is None:
+        return '', 404
+    return Response(preview.frames(), mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+
+@app.route('/preview_settings', methods=['POST'])
+def preview_settings():
+    """Imposta dimensione, qualità, FPS massimi e landmark della preview"""
+    try:
+        data = request.json
+        preview.configure(
+            width=data.get('width'),
+            quality=data.get('quality'),
+            max_fps=data.get('max_fps'),
+            draw_landmarks=data.get('draw_landmarks')
+        )
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/camera_settings', methods=['POST'])
+def camera_settings():
+    """Cambia a runtime modello MediaPipe e riduzione dell'input"""
+    try:
+        if camera_tracker is None:
+            return jsonify({'status': 'error', 'message': 'Camera non attiva'})
+        data = request.json
+        if 'model_complexity' in data:
+            camera_tracker.set_model_complexity(int(data['model_complexity']))
+        if 'input_scale' in data:
+            camera_tracker.set_input_scale(float(data['input_scale']))
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/camera_stats', methods=['GET'])
+def camera_stats():
+    """Latenza acquisizione-invio e frame elaborati/scartati"""
+    if camera_tracker is None:
+        return jsonify({'status': 'error', 'message': 'Camera non attiva'})
+    return jsonify({'status': 'success', 'stats': camera_tracker.get_stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metriche di bridge e webcam in formato testo Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/telemetry', methods=['GET'])
+def telemetry_stream():
+    """Valori grezzi e corretti dei tracker via Server-Sent Events, a frequenza ridotta"""
+    if bridge is None:
+        return '', 404
+    return Response(telemetry.events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/telemetry_settings', methods=['POST'])
+def telemetry_settings():
+    """Imposta la frequenza di invio della telemetria (Hz)"""
+    try:
+        telemetry.configure(rate=request.json.get('rate'))
+        return jsonify({'status': 'success'})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/stop_camera', methods=['POST'])
 def stop_camera():
     global camera_tracker
     try:
         if camera_tracker is not None:
+            preview.tracker = None
             camera_tracker.stop_camera()
             camera_tracker = None
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
-def run_web_interface():
+def run_web_interface(bundles=False, anti_drift_bridge=None):
+    global output_bundles, bridge
+    output_bundles = bundles
+    bridge = anti_drift_bridge
+    telemetry.bridge = anti_drift_bridge
     app.run(host='127.0.0.1', port=9003)
 
 if __name__ == '__main__':